@@ -18,96 +18,357 @@
 
 
 import argparse
+import collections
+import concurrent.futures
+import contextlib
+import cProfile
+import csv
 from dateutil import parser as du_parser
+from dateutil import tz as du_tz
 import datetime
+import io
+import json
 import os
 import re
-import requests
-import time
 import sys
 from typing import Optional
 
 import pictool.utils_opencv as utils_opencv
 import pictool.utils_gexiv as utils_gexiv
+import pictool.utils_exif as utils_exif
+import pictool.utils_geo as utils_geo
+import pictool.utils_geocache as utils_geocache
+import pictool.utils_gazetteer as utils_gazetteer
+import pictool.utils_nominatim as utils_nominatim
+import pictool.utils_walk as utils_walk
+import pictool.utils_watch as utils_watch
+import pictool.utils_catalog as utils_catalog
+import pictool.utils_checkpoint as utils_checkpoint
+import pictool.utils_rename as utils_rename
+import pictool.utils_stats as utils_stats
+import pictool.utils_track as utils_track
+
+
+def _get_nominatim_client(args, email):
+    """get a nominatim client configured by the given args"""
+    client = utils_nominatim.NominatimClient(
+        args.nominatim_url, email, rate=args.nominatim_rate,
+        burst=args.nominatim_burst,
+        max_concurrency=args.nominatim_concurrency,
+        retries=args.nominatim_retries)
+    if client.rate_limited:
+        print('The public nominatim service allows max. {} request(s) per '
+              'second. Limiting the rate'.format(
+                  utils_nominatim.PUBLIC_MAX_RATE))
+    return client
+
+
+def _get_long_lat_from_query(client, query, countrycodes):
+    """get GPS coords from a given query (usually a address)"""
+    return client.search(query, countrycodes)
+
 
+def _get_location_data(client, longitude, latitude, cache=None):
+    """get location data as json for the given long/lat
 
-def _wait():
-    """ wait a second
-    requests to http://nominatim.openstreetmap.org/ should be max. 1 per second
-    see https://operations.osmfoundation.org/policies/nominatim/
+    If a :py:class:`utils_geocache.GeocodeCache` is given, it is consulted
+    before doing a request and updated afterwards.
     """
-    if 'LAST_WAIT_CALL' not in _wait.__dict__:
-        _wait.LAST_WAIT_CALL = None
+    if cache:
+        data = cache.get(longitude, latitude, client.zoom, client.language)
+        if data is not None:
+            return data
+    data = client.reverse(longitude, latitude)
+    if cache:
+        cache.put(longitude, latitude, client.zoom, client.language, data)
+    return data
+
+
+def _get_geocode_cache(args):
+    """get a geocoding cache based on the given args or None"""
+    if args.no_cache or args.geocoder == 'gazetteer':
+        return None
+    return utils_geocache.GeocodeCache(
+        args.cache_file, ttl=args.cache_ttl * 24 * 3600,
+        max_entries=args.cache_max_entries)
 
-    if _wait.LAST_WAIT_CALL:
-        diff = time.time() - _wait.LAST_WAIT_CALL
-        if diff < 1:
-            wait_for = 1 - diff
-            time.sleep(wait_for)
-    _wait.LAST_WAIT_CALL = time.time()
+
+def _get_reverse_geocoder(args, email, cache):
+    """
+    get the reverse geocoder backend configured in args
+    :returns: a callable which takes longitude and latitude and returns the
+              location data (with a nominatim like 'address' dict)
+    """
+    if args.geocoder == 'gazetteer':
+        gazetteer = utils_gazetteer.Gazetteer(
+            args.gazetteer_index, args.gazetteer_max_distance)
+        return gazetteer.reverse
+    client = _get_nominatim_client(args, email)
+    return lambda longitude, latitude: _get_location_data(
+        client, longitude, latitude, cache)
 
 
-def _get_long_lat_from_query(query, email, countrycodes):
-    """get GPS coords from a given query (usually a address)"""
-    payload = {
-        'format': 'json',
-        'polygon_geojson': 1,
-        'q': query
-    }
-    if email:
-        payload['email'] = email
-    if countrycodes:
-        payload['countrycodes'] = ','.join(countrycodes)
-    r = requests.get('http://nominatim.openstreetmap.org/search',
-                     params=payload)
-    if r.status_code != 200:
-        r.raise_for_status()
-    return r.json()
-
-
-def _get_location_data(longitude, latitude, email):
-    """get location data as json for the given long/lat"""
-    payload = {
-        'format': 'jsonv2',
-        'accept-language': 'en-US',
-        'zoom': 10,
-        'lat': latitude,
-        'lon': longitude}
-    if email:
-        payload['email'] = email
-    _wait()
-    r = requests.get('http://nominatim.openstreetmap.org/reverse',
-                     params=payload)
-    if r.status_code != 200:
-        r.raise_for_status()
-    return r.json()
-
-
-def _loop_path(path):
-    """loop over the given path argument"""
-    for p in path:
-        if os.path.isfile(p):
-            yield os.path.abspath(p)
-        elif os.path.isdir(p):
-            for root, dirs, files in os.walk(p):
-                for file_path in files:
-                    yield os.path.join(root, file_path)
-        else:
-            raise Exception('"%s" is not a file or a dir' % (p))
+def _loop_path(path, **kwargs):
+    """loop over the given path argument
+    See :py:func:`utils_walk.walk` for the supported keyword arguments"""
+    return utils_walk.walk(path, **kwargs)
 
 
-def gps_set(args):
-    for path in _loop_path(args.path):
-        metadata = utils_gexiv.get_metadata(path)
-        if metadata:
-            # do not override if there is already GPS data
-            if not _do_gps_get(metadata) or args.force:
-                metadata.set_gps_info(
-                    args.longitude, args.latitude, args.altitude)
-                metadata.save_file(path)
+def _loop_args(args):
+    """loop over the path argument with the file discovery options given
+    in args"""
+    return _loop_path(args.path, extensions=_discovery_extensions(args),
+                      include=getattr(args, 'include', None),
+                      exclude=getattr(args, 'exclude', None),
+                      max_depth=getattr(args, 'max_depth', None),
+                      inode_order=getattr(args, 'inode_order', False),
+                      check_magic=getattr(args, 'check_magic', False))
+
+
+def _process_file(func, args, path):
+    """
+    call func(args, path) and capture its output. This is used to run func
+    in a worker process
+    :returns: tuple of (output, result, error)
+    """
+    output = io.StringIO()
+    result = error = None
+    with contextlib.redirect_stdout(output):
+        try:
+            result = func(args, path)
+        except Exception as e:
+            error = '{}: {}'.format(type(e).__name__, e)
+    return output.getvalue(), result, error
+
+
+def _map_paths(func, args, errors, paths=None):
+    """
+    call func(args, path) for every path from the path argument (or the
+    given paths).
+
+    If args.jobs is > 1, the calls are distributed over a pool of worker
+    processes. The results (and the output of func) are still handled in
+    the order of the paths.
+    :param func: a (module level) function which handles a single file
+    :param args: the command line arguments
+    :param errors: a list where (path, error) tuples for failed calls
+                   are added to
+    :param paths: optional iterable of paths. Defaults to the paths from
+                  :py:func:`_loop_args`
+    :returns: generator of (path, result) tuples for successful calls
+    """
+    if paths is None:
+        paths = _loop_args(args)
+    jobs = getattr(args, 'jobs', 1)
+    if jobs == 0:
+        jobs = os.cpu_count()
+    if jobs <= 1:
+        for path in paths:
+            try:
+                result = func(args, path)
+            except Exception as e:
+                error = '{}: {}'.format(type(e).__name__, e)
+                print('{}: {}'.format(path, error))
+                errors.append((path, error))
             else:
-                print('{}: GPS data already available. '
-                      'Not writing'.format(path))
+                yield path, result
+        return
+
+    def _handle(path, future):
+        output, result, error = future.result()
+        sys.stdout.write(output)
+        if error:
+            print('{}: {}'.format(path, error))
+            errors.append((path, error))
+            return False, None
+        return True, result
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        # limit the number of queued files so the paths are consumed while
+        # the workers are busy
+        pending = collections.deque()
+        for path in paths:
+            pending.append((path, executor.submit(
+                _process_file, func, args, path)))
+            if len(pending) >= jobs * 4:
+                path_done, future = pending.popleft()
+                ok, result = _handle(path_done, future)
+                if ok:
+                    yield path_done, result
+        while pending:
+            path_done, future = pending.popleft()
+            ok, result = _handle(path_done, future)
+            if ok:
+                yield path_done, result
+
+
+def _report_errors(errors):
+    """print a summary of the errors collected with :py:func:`_map_paths`
+    :returns: the exit code"""
+    if not errors:
+        return 0
+    print('{} file(s) failed:'.format(len(errors)))
+    for path, error in errors:
+        print('  {}: {}'.format(path, error))
+    return 1
+
+
+def _get_catalog(args):
+    """get the catalog if the command should use it, otherwise None"""
+    if getattr(args, 'from_catalog', False):
+        return utils_catalog.Catalog(args.catalog)
+    return None
+
+
+def _catalog_records(args, catalog, has_gps=None):
+    """
+    get the catalog records for the path argument
+    :returns: generator of (path, record) tuples. The record is None if
+              the file changed since the last catalog update
+    """
+    for record in catalog.select(args.path, has_gps):
+        if catalog.is_current(record):
+            yield record['path'], record
+        elif os.path.exists(record['path']):
+            yield record['path'], None
+
+
+def _catalog_extract_file(args, path):
+    return utils_catalog.extract(path)
+
+
+def catalog_update(args):
+    """create or incrementally refresh the metadata catalog"""
+    errors = []
+    counts = {'updated': 0, 'unchanged': 0}
+    with utils_catalog.Catalog(args.catalog) as catalog:
+        catalog.begin_scan()
+
+        def _changed_paths():
+            for path in _loop_args(args):
+                path = os.path.abspath(path)
+                if catalog.is_current(catalog.get(path)):
+                    catalog.seen(path)
+                    counts['unchanged'] += 1
+                else:
+                    yield path
+
+        for path, record in _map_paths(_catalog_extract_file, args, errors,
+                                       paths=_changed_paths()):
+            catalog.update(record)
+            counts['updated'] += 1
+        # records of files which the filters skipped are kept
+        extensions = _discovery_extensions(args)
+        removed = catalog.end_scan(
+            args.path, lambda path, root: utils_walk.walk_matches(
+                path, root, extensions, getattr(args, 'include', None),
+                getattr(args, 'exclude', None),
+                getattr(args, 'max_depth', None),
+                getattr(args, 'check_magic', False)))
+    print('Catalog "{}": {} updated, {} unchanged, {} removed'.format(
+        args.catalog, counts['updated'], counts['unchanged'], removed))
+    return _report_errors(errors)
+
+
+def _gps_set_metadata(args, path, metadata):
+    """
+    set the GPS data from args
+
+    Note: The metadata object needs to be saved after calling this function!
+    :returns: True if the GPS data was set
+    """
+    # do not override if there is already GPS data
+    if not _do_gps_get(metadata) or args.force:
+        metadata.set_gps_info(
+            args.longitude, args.latitude, args.altitude)
+        return True
+    print('{}: GPS data already available. '
+          'Not writing'.format(path))
+    return False
+
+
+def _gps_set_file(args, path):
+    metadata = utils_gexiv.get_metadata(path)
+    if metadata:
+        if _gps_set_metadata(args, path, metadata):
+            metadata.save_file(path)
+
+
+def gps_set(args):
+    errors = []
+    for _ in _map_paths(_gps_set_file, args, errors):
+        pass
+    return _report_errors(errors)
+
+
+def _parse_timezone(value):
+    """get a tzinfo for an IANA timezone name (eg. Europe/Berlin) or an UTC
+    offset (eg. +02:00)"""
+    m = re.match(r'^([+-])(\d{1,2}):?(\d{2})$', value)
+    if m:
+        offset = datetime.timedelta(hours=int(m.group(2)),
+                                    minutes=int(m.group(3)))
+        return datetime.timezone(-offset if m.group(1) == '-' else offset)
+    timezone = du_tz.gettz(value)
+    if timezone is None:
+        raise Exception('Unknown timezone "{}"'.format(value))
+    return timezone
+
+
+def _camera_timestamp(dt, timezone=None, clock_offset=0):
+    """
+    get the (corrected) seconds since the epoch for a camera date/time
+    :param dt: the date/time from the camera. Without tzinfo it is in
+               timezone
+    :param timezone: the timezone of the camera clock. Defaults to the local
+                     timezone
+    :param clock_offset: the time [s] the camera clock is ahead
+    """
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone) if timezone else dt.astimezone()
+    return dt.timestamp() - clock_offset
+
+
+def _gps_set_from_track_file(args, path, track, timezone):
+    """
+    set the GPS data of a single file from the track
+    :returns: True if the GPS data was written
+    """
+    metadata = utils_gexiv.get_metadata(path)
+    if not metadata:
+        return False
+    if _do_gps_get(metadata) and not args.force:
+        print('{}: GPS data already available. Not writing'.format(path))
+        return False
+    dt = _metadata_date_time(metadata)
+    if not dt:
+        print('{}: No date/time available. Not writing'.format(path))
+        return False
+    position = track.position(
+        _camera_timestamp(dt, timezone, args.clock_offset), args.max_gap)
+    if not position:
+        print('{}: No track point within {}s of {}. Not writing'.format(
+            path, args.max_gap, dt))
+        return False
+    metadata.set_gps_info(*position)
+    metadata.save_file(path)
+    print('{}: {} °N {} °W {} m'.format(path, *position))
+    return True
+
+
+def gps_set_from_track(args):
+    """set the GPS data from GPS tracks by the date/time of the pictures"""
+    timezone = _parse_timezone(args.timezone) if args.timezone else None
+    track = utils_track.Track.from_files(args.track)
+    print(track)
+    errors = []
+    results = [written for _, written in _map_paths(
+        lambda args, path: _gps_set_from_track_file(args, path, track,
+                                                    timezone),
+        args, errors)]
+    print('Wrote GPS data to {} of {} file(s)'.format(
+        sum(results), len(results) + len(errors)))
+    return _report_errors(errors)
 
 
 def _do_gps_get(metadata):
@@ -119,29 +380,93 @@ def _do_gps_get(metadata):
         return lon, lat, alt
 
 
+def _get_read_metadata(args, path):
+    """
+    get a metadata object for reading the date/time and GPS data
+    The backend is selected with args.metadata_backend:
+    'exif' uses the builtin EXIF reader, 'gexiv2' uses GExiv2 and 'auto'
+    uses the builtin reader and falls back to GExiv2 for unsupported files
+    :returns: metadata object or None
+    """
+    backend = getattr(args, 'metadata_backend', 'auto')
+    if backend in ('auto', 'exif'):
+        metadata = utils_exif.get_metadata(path)
+        if metadata or backend == 'exif':
+            if not metadata:
+                print('{}: can not read EXIF data'.format(path))
+            return metadata
+    return utils_gexiv.get_metadata(path)
+
+
+def _gps_get_file(args, path):
+    """
+    :returns: tuple of (metadata available, GPS data)
+    """
+    metadata = _get_read_metadata(args, path)
+    if metadata:
+        return True, _do_gps_get(metadata)
+    return False, None
+
+
+def _gps_get_from_catalog(args, catalog):
+    """like :py:func:`_gps_get_file` but use the catalog for unchanged
+    files"""
+    for path, record in _catalog_records(args, catalog):
+        if record:
+            yield path, (bool(record['readable']),
+                         utils_catalog.record_gps(record))
+        else:
+            yield path, _gps_get_file(args, path)
+
+
 def gps_get(args=None):
     """print GPS information"""
-    for path in _loop_path(args.path):
-        metadata = utils_gexiv.get_metadata(path)
-        if metadata:
-            gps_data = _do_gps_get(metadata)
-            if gps_data:
-                if args.include_address:
-                    location_data = _get_location_data(gps_data[0],
-                                                       gps_data[1],
-                                                       None)
-                    address = location_data.get('address', "")
-                else:
-                    address = ""
-
+    # the setup might print messages (eg. about the nominatim rate limit),
+    # so it is done in the output context
+    with _output_for_format(args) as out:
+        cache = None
+        if args.include_address:
+            cache = _get_geocode_cache(args)
+            reverse_geocode = _get_reverse_geocoder(args, None, cache)
+        errors = []
+        catalog = _get_catalog(args)
+        if catalog:
+            results = _gps_get_from_catalog(args, catalog)
+        else:
+            results = _map_paths(_gps_get_file, args, errors)
+        # the (rate limited) geocoding is done here and not in the workers
+        for path, (has_metadata, gps_data) in results:
+            if not has_metadata:
+                continue
+            address = ""
+            if gps_data and args.include_address:
+                location_data = reverse_geocode(gps_data[0], gps_data[1])
+                address = location_data.get('address', "")
+            if getattr(args, 'format', 'text') == 'jsonl':
+                record = {'path': path, 'gps': None}
+                if gps_data:
+                    record['gps'] = {'longitude': gps_data[0],
+                                     'latitude': gps_data[1],
+                                     'altitude': gps_data[2]}
+                    if args.include_address:
+                        record['address'] = address or None
+                _write_jsonl(out, record)
+            elif gps_data:
                 print('{}: {} °N {} °W {} m {}'.format(
                     path, gps_data[0], gps_data[1], gps_data[2], address))
             else:
                 print('{}: No GPS info'.format(path))
+        if cache:
+            print(cache)
+            cache.close()
+        if catalog:
+            catalog.close()
+        return _report_errors(errors)
 
 
 def gps_get_from_query(args):
-    res = _get_long_lat_from_query(args.query, args.email, None)
+    client = _get_nominatim_client(args, args.email)
+    res = _get_long_lat_from_query(client, args.query, None)
     if res:
         if 'lon' in res[0] and 'lat' in res[0]:
             link = 'https://www.openstreetmap.org/?mlat={coords[lat]}&mlon=' \
@@ -150,58 +475,240 @@ def gps_get_from_query(args):
             print('{} °N {} °W {}'.format(res[0]['lon'], res[0]['lat'], link))
 
 
-def location_set(args):
-    """set the location information based on the GPS data"""
-    for path in _loop_path(args.path):
-        metadata = utils_gexiv.get_metadata(path)
-        if not metadata:
+def _location_set_tags(metadata, address):
+    """
+    set the location tags from the given (nominatim) address
+
+    Note: The metadata object needs to be saved after calling this function!
+    :returns: True if tags were set
+    """
+    dirty = False
+    if 'country_code' in address:
+        metadata.set_tag_string('Iptc.Application2.CountryCode',
+                                address['country_code'])
+        metadata.set_tag_string('Xmp.iptcExt.CountryCode',
+                                address['country_code'])
+
+        dirty = True
+    if 'country' in address:
+        metadata.set_tag_string('Iptc.Application2.CountryName',
+                                address['country'])
+        metadata.set_tag_string('Xmp.iptcExt.CountryName',
+                                address['country'])
+        dirty = True
+    if 'state' in address:
+        metadata.set_tag_string('Iptc.Application2.ProvinceState',
+                                address['state'])
+        metadata.set_tag_string('Xmp.iptcExt.ProvinceState',
+                                address['state'])
+        dirty = True
+    if 'city' in address:
+        metadata.set_tag_string('Iptc.Application2.City',
+                                address['city'])
+        metadata.set_tag_string('Xmp.iptcExt.City',
+                                address['city'])
+        dirty = True
+    if 'city_district' in address:
+        metadata.set_tag_string('Iptc.Application2.SubLocation',
+                                address['city_district'])
+        metadata.set_tag_string('Xmp.iptcExt.SubLocation',
+                                address['city_district'])
+        dirty = True
+    return dirty
+
+
+def _location_set_candidates(args, catalog, checkpoint=None):
+    """
+    get the files for location_set
+    :param checkpoint: optional :py:class:`utils_checkpoint.Checkpoint`. The
+                       finished files are skipped
+    :returns: generator of (path, GPS data) tuples. The GPS data is None if
+              it is not known without opening the file
+    """
+    if catalog:
+        candidates = ((path, utils_catalog.record_gps(record) if record
+                       else None) for path, record in
+                      _catalog_records(args, catalog, has_gps=True))
+    else:
+        candidates = ((path, None) for path in _loop_args(args))
+    for path, gps_data in candidates:
+        if checkpoint and checkpoint.is_done(path):
             continue
-        gps_data = _do_gps_get(metadata)
+        yield path, gps_data
+
+
+def _get_checkpoint(args):
+    """get the checkpoint if the command should use one, otherwise None"""
+    if getattr(args, 'checkpoint', None):
+        checkpoint = utils_checkpoint.Checkpoint(args.checkpoint)
+        print(checkpoint)
+        return checkpoint
+    return None
+
+
+def _checkpoint_done(checkpoint, path):
+    if checkpoint:
+        checkpoint.mark_done(path)
+
+
+def _location_set_save(path, metadata, address, catalog):
+    """write the location tags for address to the given file"""
+    if _location_set_tags(metadata, address):
+        metadata.save_file(path)
+        print('"{}" Updated location tags'.format(path))
+        if catalog:
+            catalog.update_columns(path,
+                                   **utils_catalog.address_columns(address))
+
+
+def _location_set_batch(args, reverse_geocode, catalog, checkpoint=None):
+    """
+    set the location information with one lookup per geohash cell
+
+    All files are read first and grouped by the geohash of their GPS data.
+    Then one lookup (for the center of the GPS positions in the cell) is done
+    per cell and the address is written to all files in that cell.
+    """
+    skip_tagged = getattr(args, 'skip_tagged', False)
+    cells = {}
+    for path, gps_data in _location_set_candidates(args, catalog,
+                                                   checkpoint):
+        # the tags are only known after opening the file
+        if not gps_data or skip_tagged:
+            read = _location_set_read(path, skip_tagged)
+            gps_data = read[1] if read else None
         if not gps_data:
+            _checkpoint_done(checkpoint, path)
             continue
-        location_data = _get_location_data(gps_data[0],
-                                           gps_data[1],
-                                           args.email)
+        cell = utils_geo.geohash_encode(gps_data[1], gps_data[0],
+                                        args.batch_precision)
+        cells.setdefault(cell, []).append((path, gps_data))
+
+    print('{} file(s) in {} geohash cell(s)'.format(
+        sum(len(c) for c in cells.values()), len(cells)))
+
+    def _cell_location_data(files):
+        longitude = sum(f[1][0] for f in files) / len(files)
+        latitude = sum(f[1][1] for f in files) / len(files)
+        return reverse_geocode(longitude, latitude)
+
+    cells = sorted(cells.items())
+    # lookups for different cells can be done concurrently (eg. against
+    # a self-hosted nominatim). The results are returned in order
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=args.nominatim_concurrency) as executor:
+        cells_location_data = executor.map(_cell_location_data,
+                                           (files for _, files in cells))
+    for (cell, files), location_data in zip(cells, cells_location_data):
         address = location_data.get('address', {})
-        dirty = False
-        if 'country_code' in address:
-            metadata.set_tag_string('Iptc.Application2.CountryCode',
-                                    address['country_code'])
-            metadata.set_tag_string('Xmp.iptcExt.CountryCode',
-                                    address['country_code'])
-
-            dirty = True
-        if 'country' in address:
-            metadata.set_tag_string('Iptc.Application2.CountryName',
-                                    address['country'])
-            metadata.set_tag_string('Xmp.iptcExt.CountryName',
-                                    address['country'])
-            dirty = True
-        if 'state' in address:
-            metadata.set_tag_string('Iptc.Application2.ProvinceState',
-                                    address['state'])
-            metadata.set_tag_string('Xmp.iptcExt.ProvinceState',
-                                    address['state'])
-            dirty = True
-        if 'city' in address:
-            metadata.set_tag_string('Iptc.Application2.City',
-                                    address['city'])
-            metadata.set_tag_string('Xmp.iptcExt.City',
-                                    address['city'])
-            dirty = True
-        if 'city_district' in address:
-            metadata.set_tag_string('Iptc.Application2.SubLocation',
-                                    address['city_district'])
-            metadata.set_tag_string('Xmp.iptcExt.SubLocation',
-                                    address['city_district'])
-            dirty = True
-        if dirty:
-            metadata.save_file(path)
-            print('"{}" Updated location tags'.format(path))
+        for path, _ in files:
+            metadata = utils_gexiv.get_metadata(path)
+            if not metadata:
+                continue
+            _location_set_save(path, metadata, address, catalog)
+            _checkpoint_done(checkpoint, path)
 
 
-def face_normalize(args):
-    """normalize faces from images"""
+LOCATION_SET_SKIP_TAGS = ('Iptc.Application2.CountryCode',
+                          'Iptc.Application2.City')
+
+
+def _location_set_read(path, skip_tagged=False):
+    """
+    read the metadata and the GPS data of a file for location_set
+    :param skip_tagged: skip files which already have the location tags
+                        (see LOCATION_SET_SKIP_TAGS)
+    :returns: tuple of (metadata, GPS data) or None if the file has no GPS
+              data or is skipped
+    """
+    metadata = utils_gexiv.get_metadata(path)
+    if not metadata:
+        return None
+    if skip_tagged and all(metadata.has_tag(tag)
+                           for tag in LOCATION_SET_SKIP_TAGS):
+        print('"{}" Skipped, already has location tags'.format(path))
+        return None
+    gps_data = _do_gps_get(metadata)
+    if not gps_data:
+        return None
+    return metadata, gps_data
+
+
+def _location_set_file(args, path, reverse_geocode, catalog):
+    """set the location information for a single file"""
+    read = _location_set_read(path, getattr(args, 'skip_tagged', False))
+    if not read:
+        return
+    metadata, gps_data = read
+    location_data = reverse_geocode(gps_data[0], gps_data[1])
+    address = location_data.get('address', {})
+    _location_set_save(path, metadata, address, catalog)
+
+
+def _location_set_pipeline(args, reverse_geocode, catalog, checkpoint=None):
+    """
+    set the location information with the lookups running in the
+    background
+
+    The files are read and the lookups are queued (rate limited by the
+    geocoder) while earlier lookups are still running. The results are
+    written in the order of the files as soon as they are available, so
+    reading and writing the files overlaps with waiting for the geocoder.
+    At most args.pipeline_depth files are in flight.
+    """
+    def _write(pending):
+        path, metadata, future = pending.popleft()
+        address = future.result().get('address', {})
+        _location_set_save(path, metadata, address, catalog)
+        _checkpoint_done(checkpoint, path)
+
+    skip_tagged = getattr(args, 'skip_tagged', False)
+    pending = collections.deque()
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=args.nominatim_concurrency) as executor:
+        for path, _ in _location_set_candidates(args, catalog, checkpoint):
+            read = _location_set_read(path, skip_tagged)
+            if not read:
+                _checkpoint_done(checkpoint, path)
+                continue
+            metadata, gps_data = read
+            pending.append((path, metadata, executor.submit(
+                reverse_geocode, gps_data[0], gps_data[1])))
+            if len(pending) >= args.pipeline_depth:
+                _write(pending)
+        while pending:
+            _write(pending)
+
+
+def location_set(args):
+    """set the location information based on the GPS data"""
+    cache = _get_geocode_cache(args)
+    reverse_geocode = _get_reverse_geocoder(args, args.email, cache)
+    catalog = _get_catalog(args)
+    checkpoint = _get_checkpoint(args)
+    try:
+        if args.batch:
+            _location_set_batch(args, reverse_geocode, catalog, checkpoint)
+        elif getattr(args, 'pipeline_depth', 0) > 0:
+            _location_set_pipeline(args, reverse_geocode, catalog,
+                                   checkpoint)
+        else:
+            for path, _ in _location_set_candidates(args, catalog,
+                                                    checkpoint):
+                _location_set_file(args, path, reverse_geocode, catalog)
+                _checkpoint_done(checkpoint, path)
+    finally:
+        if checkpoint:
+            checkpoint.close()
+    if cache:
+        print(cache)
+        cache.close()
+    if catalog:
+        catalog.close()
+
+
+def _check_cascades(args):
+    """check that the configured openCV cascades exist"""
     face_cascade_path = os.path.join(args.opencv_data_dir,
                                      args.opencv_face_cascade)
     eye_cascade_path = os.path.join(args.opencv_data_dir,
@@ -213,14 +720,117 @@ def face_normalize(args):
         raise Exception(
             "OpenCV eye cascade '%s' does not exist" % (eye_cascade_path))
 
-    # loop over all given images
-    for path in _loop_path(args.path):
-        image_dest_dir = args.dest_dir or os.path.dirname(path)
-        if not os.path.exists(image_dest_dir):
-            os.makedirs(image_dest_dir)
 
-        utils_opencv.normalize_face(path, image_dest_dir,
-                                    face_cascade_path, eye_cascade_path)
+def face_normalize(args):
+    """normalize faces from images"""
+    _check_cascades(args)
+
+    # loop over all given images
+    errors = []
+    checkpoint = _get_checkpoint(args)
+    paths = _loop_args(args)
+    if checkpoint:
+        paths = checkpoint.filter(paths)
+    try:
+        for path, _ in _map_paths(_face_normalize_file, args, errors,
+                                  paths):
+            # failed files are not recorded, so they are retried
+            _checkpoint_done(checkpoint, path)
+    finally:
+        if checkpoint:
+            checkpoint.close()
+    return _report_errors(errors)
+
+
+def face_benchmark(args):
+    """measure the speed and the accuracy of the face detection with the
+    WIDER FACE dataset"""
+    # import here. the benchmark is not needed for the other commands
+    from pictool.datasets import wider
+    from pictool.datasets import wider_benchmark
+
+    _check_cascades(args)
+    annotations = wider.WIDERAnnotations(args.wider_annotations,
+                                         cache=args.wider_cache)
+    results = wider_benchmark.benchmark(
+        annotations, args.wider_images, _get_face_detector(args),
+        args.detection_size, args.iou_threshold, args.limit)
+    print(wider_benchmark.format_results(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+def benchmark(args):
+    """benchmark the commands with a synthetic photo corpus"""
+    # import here. the benchmark is not needed for the other commands
+    from pictool.benchmarks import suite
+
+    commands = suite.COMMANDS
+    if args.commands:
+        commands = [c.strip() for c in args.commands.split(',')
+                    if c.strip()]
+    if 'face-normalize' in commands:
+        _check_cascades(args)
+    # face-normalize runs in a child process with the same face detection
+    face_args = ['--opencv-data-dir', args.opencv_data_dir,
+                 '--opencv-face-cascade', args.opencv_face_cascade,
+                 '--opencv-eye-cascade', args.opencv_eye_cascade,
+                 '--scale-factor', str(args.scale_factor),
+                 '--min-neighbors', str(args.min_neighbors),
+                 '--detection-size', str(args.detection_size)]
+    if args.min_face_size:
+        face_args += ['--min-face-size', str(args.min_face_size)]
+    if args.max_face_size:
+        face_args += ['--max-face-size', str(args.max_face_size)]
+    results = suite.run(commands, args.work_dir, args.count, args.width,
+                        args.height, args.face_ratio, args.seed, face_args,
+                        args.geocoder_delay)
+    print(suite.format_results(results))
+    if args.output:
+        suite.write_results(results, args.output)
+
+
+def _get_face_detector(args):
+    """get the (per process) face detector configured by args"""
+    return utils_opencv.get_face_detector(
+        os.path.join(args.opencv_data_dir, args.opencv_face_cascade),
+        os.path.join(args.opencv_data_dir, args.opencv_eye_cascade),
+        scale_factor=args.scale_factor, min_neighbors=args.min_neighbors,
+        min_size=args.min_face_size, max_size=args.max_face_size)
+
+
+def _face_normalize_file(args, path, metadata=None):
+    image_dest_dir = args.dest_dir or os.path.dirname(path)
+    os.makedirs(image_dest_dir, exist_ok=True)
+    preview_data = None
+    orientation = 1
+    if getattr(args, 'use_preview', False):
+        metadata = metadata or utils_gexiv.get_metadata(path)
+        if metadata:
+            preview_data = utils_gexiv.get_preview_data(
+                metadata, args.preview_min_size)
+            orientation = utils_gexiv.get_orientation(metadata)
+    utils_opencv.normalize_face(path, image_dest_dir,
+                                _get_face_detector(args),
+                                args.detection_size, preview_data,
+                                orientation)
+
+
+REGION_LIST_TAG = 'Xmp.mwg-rs.Regions/mwg-rs:RegionList'
+# the keys of region records (see image-region-import/-export) and the
+# corresponding tags below a region list entry
+REGION_RECORD_TAGS = {
+    'unit': 'mwg-rs:Area/stArea:unit',
+    'w': 'mwg-rs:Area/stArea:w',
+    'h': 'mwg-rs:Area/stArea:h',
+    'x': 'mwg-rs:Area/stArea:x',
+    'y': 'mwg-rs:Area/stArea:y',
+    'name': 'mwg-rs:Name',
+    'desc': 'mwg-rs:Description',
+    'type': 'mwg-rs:Type',
+}
+_REGION_TAG_RE = re.compile(re.escape(REGION_LIST_TAG) + r'\[(\d+)\]/(.+)$')
 
 
 def _set_xmp_region(metadata, region_number,
@@ -284,7 +894,7 @@ def image_region_add(args):
     metadata = utils_gexiv.get_metadata(args.path)
     if not metadata:
         return
-    if not metadata.has_tag('Xmp.mwg-rs.Regions/mwg-rs:RegionList'):
+    if not metadata.has_tag(REGION_LIST_TAG):
         _image_region_sync_dimensions(metadata)
     _set_xmp_region(metadata, args.region, 'pixel',
                     str(args.width), str(args.height),
@@ -315,6 +925,132 @@ def image_region_remove(args):
             print('Not saved!')
 
 
+def _region_tags(metadata):
+    """
+    get the region tags from the metadata
+    :returns: dict of region number -> dict of tag -> tag name
+    """
+    regions = {}
+    for tag in metadata.get_xmp_tags():
+        m = _REGION_TAG_RE.match(tag)
+        if m:
+            regions.setdefault(int(m.group(1)), {})[m.group(2)] = tag
+    return regions
+
+
+def _read_region_records(f, format_):
+    """
+    read region records from a JSONL or CSV (with header) file object
+    :returns: generator of dicts with (at least) path, x, y, w and h
+    """
+    if format_ == 'csv':
+        records = csv.DictReader(f)
+    else:
+        records = (json.loads(line) for line in f if line.strip())
+    for line_number, record in enumerate(records, 1):
+        missing = [k for k in ('path', 'x', 'y', 'w', 'h')
+                   if record.get(k) in (None, '')]
+        if missing:
+            raise Exception('Region record {} misses {}'.format(
+                line_number, ', '.join(missing)))
+        yield record
+
+
+def _image_region_import_file(args, path, records):
+    """add all regions for a single file and save it once"""
+    metadata = utils_gexiv.get_metadata(path)
+    if not metadata:
+        return
+    if args.replace:
+        for tags in _region_tags(metadata).values():
+            for tag in tags.values():
+                metadata.clear_tag(tag)
+    regions = _region_tags(metadata)
+    if not metadata.has_tag(REGION_LIST_TAG):
+        _image_region_sync_dimensions(metadata)
+    next_region = max(regions, default=0) + 1
+    for record in records:
+        region = record.get('region')
+        if region in (None, ''):
+            region, next_region = next_region, next_region + 1
+        else:
+            region = int(region)
+            next_region = max(next_region, region + 1)
+        _set_xmp_region(metadata, region, record.get('unit') or 'pixel',
+                        str(record['w']), str(record['h']),
+                        str(record['x']), str(record['y']),
+                        record.get('name'), record.get('desc'),
+                        record.get('type'))
+    if not metadata.save_file(path):
+        raise Exception('Not saved!')
+    print('{}: {} region(s) imported'.format(path, len(records)))
+
+
+def image_region_import(args):
+    """
+    Add the Xmp.mwg-rs.Regions from a JSONL or CSV file. The regions are
+    grouped by file so every file is saved only once
+    """
+    format_ = args.format
+    if format_ == 'auto':
+        format_ = 'csv' if args.input.lower().endswith('.csv') else 'jsonl'
+    # group the records by file (in the order of the first occurrence)
+    records = {}
+    if args.input == '-':
+        f = contextlib.nullcontext(sys.stdin)
+    else:
+        f = open(args.input, 'r', newline='', encoding='utf-8')
+    with f as f:
+        for record in _read_region_records(f, format_):
+            path = os.path.abspath(record['path'])
+            records.setdefault(path, []).append(record)
+
+    errors = []
+    for _ in _map_paths(
+            lambda args, path: _image_region_import_file(
+                args, path, records[path]),
+            args, errors, paths=records):
+        pass
+    return _report_errors(errors)
+
+
+def _image_region_export_file(args, path):
+    """:returns: list of region records for a single file"""
+    metadata = utils_gexiv.get_metadata(path)
+    if not metadata:
+        return []
+    records = []
+    for region, tags in sorted(_region_tags(metadata).items()):
+        record = {'path': path, 'region': region}
+        for key, tag in REGION_RECORD_TAGS.items():
+            if tag in tags:
+                value = metadata.get_tag_string(tags[tag])
+                if key in ('x', 'y', 'w', 'h'):
+                    value = float(value)
+                    if value.is_integer():
+                        value = int(value)
+                record[key] = value
+        records.append(record)
+    return records
+
+
+def image_region_export(args):
+    """
+    Write the Xmp.mwg-rs.Regions of the given image(s) as JSONL
+    """
+    if args.output == '-':
+        f = contextlib.nullcontext(sys.stdout)
+    else:
+        f = open(args.output, 'w', encoding='utf-8')
+    errors = []
+    with f as f:
+        for _, records in _map_paths(_image_region_export_file, args,
+                                     errors):
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+    return _report_errors(errors)
+
+
 def _datetime_from_str(string) -> Optional[datetime.datetime]:
     # try to get a string that looks like a date
     m = re.search(r'\d{4}.?\d{2}.?\d{2}.?\d{2}.?\d{2}.?\d{2}', string)
@@ -327,75 +1063,641 @@ def _datetime_from_str(string) -> Optional[datetime.datetime]:
     return None
 
 
+def _metadata_date_time(metadata):
+    """get the date/time from the metadata or None"""
+    try:
+        return metadata.get_date_time()
+    except KeyError:
+        # there might be no 'Exif.Photo.DateTimeOriginal' tag
+        # which raises a KeyError
+        return None
+
+
+def _image_rename_get_date_time(args, path):
+    """get the date/time for the given image from the metadata or
+    the filename"""
+    dt = None
+    # get datetime from metadata
+    metadata = _get_read_metadata(args, path)
+    if metadata:
+        dt = _metadata_date_time(metadata)
+    if not dt:
+        dt = _datetime_from_str(os.path.basename(path))
+    return dt
+
+
+def _image_rename_from_catalog(args, catalog):
+    """like :py:func:`_image_rename_get_date_time` but use the catalog for
+    unchanged files"""
+    for path, record in _catalog_records(args, catalog):
+        if record:
+            dt = utils_catalog.record_date_time(record)
+            yield path, dt or _datetime_from_str(os.path.basename(path))
+        else:
+            yield path, _image_rename_get_date_time(args, path)
+
+
+def _image_rename_plan_target(args, path, dt):
+    """
+    get the new name for the given image and date/time
+    :returns: a (path, stem, extension) target for
+              :py:func:`utils_rename.plan`
+    """
+    dt_str = dt.strftime(args.output_format_date)
+    return (path, f'{args.output_format_prefix}{dt_str}',
+            os.path.basename(path).split('.')[-1])
+
+
+def _image_rename_apply(args, targets, catalog=None):
+    """
+    plan and do the renames for the given targets. All new names are planned
+    at once (see :py:func:`utils_rename.plan`), so they don't collide
+    :param targets: list of targets from :py:func:`_image_rename_plan_target`
+    :returns: list of (path, new path) tuples
+    """
+    moves = utils_rename.plan(targets)
+    for path, path_new in moves:
+        print(f'Rename {path} -> {path_new}')
+    if not getattr(args, 'dry_run', False):
+        utils_rename.apply(
+            utils_rename.order(moves), getattr(args, 'journal', None),
+            catalog.rename if catalog else None)
+    return moves
+
+
+def _image_rename_undo(args):
+    """undo the renames from the journal"""
+    catalog = _get_catalog(args)
+
+    def _on_step(path, path_new):
+        print(f'Rename {path} -> {path_new}')
+        if catalog:
+            catalog.rename(path, path_new)
+
+    undone = utils_rename.undo(args.journal, _on_step)
+    print(f'{undone} rename(s) undone')
+    if catalog:
+        catalog.close()
+
+
 def image_rename(args):
-    for path in _loop_path(args.path):
-        dt = None
-        filename = os.path.basename(path)
-        dirname = os.path.dirname(path)
-        filename_ext = filename.split('.')[-1]
-        # get datetime from metadata
-        metadata = utils_gexiv.get_metadata(path)
-        if metadata:
-            try:
-                dt = metadata.get_date_time()
-            except KeyError:
-                # there might be no 'Exif.Photo.DateTimeOriginal' tag
-                # which raises a KeyError
-                pass
-        if not dt:
-            dt = _datetime_from_str(filename)
+    if getattr(args, 'undo', False):
+        return _image_rename_undo(args)
+    if not args.path:
+        raise Exception('image-rename needs at least one path')
+    errors = []
+    catalog = _get_catalog(args)
+    if catalog:
+        dates = _image_rename_from_catalog(args, catalog)
+    else:
+        dates = _map_paths(_image_rename_get_date_time, args, errors)
+    targets = []
+    for path, dt in dates:
         if not dt:
             print(f'Can not get date/time for {path}. ignoring ...')
             continue
+        targets.append(_image_rename_plan_target(args, path, dt))
+    _image_rename_apply(args, targets, catalog)
+    if catalog:
+        catalog.close()
+    return _report_errors(errors)
 
-        dt_str = dt.strftime(args.output_format_date)
-        path_new = os.path.join(
-            dirname, f'{args.output_format_prefix}{dt_str}.{filename_ext}')
 
-        # do not rename if the path would be the same
-        if path == path_new:
-            continue
+def _split_list(value):
+    """split a comma separated command line argument into a list"""
+    return [v.strip() for v in (value or '').split(',') if v.strip()]
 
-        # find a path_new that doesn't already exist
-        i = 1
-        while os.path.exists(path_new):
-            path_new = os.path.join(
-                dirname,
-                f'{args.output_format_prefix}{dt_str}_{i}.{filename_ext}')
-            i += 1
-            # if the current path is a valid path, just use the current path
-            if path == path_new:
-                break
-
-        if path == path_new:
-            continue
 
-        print(f'Rename {path} -> {path_new}')
-        os.rename(path, path_new)
+def _write_jsonl(out, record):
+    """write a record as a single JSON line and flush it, so consumers can
+    process the output while the command is running"""
+    out.write(json.dumps(record, ensure_ascii=False) + '\n')
+    out.flush()
+
+
+@contextlib.contextmanager
+def _output_for_format(args):
+    """
+    context manager which gives the stream for the output of a command.
+    With the jsonl format all other messages (eg. about files which can not
+    be read) are sent to stderr, so stdout only contains JSON lines
+    """
+    out = sys.stdout
+    if getattr(args, 'format', 'text') != 'jsonl':
+        yield out
+        return
+    with contextlib.redirect_stdout(sys.stderr):
+        yield out
 
 
 def md_tag_list(args):
     """
     List metadata tags for the given image(s)
     """
-    for path in _loop_path(args.path):
-        metadata = utils_gexiv.get_metadata(path)
-        if not metadata:
-            continue
-        tags = []
-        tags += metadata.get_exif_tags()
-        tags += metadata.get_iptc_tags()
-        tags += metadata.get_xmp_tags()
-        print('{:<55} {:<10}: {}'.format('tag name', 'tag type', 'value'))
-        for tag in tags:
-            print('{:<65} {:<10}: {}'.format(
-                tag, metadata.get_tag_type(tag) or 'unknown',
-                metadata.get_tag_interpreted_string(tag)))
+    errors = []
+    with _output_for_format(args) as out:
+        for path, tags in _map_paths(_md_tag_list_file, args, errors):
+            if tags is None:
+                continue
+            if getattr(args, 'format', 'text') == 'jsonl':
+                _write_jsonl(out, {'path': path, 'tags': {
+                    tag: value for tag, value, _ in tags}})
+                continue
+            out.write('{:<55} {:<10}: {}\n'.format(
+                'tag name', 'tag type', 'value'))
+            for tag, value, tag_type in tags:
+                out.write('{:<65} {:<10}: {}\n'.format(
+                    tag, tag_type or 'unknown', value))
+        return _report_errors(errors)
+
+
+def _md_tag_names(metadata, tags, tag_prefixes):
+    """
+    get the names of the tags to list
+    :param tags: list of tag names. Only these tags are listed (if set)
+    :param tag_prefixes: list of tag name prefixes (eg. "Exif.GPSInfo.").
+                         Only tags starting with one of them are listed
+                         (if set)
+    """
+    if not tags and not tag_prefixes:
+        return metadata.get_exif_tags() + metadata.get_iptc_tags() + \
+            metadata.get_xmp_tags()
+    names = [tag for tag in tags if metadata.has_tag(tag)]
+    selected = set(names)
+    # only get the tag lists of the needed families
+    for family, get_tags in (('Exif', metadata.get_exif_tags),
+                             ('Iptc', metadata.get_iptc_tags),
+                             ('Xmp', metadata.get_xmp_tags)):
+        prefixes = tuple(p for p in tag_prefixes
+                         if p.startswith(family) or family.startswith(p))
+        if prefixes:
+            names += [tag for tag in get_tags()
+                      if tag.startswith(prefixes) and tag not in selected]
+    return names
+
+
+def _md_tag_list_file(args, path):
+    """
+    :returns: list of (tag name, interpreted value, tag type) tuples or None
+              if the metadata can not be read. The tag type is only read
+              for the text format
+    """
+    metadata = utils_gexiv.get_metadata(path)
+    if not metadata:
+        return None
+    text = getattr(args, 'format', 'text') == 'text'
+    names = _md_tag_names(metadata, _split_list(getattr(args, 'tags', None)),
+                          _split_list(getattr(args, 'tag_prefix', None)))
+    return [(tag, metadata.get_tag_interpreted_string(tag),
+             metadata.get_tag_type(tag) if text else None)
+            for tag in names]
+
+
+PIPELINE_OPERATIONS = ('gps-set', 'location-set', 'image-rename',
+                       'face-normalize')
+
+
+def _pipeline_file(args, path, operations, reverse_geocode):
+    """
+    apply the operations to a single file. The metadata is read once and
+    saved (at most) once after all operations. The file is not renamed
+    here, so the renames of all files can be planned at once (see
+    :py:func:`_image_rename_apply`)
+    :returns: None if the metadata can not be read. Otherwise the rename
+              target (see :py:func:`_image_rename_plan_target`) or False if
+              the file is not renamed
+    """
+    metadata = utils_gexiv.get_metadata(path)
+    if not metadata:
+        return
+    dirty = False
+    rename_target = False
+    for operation in operations:
+        if operation == 'gps-set':
+            if _gps_set_metadata(args, path, metadata):
+                dirty = True
+        elif operation == 'location-set':
+            gps_data = _do_gps_get(metadata)
+            if not gps_data:
+                continue
+            location_data = reverse_geocode(gps_data[0], gps_data[1])
+            if _location_set_tags(metadata,
+                                  location_data.get('address', {})):
+                print('"{}" Updated location tags'.format(path))
+                dirty = True
+        elif operation == 'image-rename':
+            dt = _metadata_date_time(metadata) or \
+                _datetime_from_str(os.path.basename(path))
+            if not dt:
+                print(f'Can not get date/time for {path}. ignoring ...')
+                continue
+            rename_target = _image_rename_plan_target(args, path, dt)
+        elif operation == 'face-normalize':
+            _face_normalize_file(args, path, metadata)
+    if dirty:
+        metadata.save_file(path)
+    return rename_target
+
+
+def _pipeline_operations(args):
+    """get the (known) operations from the --operations argument"""
+    operations = [o.strip() for o in args.operations.split(',') if o.strip()]
+    unknown = [o for o in operations if o not in PIPELINE_OPERATIONS]
+    if unknown:
+        raise Exception('Unknown pipeline operation(s): {}'.format(
+            ', '.join(unknown)))
+    return operations
+
+
+def _pipeline_prepare(args):
+    """
+    check the pipeline arguments
+    :returns: tuple of (operations, geocode cache, reverse geocoder). The
+              cache and the geocoder are None if not needed
+    """
+    operations = _pipeline_operations(args)
+    if 'gps-set' in operations and \
+       (args.longitude is None or args.latitude is None):
+        raise Exception('gps-set needs --longitude and --latitude')
+    if 'face-normalize' in operations:
+        _check_cascades(args)
+    cache = reverse_geocode = None
+    if 'location-set' in operations:
+        cache = _get_geocode_cache(args)
+        reverse_geocode = _get_reverse_geocoder(args, args.email, cache)
+    return operations, cache, reverse_geocode
+
+
+def pipeline(args):
+    """apply multiple operations to each file with a single metadata open
+    and save"""
+    operations, cache, reverse_geocode = _pipeline_prepare(args)
+    errors = []
+    targets = []
+    for _, rename_target in _map_paths(
+            lambda args, path: _pipeline_file(args, path, operations,
+                                              reverse_geocode),
+            args, errors):
+        if rename_target:
+            targets.append(rename_target)
+    _image_rename_apply(args, targets)
+    if cache:
+        print(cache)
+        cache.close()
+    return _report_errors(errors)
+
+
+def _discovery_extensions(args):
+    """get the file extensions for the file discovery options in args"""
+    if getattr(args, 'all_files', False):
+        return None
+    if getattr(args, 'extensions', None):
+        return frozenset(e.strip().lstrip('.').lower()
+                         for e in args.extensions.split(',') if e.strip())
+    return utils_walk.IMAGE_EXTENSIONS
+
+
+def watch(args):
+    """apply the pipeline operations to new files in the given
+    directories"""
+    roots = [os.path.realpath(path) for path in args.path]
+    for path in args.path:
+        if not os.path.isdir(path):
+            raise Exception('"{}" is not a directory'.format(path))
+    operations = _pipeline_operations(args)
+    if 'face-normalize' in operations:
+        # the face images would be new files in the watched directories and
+        # get handled again
+        dest_dir = os.path.realpath(args.dest_dir) if args.dest_dir else None
+        if dest_dir is None or any(
+                os.path.commonpath([root, dest_dir]) == root
+                for root in roots):
+            raise Exception('face-normalize needs a --dest-dir outside of '
+                            'the watched directories')
+    operations, cache, reverse_geocode = _pipeline_prepare(args)
+    checkpoint = _get_checkpoint(args)
+    extensions = _discovery_extensions(args)
+
+    def _accept(path):
+        return utils_walk.file_matches(
+            path, extensions, getattr(args, 'include', None),
+            getattr(args, 'exclude', None),
+            getattr(args, 'check_magic', False))
+
+    def _handle(path):
+        if checkpoint and checkpoint.is_done(path):
+            return None
+        rename_target = _pipeline_file(args, path, operations,
+                                       reverse_geocode)
+        if rename_target is None:
+            return None
+        path_new = path
+        if rename_target:
+            path_new = dict(_image_rename_apply(args, [rename_target])).get(
+                path, path)
+        if checkpoint:
+            checkpoint.mark_done(path_new)
+        return path_new
+
+    # the watch starts before the initial scan, so no file is missed
+    watcher = utils_watch.get_watcher(args.path, args.poll,
+                                      args.poll_interval)
+    initial = _loop_args(args) if args.initial_scan else ()
+    print('Watching {}'.format(', '.join(args.path)))
+    try:
+        utils_watch.run(watcher, _handle, _accept, args.debounce,
+                        args.queue_size, initial)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if checkpoint:
+            checkpoint.close()
+        if cache:
+            print(cache)
+            cache.close()
+
+
+def _add_image_rename_arguments(parser):
+    """add the arguments to configure the new image names"""
+    parser.add_argument(
+        '--output-format-prefix', type=str, default='IMG_',
+        help='A filename prefix to add before the date. Default: %(default)s')
+    parser.add_argument(
+        '--output-format-date', type=str, default='%Y%m%d_%H%M%S',
+        help='The date format to use (see python '
+        'strptime()). Default: %(default)s')
+
+
+def _add_pipeline_arguments(parser):
+    """add the arguments for the pipeline operations"""
+    parser.add_argument(
+        '--operations', type=str, required=True,
+        help='Comma separated, ordered list of operations. Available are: '
+        '{}'.format(', '.join(PIPELINE_OPERATIONS)))
+    group_gps_set = parser.add_argument_group(
+        'gps-set parameters')
+    group_gps_set.add_argument(
+        '--force', action='store_true',
+        help='Override GPS data even if the picture(s) already contain '
+        'GPS data')
+    group_gps_set.add_argument('--longitude', type=float,
+                               help='Longitude [°N]')
+    group_gps_set.add_argument('--latitude', type=float,
+                               help='Latitude [°W]')
+    group_gps_set.add_argument('--altitude', type=float, default=0,
+                               help='Altitude [m]')
+    group_location_set = parser.add_argument_group(
+        'location-set parameters')
+    group_location_set.add_argument(
+        '--email', type=str, default=None,
+        help='This should be used if you plan todo a large number of '
+        'requests against http://nominatim.openstreetmap.org')
+    _add_geocoder_arguments(parser)
+    _add_image_rename_arguments(
+        parser.add_argument_group('image-rename parameters'))
+    _add_face_normalize_arguments(parser)
+
+
+def _add_checkpoint_argument(parser):
+    parser.add_argument(
+        '--checkpoint', type=str, default=None,
+        help='Record the finished files (with their size and modification '
+        'time) in the given journal file. When the command is started again '
+        'with the same journal, unchanged finished files are skipped')
+
+
+def _add_format_argument(parser):
+    parser.add_argument(
+        '--format', choices=('text', 'jsonl'), default='text',
+        help='The output format. "jsonl" writes one JSON object per file '
+        '(and all other messages to stderr). Defaults to "%(default)s".')
+
+
+def _add_face_detector_arguments(parser):
+    """add the arguments to configure the face detection
+    :returns: the argument group"""
+    # openCV related arguments
+    group_opencv = parser.add_argument_group(
+        'opencv parameters')
+    group_opencv.add_argument(
+        '--opencv-data-dir', type=str, default='/usr/share/opencv4/',
+        help='This might be different depending on your openCV installation. '
+        'Defaults to "%(default)s".')
+    group_opencv.add_argument(
+        '--opencv-face-cascade', type=str,
+        default='haarcascades/haarcascade_frontalface_alt.xml',
+        help='A openCV face cascade classifier definition. This is relative '
+        'to the base direcectory given via "--opencv-data-dir". '
+        'Defaults to "%(default)s".')
+    group_opencv.add_argument(
+        '--opencv-eye-cascade', type=str,
+        default='haarcascades/haarcascade_eye.xml',
+        help='A openCV eye cascade classifier definition. This is relative to '
+        'the base direcectory given via "--opencv-data-dir". '
+        'Defaults to "%(default)s".')
+    group_opencv.add_argument(
+        '--scale-factor', type=float, default=1.1,
+        help='How much the image size is reduced at each image scale during '
+        'the detection. Defaults to "%(default)s".')
+    group_opencv.add_argument(
+        '--min-neighbors', type=int, default=4,
+        help='How many neighbors each candidate rectangle should have to '
+        'retain it. Defaults to "%(default)s".')
+    group_opencv.add_argument(
+        '--detection-size', type=int, default=4096,
+        help='The maximum width/height [px] of the image used for the '
+        'detection. JPEG images are already downscaled while decoding. '
+        'Defaults to "%(default)s".')
+    group_opencv.add_argument(
+        '--min-face-size', type=int, default=None,
+        help='The minimum face size [px]. Defaults to 1/20 of the image side')
+    group_opencv.add_argument(
+        '--max-face-size', type=int, default=None,
+        help='The maximum face size [px]. Defaults to 1/2 of the image side')
+    return group_opencv
+
+
+def _add_face_normalize_arguments(parser):
+    """add the arguments to configure the face normalization"""
+    group_opencv = _add_face_detector_arguments(parser)
+    group_opencv.add_argument(
+        '--use-preview', action='store_true',
+        help='Detect the faces in the embedded preview image (if there is '
+        'one) and only read the full image if faces were found')
+    group_opencv.add_argument(
+        '--preview-min-size', type=int, default=1024,
+        help='The minimum width/height [px] of an embedded preview to be '
+        'used with "--use-preview". Defaults to "%(default)s".')
+
+    parser.add_argument(
+        '--file-name-prefix', type=str, default='face',
+        help='The prefix for the saved normalized image.'
+        'Defaults to "%(default)s".')
+    parser.add_argument(
+        '--dest-dir', type=str,
+        help='The destination dir where the face images are stored.'
+        'If not given, the images are stored next to the source images.')
+
+
+def _add_discovery_arguments(parser):
+    """add the arguments to configure which files are used from
+    the given directories"""
+    group = parser.add_argument_group(
+        'file discovery parameters',
+        'These only apply to files found in the given directories. '
+        'Files given directly are always used.')
+    group.add_argument(
+        '--extensions', type=str, default=None,
+        help='Comma separated list of file extensions to use. '
+        'Defaults to "{}".'.format(','.join(
+            sorted(utils_walk.IMAGE_EXTENSIONS))))
+    group.add_argument(
+        '--all-files', action='store_true',
+        help='Use all files, independent of the file extension')
+    group.add_argument(
+        '--include', type=str, action='append', metavar='GLOB',
+        help='Only use files matching the glob pattern (by name or path). '
+        'Can be given multiple times')
+    group.add_argument(
+        '--exclude', type=str, action='append', metavar='GLOB',
+        help='Skip files and directories matching the glob pattern (by name '
+        'or path). Can be given multiple times')
+    group.add_argument(
+        '--max-depth', type=int, default=None,
+        help='The maximum directory depth. 0 only uses the files of the '
+        'given directories')
+    group.add_argument(
+        '--inode-order', action='store_true',
+        help='Process the files of a directory sorted by inode number. This '
+        'reduces seeks on spinning disks and some network shares')
+    group.add_argument(
+        '--check-magic', action='store_true',
+        help='Only use files which start with the magic bytes of a known '
+        'image format')
+
+
+def _add_catalog_arguments(parser, from_catalog=True):
+    """add the arguments to use the metadata catalog"""
+    group = parser.add_argument_group('catalog parameters')
+    group.add_argument(
+        '--catalog', type=str, default=utils_catalog.default_catalog_path(),
+        help='The metadata catalog (see "catalog-update"). '
+        'Defaults to "%(default)s".')
+    if from_catalog:
+        group.add_argument(
+            '--from-catalog', action='store_true',
+            help='Select the files from the metadata catalog and use the '
+            'cataloged metadata for files which did not change since the '
+            'last "catalog-update" instead of opening them')
+
+
+def _add_metadata_backend_argument(parser):
+    """add the argument to select the backend for reading metadata"""
+    parser.add_argument(
+        '--metadata-backend', choices=['auto', 'exif', 'gexiv2'],
+        default='auto',
+        help='How to read the metadata. "exif" uses a fast builtin reader '
+        'for the EXIF data of JPEG and TIFF based files, "gexiv2" uses '
+        'GExiv2 and "auto" uses the builtin reader and GExiv2 for other '
+        'formats. Defaults to "%(default)s".')
+
+
+def _add_jobs_argument(parser):
+    """add the argument to process files in parallel"""
+    parser.add_argument(
+        '--jobs', '-j', type=int, default=1,
+        help='The number of worker processes. 0 uses all available CPUs. '
+        'Defaults to "%(default)s".')
+
+
+def _add_nominatim_arguments(parser):
+    """add the arguments to configure the nominatim client"""
+    group = parser.add_argument_group('nominatim parameters')
+    group.add_argument(
+        '--nominatim-url', type=str, default=utils_nominatim.PUBLIC_URL,
+        help='The nominatim service base url. Use this for a self-hosted '
+        'nominatim. Defaults to "%(default)s".')
+    group.add_argument(
+        '--nominatim-rate', type=float, default=1.0,
+        help='The maximum number of requests per second. The public service '
+        'is always limited to 1 request per second. '
+        'Defaults to "%(default)s".')
+    group.add_argument(
+        '--nominatim-burst', type=int, default=1,
+        help='The maximum number of requests which can be done at once after '
+        'being idle. Defaults to "%(default)s".')
+    group.add_argument(
+        '--nominatim-concurrency', type=int, default=1,
+        help='The maximum number of concurrent requests. '
+        'Defaults to "%(default)s".')
+    group.add_argument(
+        '--nominatim-retries', type=int, default=3,
+        help='How often requests which failed with a temporary error '
+        '(eg. 429 or 503) are retried. Defaults to "%(default)s".')
+
+
+def _add_geocoder_arguments(parser):
+    """add the arguments to configure the geocoding backend and cache"""
+    _add_nominatim_arguments(parser)
+    group = parser.add_argument_group('geocoding parameters')
+    group.add_argument(
+        '--geocoder', choices=['nominatim', 'gazetteer'], default='nominatim',
+        help='The reverse geocoding backend. "gazetteer" uses a local index '
+        'created with "gazetteer-build" and does not need network access. '
+        'Defaults to "%(default)s".')
+    group.add_argument(
+        '--gazetteer-index', type=str, default=None,
+        help='The gazetteer index directory. '
+        'Defaults to "{}".'.format(utils_gazetteer.default_index_path()))
+    group.add_argument(
+        '--gazetteer-max-distance', type=float, default=None,
+        help='Ignore gazetteer places which are further away [km]')
+    group = parser.add_argument_group('geocoding cache parameters')
+    group.add_argument(
+        '--no-cache', action='store_true',
+        help='Do not use the persistent geocoding cache')
+    group.add_argument(
+        '--cache-file', type=str, default=None,
+        help='The sqlite database used as geocoding cache. '
+        'Defaults to "{}".'.format(utils_geocache.default_cache_path()))
+    group.add_argument(
+        '--cache-ttl', type=float, default=90,
+        help='Time to live for cached entries [days]. '
+        'Defaults to "%(default)s".')
+    group.add_argument(
+        '--cache-max-entries', type=int, default=100000,
+        help='The maximum number of cached entries. '
+        'Defaults to "%(default)s".')
+
+
+def gazetteer_build(args):
+    """build the gazetteer index for offline reverse geocoding"""
+    index_path = args.index or utils_gazetteer.default_index_path()
+    count = utils_gazetteer.build_index(args.cities, args.admin1, index_path,
+                                        args.country_info)
+    print('Wrote gazetteer index with {} place(s) to "{}"'.format(
+        count, index_path))
 
 
 def parse_args():
     parser = argparse.ArgumentParser(
         description='Working with images and image metadata')
+    group_stats = parser.add_argument_group(
+        'statistics', 'Measure where a command spends its time. With '
+        '"--jobs" > 1 only the work done in the main process is measured')
+    group_stats.add_argument(
+        '--stats', action='store_true',
+        help='Print the number of calls and the time spent walking the '
+        'directories, reading and writing metadata, geocoding, decoding '
+        'images and detecting faces at the end')
+    group_stats.add_argument(
+        '--stats-json', type=str, default=None,
+        help='Write the statistics (including timing histograms) as JSON to '
+        'the given file')
+    group_stats.add_argument(
+        '--profile', type=str, default=None,
+        help='Profile the command with cProfile and write the profile to '
+        'the given file (eg. for "python -m pstats FILE" or snakeviz)')
 
     subparsers = parser.add_subparsers(title='sub-command help')
 
@@ -403,8 +1705,21 @@ def parse_args():
     parser_md_tag_list = subparsers.add_parser(
         'md-tag-list', help='List all metadata tags for the given '
         'picture(s)')
+    _add_format_argument(parser_md_tag_list)
+    parser_md_tag_list.add_argument(
+        '--tags', type=str, default=None,
+        help='Comma separated list of tag names (eg. '
+        '"Exif.Photo.DateTimeOriginal,Xmp.dc.subject"). Only these tags are '
+        'read')
+    parser_md_tag_list.add_argument(
+        '--tag-prefix', type=str, default=None,
+        help='Comma separated list of tag name prefixes (eg. '
+        '"Exif.GPSInfo.,Iptc."). Only tags starting with one of them are '
+        'read')
     parser_md_tag_list.add_argument('path', type=str, nargs='+',
                                     help='file or directory')
+    _add_jobs_argument(parser_md_tag_list)
+    _add_discovery_arguments(parser_md_tag_list)
     parser_md_tag_list.set_defaults(func=md_tag_list)
 
     # image regions add
@@ -436,19 +1751,61 @@ def parse_args():
         'region', type=int, help='Region number')
     parser_image_region_remove.set_defaults(func=image_region_remove)
 
+    # image regions bulk import/export
+    parser_image_region_import = subparsers.add_parser(
+        'image-region-import',
+        help='Add image metadata regions from a JSONL or CSV file. Every '
+        'picture is saved once, independent of the number of regions')
+    parser_image_region_import.add_argument(
+        'input', type=str,
+        help='The file with the regions ("-" for stdin). Each record needs '
+        'the keys path, x, y, w and h and can have region, unit, name, '
+        'desc and type. Without region, the regions are appended')
+    parser_image_region_import.add_argument(
+        '--format', choices=['auto', 'jsonl', 'csv'], default='auto',
+        help='The input format. "auto" uses CSV for *.csv files. '
+        'Default: %(default)s')
+    parser_image_region_import.add_argument(
+        '--replace', action='store_true',
+        help='Remove the existing regions of the pictures first')
+    parser_image_region_import.set_defaults(func=image_region_import)
+
+    parser_image_region_export = subparsers.add_parser(
+        'image-region-export',
+        help='Write the image metadata regions of the given picture(s) as '
+        'JSONL (which can be used with image-region-import)')
+    parser_image_region_export.add_argument(
+        '--output', '-o', type=str, default='-',
+        help='The output file. Default: stdout')
+    parser_image_region_export.add_argument('path', type=str, nargs='+',
+                                            help='file or directory')
+    _add_jobs_argument(parser_image_region_export)
+    _add_discovery_arguments(parser_image_region_export)
+    parser_image_region_export.set_defaults(func=image_region_export)
+
     # image rename
     parser_image_rename = subparsers.add_parser(
         'image-rename',
         help='Rename images based on the filename')
+    _add_image_rename_arguments(parser_image_rename)
     parser_image_rename.add_argument(
-        '--output-format-prefix', type=str, default='IMG_',
-        help='A filename prefix to add before the date. Default: %(default)s')
+        '--dry-run', action='store_true',
+        help='Only print the planned renames')
     parser_image_rename.add_argument(
-        '--output-format-date', type=str, default='%Y%m%d_%H%M%S',
-        help='The date format to use (see python '
-        'strptime()). Default: %(default)s')
-    parser_image_rename.add_argument('path', type=str, nargs='+',
+        '--journal', type=str, default=utils_rename.default_journal_path(),
+        help='The journal of the last rename. It is written before the '
+        'first file is renamed and used by --undo. '
+        'Default: %(default)s')
+    parser_image_rename.add_argument(
+        '--undo', action='store_true',
+        help='Undo the renames from the journal (also after an interrupted '
+        'rename). No paths are needed')
+    parser_image_rename.add_argument('path', type=str, nargs='*',
                                      help='file or directory')
+    _add_jobs_argument(parser_image_rename)
+    _add_metadata_backend_argument(parser_image_rename)
+    _add_discovery_arguments(parser_image_rename)
+    _add_catalog_arguments(parser_image_rename)
     parser_image_rename.set_defaults(func=image_rename)
 
     # GPS setter
@@ -464,14 +1821,54 @@ def parse_args():
     parser_gps_set.add_argument('altitude', type=float, help='Altitude [m]')
     parser_gps_set.add_argument('path', type=str, nargs='+',
                                 help='file or directory')
+    _add_jobs_argument(parser_gps_set)
+    _add_discovery_arguments(parser_gps_set)
     parser_gps_set.set_defaults(func=gps_set)
 
+    # GPS setter from tracks
+    parser_gps_set_from_track = subparsers.add_parser(
+        'gps-set-from-track',
+        help='Set the GPS data of the given picture(s) from GPS tracks (GPX '
+        'or CSV files) by the date/time the pictures were taken')
+    parser_gps_set_from_track.add_argument(
+        '--track', type=str, action='append', required=True,
+        help='A GPX or CSV track file. Can be given multiple times. CSV '
+        'files need a header with time, lat and lon (and optionally ele) '
+        'columns. Times without a timezone are UTC')
+    parser_gps_set_from_track.add_argument(
+        '--max-gap', type=float, default=300,
+        help='The maximum time [s] between two track points to interpolate '
+        'the position and between a picture and the nearest track point. '
+        'Defaults to "%(default)s".')
+    parser_gps_set_from_track.add_argument(
+        '--timezone', type=str, default=None,
+        help='The timezone of the camera clock (eg. "Europe/Berlin" or '
+        '"+02:00"). Defaults to the local timezone')
+    parser_gps_set_from_track.add_argument(
+        '--clock-offset', type=float, default=0,
+        help='The time [s] the camera clock is ahead of the GPS time '
+        '(negative if it is behind). Defaults to "%(default)s".')
+    parser_gps_set_from_track.add_argument(
+        '--force', action='store_true',
+        help='Override GPS data even if the picture(s) already contain '
+        'GPS data')
+    parser_gps_set_from_track.add_argument('path', type=str, nargs='+',
+                                           help='file or directory')
+    _add_discovery_arguments(parser_gps_set_from_track)
+    parser_gps_set_from_track.set_defaults(func=gps_set_from_track)
+
     # GPS getter
     parser_gps_get = subparsers.add_parser('gps-get', help='Show GPS location')
     parser_gps_get.add_argument('--include-address', action='store_true',
                                 help='Also get address for GPS data')
+    _add_format_argument(parser_gps_get)
+    _add_geocoder_arguments(parser_gps_get)
     parser_gps_get.add_argument('path', type=str, nargs='+',
                                 help='file or directory')
+    _add_jobs_argument(parser_gps_get)
+    _add_metadata_backend_argument(parser_gps_get)
+    _add_discovery_arguments(parser_gps_get)
+    _add_catalog_arguments(parser_gps_get)
     parser_gps_get.set_defaults(func=gps_get)
 
     # location setter
@@ -483,46 +1880,194 @@ def parse_args():
                                      help='This should be used if you plan '
                                      'todo a large number of requests against '
                                      'http://nominatim.openstreetmap.org')
+    parser_location_set.add_argument(
+        '--batch', action='store_true',
+        help='Read the GPS data of all pictures first and do only one '
+        'lookup per geohash cell')
+    parser_location_set.add_argument(
+        '--batch-precision', type=int, default=6,
+        help='The geohash precision (number of characters) used to group '
+        'pictures in batch mode. 6 is a cell of roughly 1.2km x 0.6km. '
+        'Defaults to "%(default)s".')
+    parser_location_set.add_argument(
+        '--pipeline-depth', type=int, default=16,
+        help='The maximum number of files which are read (and geocoded) '
+        'ahead of the file which is written. Reading and writing the files '
+        'overlaps with waiting for the geocoder. 0 handles one file after '
+        'the other. Defaults to "%(default)s".')
+    parser_location_set.add_argument(
+        '--skip-tagged', action='store_true',
+        help='Skip pictures which already have the {} tags (without a '
+        'lookup)'.format(' and '.join(LOCATION_SET_SKIP_TAGS)))
+    _add_checkpoint_argument(parser_location_set)
+    _add_geocoder_arguments(parser_location_set)
     parser_location_set.add_argument('path', type=str, nargs='+',
                                      help='file or directory')
+    _add_discovery_arguments(parser_location_set)
+    _add_catalog_arguments(parser_location_set)
     parser_location_set.set_defaults(func=location_set)
 
+    # metadata catalog
+    parser_catalog_update = subparsers.add_parser(
+        'catalog-update',
+        help='Create or refresh the metadata catalog for the given '
+        'picture(s). Only new and changed files are read')
+    _add_catalog_arguments(parser_catalog_update, from_catalog=False)
+    _add_discovery_arguments(parser_catalog_update)
+    _add_jobs_argument(parser_catalog_update)
+    parser_catalog_update.add_argument('path', type=str, nargs='+',
+                                       help='file or directory')
+    parser_catalog_update.set_defaults(func=catalog_update)
+
+    # gazetteer index builder
+    parser_gazetteer_build = subparsers.add_parser(
+        'gazetteer-build',
+        help='Build the gazetteer index used for offline reverse geocoding '
+        '(see "--geocoder gazetteer") from the GeoNames dumps available at '
+        'https://download.geonames.org/export/dump/')
+    parser_gazetteer_build.add_argument(
+        '--country-info', type=str, default=None,
+        help='The GeoNames countryInfo.txt file. Used for country names')
+    parser_gazetteer_build.add_argument(
+        '--index', type=str, default=None,
+        help='The index directory. '
+        'Defaults to "{}".'.format(utils_gazetteer.default_index_path()))
+    parser_gazetteer_build.add_argument(
+        'cities', type=str,
+        help='The GeoNames cities file (eg. cities1000.txt)')
+    parser_gazetteer_build.add_argument(
+        'admin1', type=str, help='The GeoNames admin1CodesASCII.txt file')
+    parser_gazetteer_build.set_defaults(func=gazetteer_build)
+
+    # face detection benchmark parser
+    parser_face_benchmark = subparsers.add_parser(
+        'face-benchmark',
+        help='Measure the speed and the accuracy of the face detection with '
+        'a WIDER FACE split')
+    _add_face_detector_arguments(parser_face_benchmark)
+    parser_face_benchmark.add_argument(
+        '--iou-threshold', type=float, default=0.5,
+        help='The minimum intersection over union to match a detection to '
+        'a face. Default: %(default)s')
+    parser_face_benchmark.add_argument(
+        '--limit', type=int, default=None,
+        help='Only use the first N images of the split')
+    parser_face_benchmark.add_argument(
+        '--wider-cache', action='store_true',
+        help='Use a binary cache of the parsed annotations (stored next to '
+        'the annotation file)')
+    parser_face_benchmark.add_argument(
+        '--json', type=str, default=None,
+        help='Also write the results as JSON to the given file (eg. to '
+        'compare releases)')
+    parser_face_benchmark.add_argument(
+        'wider_annotations', type=str,
+        help='The annotation file (eg. wider_face_val_bbx_gt.txt)')
+    parser_face_benchmark.add_argument(
+        'wider_images', type=str,
+        help='The image directory of the split (eg. WIDER_val/images)')
+    parser_face_benchmark.set_defaults(func=face_benchmark)
+
+    # benchmark parser
+    parser_benchmark = subparsers.add_parser(
+        'benchmark',
+        help='Measure the speed and the memory usage of the commands with a '
+        'generated photo corpus. Runs offline (a local stub is used for '
+        'geocoding)')
+    parser_benchmark.add_argument(
+        '--commands', type=str, default=None,
+        help='Comma separated list of the commands to benchmark (md-tag-list, '
+        'gps-get, gps-set, location-set, image-rename, face-normalize). '
+        'Defaults to all')
+    parser_benchmark.add_argument(
+        '--count', type=int, default=100,
+        help='The number of photos. Defaults to "%(default)s".')
+    parser_benchmark.add_argument(
+        '--width', type=int, default=1600,
+        help='The width of the photos [px]. Defaults to "%(default)s".')
+    parser_benchmark.add_argument(
+        '--height', type=int, default=1200,
+        help='The height of the photos [px]. Defaults to "%(default)s".')
+    parser_benchmark.add_argument(
+        '--face-ratio', type=float, default=0.2,
+        help='The fraction of the photos with faces. '
+        'Defaults to "%(default)s".')
+    parser_benchmark.add_argument(
+        '--seed', type=int, default=0,
+        help='The seed for the corpus. The same seed (and size) always '
+        'generates the same corpus. Defaults to "%(default)s".')
+    parser_benchmark.add_argument(
+        '--geocoder-delay', type=float, default=0.0,
+        help='The response delay [s] of the stub geocoder. '
+        'Defaults to "%(default)s".')
+    parser_benchmark.add_argument(
+        '--work-dir', type=str, default=None,
+        help='The directory for the corpus. Defaults to a temporary '
+        'directory')
+    parser_benchmark.add_argument(
+        '--output', '-o', type=str, default=None,
+        help='Write the results as JSON to the given file ("-" for stdout) '
+        'to compare them across versions')
+    _add_face_detector_arguments(parser_benchmark)
+    parser_benchmark.set_defaults(func=benchmark)
+
     # face normalization parser
     parser_face_normalize = subparsers.add_parser(
         'face-normalize',
         help='Normalize faces from images and store results in new images')
-    # openCV related arguments
-    group_opencv = parser_face_normalize.add_argument_group(
-        'opencv parameters')
-    group_opencv.add_argument(
-        '--opencv-data-dir', type=str, default='/usr/share/opencv4/',
-        help='This might be different depending on your openCV installation. '
-        'Defaults to "%(default)s".')
-    group_opencv.add_argument(
-        '--opencv-face-cascade', type=str,
-        default='haarcascades/haarcascade_frontalface_alt.xml',
-        help='A openCV face cascade classifier definition. This is relative '
-        'to the base direcectory given via "--opencv-data-dir". '
-        'Defaults to "%(default)s".')
-    group_opencv.add_argument(
-        '--opencv-eye-cascade', type=str,
-        default='haarcascades/haarcascade_eye.xml',
-        help='A openCV eye cascade classifier definition. This is relative to '
-        'the base direcectory given via "--opencv-data-dir". '
-        'Defaults to "%(default)s".')
-
-    parser_face_normalize.add_argument(
-        '--file-name-prefix', type=str, default='face',
-        help='The prefix for the saved normalized image.'
-        'Defaults to "%(default)s".')
-    parser_face_normalize.add_argument(
-        '--dest-dir', type=str,
-        help='The destination dir where the face images are stored.'
-        'If not given, the images are stored next to the source images.')
+    _add_face_normalize_arguments(parser_face_normalize)
+    _add_checkpoint_argument(parser_face_normalize)
     parser_face_normalize.add_argument('path', type=str, nargs='+',
                                        help='file or directory')
+    _add_jobs_argument(parser_face_normalize)
+    _add_discovery_arguments(parser_face_normalize)
     parser_face_normalize.set_defaults(func=face_normalize)
 
+    # pipeline
+    parser_pipeline = subparsers.add_parser(
+        'pipeline',
+        help='Apply multiple operations to the given picture(s). Each '
+        'picture is opened and saved only once. The picture is renamed '
+        'after all other operations')
+    _add_pipeline_arguments(parser_pipeline)
+    _add_discovery_arguments(parser_pipeline)
+    parser_pipeline.add_argument('path', type=str, nargs='+',
+                                 help='file or directory')
+    parser_pipeline.set_defaults(func=pipeline)
+
+    # watch
+    parser_watch = subparsers.add_parser(
+        'watch',
+        help='Watch directories and apply operations (like "pipeline") to '
+        'new pictures as soon as they are written')
+    _add_pipeline_arguments(parser_watch)
+    group_watch = parser_watch.add_argument_group('watch parameters')
+    group_watch.add_argument(
+        '--debounce', type=float, default=2.0,
+        help='The time [s] without changes before a picture is handled. '
+        'Defaults to "%(default)s".')
+    group_watch.add_argument(
+        '--queue-size', type=int, default=64,
+        help='The maximum number of pictures waiting to be handled. '
+        'Defaults to "%(default)s".')
+    group_watch.add_argument(
+        '--poll', action='store_true',
+        help='Poll the directories instead of using inotify (eg. for '
+        'network file systems)')
+    group_watch.add_argument(
+        '--poll-interval', type=float, default=5.0,
+        help='The time [s] between two scans when polling. '
+        'Defaults to "%(default)s".')
+    group_watch.add_argument(
+        '--initial-scan', action='store_true',
+        help='Also handle the pictures which exist when the watch starts '
+        '(use with "--checkpoint" to skip the already handled ones)')
+    _add_checkpoint_argument(parser_watch)
+    _add_discovery_arguments(parser_watch)
+    parser_watch.add_argument('path', type=str, nargs='+',
+                              help='directory')
+    parser_watch.set_defaults(func=watch)
+
     # helper - get GPS from address query
     parser_gps_get_from_query = subparsers.add_parser(
         'gps-get-from-query',
@@ -535,18 +2080,45 @@ def parse_args():
         'against http://nominatim.openstreetmap.org')
     parser_gps_get_from_query.add_argument(
         'query', type=str, help='A query. Usually a address name')
+    _add_nominatim_arguments(parser_gps_get_from_query)
     parser_gps_get_from_query.set_defaults(func=gps_get_from_query)
 
     return parser
 
 
+def _run(args):
+    """run the command given in args with the requested statistics"""
+    stats = restore = profiler = None
+    if args.stats or args.stats_json:
+        stats = utils_stats.Stats()
+        restore = utils_stats.instrument(stats, sys.modules[__name__])
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        return args.func(args) or 0
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            print('Wrote profile to "{}"'.format(args.profile),
+                  file=sys.stderr)
+        if stats:
+            restore()
+            # stderr, so the statistics don't mix with the output
+            if args.stats:
+                print(stats.format(), file=sys.stderr)
+            if args.stats_json:
+                with open(args.stats_json, 'w') as f:
+                    json.dump(stats.as_dict(), f, indent=2)
+
+
 def main():
     parser = parse_args()
     args = parser.parse_args()
     if 'func' not in args:
         sys.exit(parser.print_help())
-    args.func(args)
-    sys.exit(0)
+    sys.exit(_run(args))
 
 
 # for debugging
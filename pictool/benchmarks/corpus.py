@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Generate a synthetic (but reproducible) corpus of JPEG photos.
+
+The photos have an Exif DateTimeOriginal, GPS data and XMP regions. Some
+of them contain (drawn) faces. The metadata is written without GExiv2, so
+the corpus can be generated on any box with openCV and numpy.
+"""
+
+import datetime
+import os
+import random
+import struct
+
+import cv2
+import numpy
+
+
+# TIFF field types
+_BYTE = 1
+_ASCII = 2
+_LONG = 4
+_RATIONAL = 5
+
+_XMP_HEADER = b'http://ns.adobe.com/xap/1.0/\x00'
+
+
+def _ifd(entries, offset):
+    """
+    build a little endian IFD at offset
+    :param entries: list of (tag, type, count, packed value) tuples
+    :returns: the IFD bytes (including the values which don't fit into the
+              entries)
+    """
+    data_offset = offset + 2 + 12 * len(entries) + 4
+    ifd = struct.pack('<H', len(entries))
+    data = b''
+    for tag, type_, count, value in sorted(entries):
+        if len(value) <= 4:
+            ifd += struct.pack('<HHI', tag, type_, count) + \
+                value.ljust(4, b'\x00')
+        else:
+            ifd += struct.pack('<HHII', tag, type_, count,
+                               data_offset + len(data))
+            # values start on word boundaries
+            data += value + b'\x00' * (len(value) % 2)
+    return ifd + struct.pack('<I', 0) + data
+
+
+def _rationals(*values):
+    """pack the values as rationals with 4 decimal places"""
+    return b''.join(struct.pack('<II', int(round(abs(v) * 10000)), 10000)
+                    for v in values)
+
+
+def _dms(degrees):
+    """split (absolute) degrees into degrees, minutes and seconds"""
+    degrees = abs(degrees)
+    d = int(degrees)
+    m = int((degrees - d) * 60)
+    return d, m, (degrees - d - m / 60) * 3600
+
+
+def exif_segment(date_time_original, longitude, latitude, altitude):
+    """
+    build a JPEG APP1 segment with Exif data
+    :param date_time_original: a datetime
+    :returns: the segment bytes (including the marker)
+    """
+    date_time = date_time_original.strftime('%Y:%m:%d %H:%M:%S').encode()
+    exif_entries = [(0x9003, _ASCII, 20, date_time + b'\x00')]
+    gps_entries = [
+        (1, _ASCII, 2, b'N\x00' if latitude >= 0 else b'S\x00'),
+        (2, _RATIONAL, 3, _rationals(*_dms(latitude))),
+        (3, _ASCII, 2, b'E\x00' if longitude >= 0 else b'W\x00'),
+        (4, _RATIONAL, 3, _rationals(*_dms(longitude))),
+        (5, _BYTE, 1, b'\x00' if altitude >= 0 else b'\x01'),
+        (6, _RATIONAL, 1, _rationals(altitude)),
+    ]
+    # IFD0 only has the pointers to the Exif and the GPS IFD
+    exif_offset = 8 + 2 + 12 * 2 + 4
+    exif_ifd = _ifd(exif_entries, exif_offset)
+    gps_offset = exif_offset + len(exif_ifd)
+    gps_ifd = _ifd(gps_entries, gps_offset)
+    ifd0 = _ifd([(0x8769, _LONG, 1, struct.pack('<I', exif_offset)),
+                 (0x8825, _LONG, 1, struct.pack('<I', gps_offset))], 8)
+    payload = b'Exif\x00\x00' + b'II' + struct.pack('<HI', 42, 8) + \
+        ifd0 + exif_ifd + gps_ifd
+    return b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload
+
+
+def xmp_segment(width, height, regions):
+    """
+    build a JPEG APP1 segment with XMP mwg-rs regions
+    :param regions: list of (x, y, w, h, name) tuples [px]
+    :returns: the segment bytes (including the marker)
+    """
+    items = ''.join(
+        '<rdf:li rdf:parseType="Resource">'
+        '<mwg-rs:Area stArea:unit="pixel" stArea:x="{}" stArea:y="{}" '
+        'stArea:w="{}" stArea:h="{}"/>'
+        '<mwg-rs:Name>{}</mwg-rs:Name><mwg-rs:Type>Face</mwg-rs:Type>'
+        '</rdf:li>'.format(*region) for region in regions)
+    xml = (
+        '<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?>'
+        '<x:xmpmeta xmlns:x="adobe:ns:meta/">'
+        '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+        '<rdf:Description rdf:about="" '
+        'xmlns:mwg-rs="http://www.metadataworkinggroup.com/schemas/regions/" '
+        'xmlns:stArea="http://ns.adobe.com/xmp/sType/Area#" '
+        'xmlns:stDim="http://ns.adobe.com/xap/1.0/sType/Dimensions#">'
+        '<mwg-rs:Regions rdf:parseType="Resource">'
+        '<mwg-rs:AppliedToDimensions stDim:unit="pixel" stDim:w="{}" '
+        'stDim:h="{}"/>'
+        '<mwg-rs:RegionList><rdf:Bag>{}</rdf:Bag></mwg-rs:RegionList>'
+        '</mwg-rs:Regions></rdf:Description></rdf:RDF></x:xmpmeta>'
+        '<?xpacket end="w"?>').format(width, height, items)
+    payload = _XMP_HEADER + xml.encode('utf-8')
+    return b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload
+
+
+def _draw_face(image, x, y, size):
+    """draw a simple face with its upper left corner at x, y"""
+    center = (x + size // 2, y + size // 2)
+    cv2.ellipse(image, center, (size * 2 // 5, size // 2), 0, 0, 360,
+                (150, 180, 225), -1)
+    for eye_x in (center[0] - size // 6, center[0] + size // 6):
+        cv2.circle(image, (eye_x, center[1] - size // 8), size // 16,
+                   (40, 30, 30), -1)
+    cv2.ellipse(image, (center[0], center[1] + size // 5),
+                (size // 6, size // 14), 0, 0, 180, (60, 60, 160), 2)
+
+
+def _image(rng, width, height, faces):
+    """draw an image (a gradient with some shapes) with the given faces"""
+    gx = numpy.linspace(0, 1, width, dtype=numpy.float32)
+    gy = numpy.linspace(0, 1, height, dtype=numpy.float32)[:, None]
+    base = rng.uniform(40, 200, size=3)
+    image = numpy.empty((height, width, 3), dtype=numpy.uint8)
+    for c in range(3):
+        image[:, :, c] = numpy.clip(
+            base[c] + 50 * gx + rng.uniform(-50, 50) * gy, 0, 255)
+    for _ in range(8):
+        cv2.rectangle(
+            image,
+            (int(rng.integers(0, width)), int(rng.integers(0, height))),
+            (int(rng.integers(0, width)), int(rng.integers(0, height))),
+            tuple(int(v) for v in rng.integers(0, 255, size=3)), -1)
+    for x, y, size, _ in faces:
+        _draw_face(image, x, y, size)
+    return image
+
+
+def generate(directory, count=100, width=1600, height=1200, face_ratio=0.2,
+             seed=0, quality=90):
+    """
+    generate a corpus of JPEG photos. The same arguments always generate
+    the same corpus
+    :param directory: the directory for the photos (created if needed)
+    :param count: the number of photos
+    :param width: the width of the photos [px]
+    :param height: the height of the photos [px]
+    :param face_ratio: the fraction of the photos with faces
+    :param seed: the seed for the random data
+    :param quality: the JPEG quality
+    :returns: list of the paths of the photos
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = numpy.random.default_rng(seed)
+    # the photos with faces are spread over the corpus
+    face_images = set(random.Random(seed).sample(
+        range(count), int(round(count * face_ratio))))
+    start = datetime.datetime(2020, 1, 1)
+    paths = []
+    for i in range(count):
+        faces = []
+        if i in face_images:
+            for n in range(int(rng.integers(1, 4))):
+                size = int(min(width, height) * rng.uniform(0.15, 0.3))
+                faces.append((int(rng.integers(0, width - size)),
+                              int(rng.integers(0, height - size)), size,
+                              'Person {}'.format(n + 1)))
+        image = _image(rng, width, height, faces)
+        ok, jpeg = cv2.imencode('.jpg', image,
+                                [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            raise Exception('Can not encode image {}'.format(i))
+        # some photos are taken in the same second (burst shots)
+        dt = start + datetime.timedelta(seconds=int(i // 3 * 3600))
+        exif = exif_segment(dt, rng.uniform(-10, 30), rng.uniform(35, 60),
+                            rng.uniform(0, 1000))
+        xmp = xmp_segment(width, height,
+                          [(x, y, s, s, name) for x, y, s, name in faces])
+        jpeg = jpeg.tobytes()
+        # the metadata segments follow SOI and the JFIF APP0 segment
+        pos = 2
+        if jpeg[2:4] == b'\xff\xe0':
+            pos += 2 + struct.unpack('>H', jpeg[4:6])[0]
+        path = os.path.join(directory, 'photo_{:06d}.jpg'.format(i))
+        with open(path, 'wb') as f:
+            f.write(jpeg[:pos] + exif + xmp + jpeg[pos:])
+        paths.append(path)
+    return paths
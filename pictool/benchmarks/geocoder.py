@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+A local stub of the nominatim API, so geocoding commands can be benchmarked
+offline.
+"""
+
+import http.server
+import json
+import threading
+import time
+import urllib.parse
+
+
+class StubGeocoder(object):
+    """
+    A HTTP server (in a thread) which answers nominatim reverse and search
+    requests with made up (but deterministic) data. Use it as context
+    manager::
+
+        with StubGeocoder() as geocoder:
+            client = NominatimClient(geocoder.url)
+    """
+    def __init__(self, delay=0.0):
+        """
+        :param delay: the time [s] each response is delayed (to simulate
+                      the network and the service)
+        """
+        self.delay = delay
+        self.requests = 0
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self._server.server_port)
+
+    def _response(self, path):
+        """get the status code and the json data for a request path"""
+        url = urllib.parse.urlsplit(path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        if url.path == '/reverse':
+            lat = float(params.get('lat', 0))
+            lon = float(params.get('lon', 0))
+            return 200, {
+                'lat': lat, 'lon': lon,
+                'address': {
+                    'country_code': 'xx',
+                    'country': 'Country {}'.format(int(lon // 10)),
+                    'state': 'State {}'.format(int(lat // 5)),
+                    'city': 'City {:.0f}/{:.0f}'.format(lat, lon)}}
+        if url.path == '/search':
+            return 200, [{'lat': '50.7', 'lon': '7.1',
+                          'display_name': params.get('q', '')}]
+        return 404, {'error': 'not found'}
+
+    def __enter__(self):
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                if stub.delay:
+                    time.sleep(stub.delay)
+                status, data = stub._response(self.path)
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                       Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
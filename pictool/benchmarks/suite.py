@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark the pictool commands with a synthetic corpus.
+
+Every command runs in its own process on a fresh copy of the corpus, so
+the peak memory is per command and commands which modify the files don't
+influence each other. The per file latencies are measured by wrapping the
+function which handles a single file.
+"""
+
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy
+
+from pictool.benchmarks import corpus
+from pictool.benchmarks import geocoder
+
+
+COMMANDS = ('md-tag-list', 'gps-get', 'gps-set', 'location-set',
+            'image-rename', 'face-normalize')
+
+# command -> the function in pictool which handles a single file. For
+# location-set it is the read stage of the pipeline
+_PER_FILE_FUNCTIONS = {
+    'md-tag-list': '_md_tag_list_file',
+    'gps-get': '_gps_get_file',
+    'gps-set': '_gps_set_file',
+    'location-set': '_location_set_read',
+    'image-rename': '_image_rename_get_date_time',
+    'face-normalize': '_face_normalize_file',
+}
+
+
+def _argv(command, photos_dir, run_dir, geocoder_url, face_args):
+    """get the command line arguments to benchmark a command"""
+    if command == 'gps-set':
+        return [command, '--force', '7.1', '50.7', '60.0', photos_dir]
+    if command == 'location-set':
+        return [command, '--no-cache', '--nominatim-url', geocoder_url,
+                '--nominatim-rate', '100000', '--nominatim-burst', '100000',
+                photos_dir]
+    if command == 'image-rename':
+        return [command, '--journal',
+                os.path.join(run_dir, 'rename-journal.jsonl'), photos_dir]
+    if command == 'face-normalize':
+        return [command, '--dest-dir', os.path.join(run_dir, 'faces')] + \
+            list(face_args) + [photos_dir]
+    return [command, photos_dir]
+
+
+def _run_command(argv, per_file_function, result_path):
+    """run a command (in a child process) and write the measurements as
+    json to result_path"""
+    import pictool
+
+    latencies = []
+    func = getattr(pictool, per_file_function)
+
+    def _timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    setattr(pictool, per_file_function, _timed)
+    args = pictool.parse_args().parse_args(argv)
+    error = None
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        try:
+            exit_code = args.func(args) or 0
+        except Exception as e:
+            exit_code = 1
+            error = '{}: {}'.format(type(e).__name__, e)
+    duration = time.perf_counter() - start
+    with open(result_path, 'w') as f:
+        json.dump({'duration': duration, 'latencies': latencies,
+                   'exit_code': exit_code, 'error': error,
+                   # ru_maxrss is in kilobytes on linux
+                   'peak_rss': resource.getrusage(
+                       resource.RUSAGE_SELF).ru_maxrss * 1024}, f)
+
+
+def _command_results(measurements):
+    """get the results for a command from the measurements"""
+    latencies = numpy.array(measurements['latencies'])
+    duration = measurements['duration']
+    results = {
+        'files': len(latencies),
+        'duration': duration,
+        'files_per_second': len(latencies) / duration if duration else 0.0,
+        'latency_p50': None,
+        'latency_p99': None,
+        'peak_rss': measurements['peak_rss'],
+        'exit_code': measurements['exit_code'],
+        'error': measurements['error'],
+    }
+    if len(latencies):
+        results['latency_p50'] = float(numpy.percentile(latencies, 50))
+        results['latency_p99'] = float(numpy.percentile(latencies, 99))
+    return results
+
+
+def run(commands=COMMANDS, work_dir=None, count=100, width=1600,
+        height=1200, face_ratio=0.2, seed=0, face_args=(),
+        geocoder_delay=0.0):
+    """
+    run the benchmarks
+    :param commands: the commands to benchmark
+    :param work_dir: the directory for the corpus. A temporary directory is
+                     used (and removed) if not given
+    :param count: the number of photos in the corpus
+    :param width: the width of the photos [px]
+    :param height: the height of the photos [px]
+    :param face_ratio: the fraction of the photos with faces
+    :param seed: the seed for the corpus
+    :param face_args: additional command line arguments for face-normalize
+                      (eg. the openCV cascades)
+    :param geocoder_delay: the response delay [s] of the stub geocoder
+    :returns: dict with the results
+    """
+    unknown = [c for c in commands if c not in COMMANDS]
+    if unknown:
+        raise Exception('Unknown benchmark command(s): {}'.format(
+            ', '.join(unknown)))
+    with contextlib.ExitStack() as stack:
+        if work_dir is None:
+            work_dir = stack.enter_context(tempfile.TemporaryDirectory())
+        stub = stack.enter_context(geocoder.StubGeocoder(geocoder_delay))
+
+        corpus_dir = os.path.join(work_dir, 'corpus')
+        start = time.perf_counter()
+        corpus.generate(corpus_dir, count, width, height, face_ratio, seed)
+        results = {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'corpus': {'count': count, 'width': width, 'height': height,
+                       'face_ratio': face_ratio, 'seed': seed,
+                       'duration': time.perf_counter() - start},
+            'commands': {},
+        }
+
+        # spawn, so the measured process only contains what the command
+        # needs
+        context = multiprocessing.get_context('spawn')
+        for command in commands:
+            run_dir = os.path.join(work_dir, command)
+            photos_dir = os.path.join(run_dir, 'photos')
+            shutil.copytree(corpus_dir, photos_dir)
+            result_path = os.path.join(run_dir, 'result.json')
+            process = context.Process(target=_run_command, args=(
+                _argv(command, photos_dir, run_dir, stub.url, face_args),
+                _PER_FILE_FUNCTIONS[command], result_path))
+            process.start()
+            process.join()
+            if process.exitcode != 0 or not os.path.exists(result_path):
+                raise Exception('Benchmark process for {} failed'.format(
+                    command))
+            with open(result_path, 'r') as f:
+                results['commands'][command] = _command_results(json.load(f))
+            shutil.rmtree(run_dir)
+    return results
+
+
+def format_results(results):
+    """format the results of :py:func:`run` as text"""
+    c = results['corpus']
+    lines = ['corpus: {} photo(s) {}x{}px, {:.0%} with faces, seed {}'.format(
+        c['count'], c['width'], c['height'], c['face_ratio'], c['seed'])]
+    lines.append('{:<15} {:>6} {:>9} {:>9} {:>9} {:>9}  {}'.format(
+        'command', 'files', 'files/s', 'p50 [ms]', 'p99 [ms]', 'RSS [MiB]',
+        'error'))
+    for command, r in results['commands'].items():
+        lines.append('{:<15} {:>6} {:>9.1f} {:>9} {:>9} {:>9.1f}  {}'.format(
+            command, r['files'], r['files_per_second'],
+            '-' if r['latency_p50'] is None else
+            '{:.2f}'.format(r['latency_p50'] * 1000),
+            '-' if r['latency_p99'] is None else
+            '{:.2f}'.format(r['latency_p99'] * 1000),
+            r['peak_rss'] / 2 ** 20, r['error'] or ''))
+    return '\n'.join(lines)
+
+
+def write_results(results, path):
+    """write the results as json ("-" for stdout)"""
+    if path == '-':
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
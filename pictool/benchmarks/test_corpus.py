@@ -0,0 +1,44 @@
+import hashlib
+import json
+import urllib.request
+
+from pictool import utils_exif
+from pictool.benchmarks import corpus
+from pictool.benchmarks import geocoder
+
+
+def _digests(paths):
+    return [hashlib.sha1(open(p, 'rb').read()).hexdigest() for p in paths]
+
+
+def test_generate(tmp_path):
+    paths = corpus.generate(tmp_path.as_posix(), count=4, width=320,
+                            height=240, face_ratio=0.5)
+    assert len(paths) == 4
+    for path in paths:
+        assert utils_exif.get_image_size(path) == (320, 240)
+        data = open(path, 'rb').read()
+        assert b'2020:01:01 ' in data
+        assert b'mwg-rs:RegionList' in data
+    # 2 of the photos have faces
+    assert sum(b'mwg-rs:Name' in open(p, 'rb').read() for p in paths) == 2
+
+
+def test_generate_reproducible(tmp_path):
+    a = corpus.generate(tmp_path.joinpath('a').as_posix(), count=3,
+                        width=160, height=120, seed=1)
+    b = corpus.generate(tmp_path.joinpath('b').as_posix(), count=3,
+                        width=160, height=120, seed=1)
+    c = corpus.generate(tmp_path.joinpath('c').as_posix(), count=3,
+                        width=160, height=120, seed=2)
+    assert _digests(a) == _digests(b)
+    assert _digests(a) != _digests(c)
+
+
+def test_stub_geocoder():
+    with geocoder.StubGeocoder() as stub:
+        with urllib.request.urlopen(
+                stub.url + '/reverse?format=json&lat=50.7&lon=7.1') as r:
+            data = json.loads(r.read().decode())
+    assert data['address']['city'] == 'City 51/7'
+    assert stub.requests == 1
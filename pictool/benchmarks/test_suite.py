@@ -0,0 +1,23 @@
+import pytest
+
+from pictool.benchmarks import suite
+
+
+def test_run(tmp_path):
+    results = suite.run(['gps-get', 'image-rename'], tmp_path.as_posix(),
+                        count=3, width=160, height=120)
+    assert results['corpus']['count'] == 3
+    assert sorted(results['commands']) == ['gps-get', 'image-rename']
+    for r in results['commands'].values():
+        assert r['files'] == 3
+        assert r['files_per_second'] > 0
+        assert 0 < r['latency_p50'] <= r['latency_p99']
+        assert r['peak_rss'] > 0
+    # the per command copies are removed
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['corpus']
+    assert 'gps-get' in suite.format_results(results)
+
+
+def test_run_unknown_command(tmp_path):
+    with pytest.raises(Exception, match='Unknown benchmark command'):
+        suite.run(['foo'], tmp_path.as_posix())
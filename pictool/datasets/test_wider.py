@@ -0,0 +1,107 @@
+import numpy
+import pytest
+
+from pictool.datasets import wider
+
+
+# the WIDER files have a trailing space after the box values
+ANNOTATIONS = '\n'.join([
+    '0--Parade/0_Parade_marchingband_1_849.jpg',
+    '1',
+    '449 330 122 149 0 0 0 0 0 0 ',
+    '0--Parade/0_Parade_Parade_0_904.jpg',
+    '0',
+    '0 0 0 0 0 0 0 0 0 0 ',
+    '1--Handshaking/1_Handshaking_1_49.jpg',
+    '2',
+    '78 221 7 8 2 0 0 0 0 0 ',
+    '849 1 1 1 0 0 0 0 2 1 ',
+    ''])
+
+
+@pytest.fixture
+def annotations(tmp_path):
+    path = tmp_path.joinpath('wider_face_train_bbx_gt.txt')
+    path.write_text(ANNOTATIONS)
+    return wider.WIDERAnnotations(path.as_posix())
+
+
+def test_image_names(annotations):
+    assert len(annotations) == 3
+    assert annotations.image_names() == [
+        '0--Parade/0_Parade_marchingband_1_849.jpg',
+        '0--Parade/0_Parade_Parade_0_904.jpg',
+        '1--Handshaking/1_Handshaking_1_49.jpg']
+    assert '/data/0_Parade_Parade_0_904.jpg' in annotations
+    assert '849' not in annotations
+
+
+def test_bounding_boxes(annotations):
+    boxes = annotations.bounding_boxes('/data/0_Parade_marchingband_1_849.jpg')
+    assert [(b.x, b.y, b.w, b.h) for b in boxes] == [(449, 330, 122, 149)]
+    assert annotations.bounding_boxes('0_Parade_Parade_0_904.jpg') == []
+    boxes = annotations.bounding_boxes('1_Handshaking_1_49.jpg')
+    assert [(b.x, b.y, b.w, b.h) for b in boxes] == [
+        (78, 221, 7, 8), (849, 1, 1, 1)]
+    assert boxes[0].blur == wider.WIDERBBoxInfoBlur.HEAVY
+    assert boxes[1].occlusion == wider.WIDERBBoxInfoOcclusion.HEAVY
+    assert boxes[1].pose == wider.WIDERBBoxInfoPose.ATYPICAL
+    with pytest.raises(Exception):
+        annotations.bounding_boxes('missing.jpg')
+
+
+def test_boxes_array(annotations):
+    image_boxes = annotations.boxes_array('1_Handshaking_1_49.jpg')
+    boxes = annotations.boxes_array()
+    assert boxes.dtype == wider.BBOX_DTYPE
+    assert boxes['image'].tolist() == [0, 2, 2]
+    assert boxes['x'].tolist() == [449, 78, 849]
+    assert numpy.array_equal(
+        annotations.boxes_array('1_Handshaking_1_49.jpg'), image_boxes)
+    assert len(annotations.boxes_array('0_Parade_Parade_0_904.jpg')) == 0
+
+
+def test_bbox_info_slots():
+    box = wider.WIDERBBoxInfo('78 221 7 8 2 0 0 1 0 0 ')
+    assert box.invalid == wider.WIDERBBoxInfoInvalid.TRUE
+    with pytest.raises(AttributeError):
+        box.extra = 1
+
+
+def test_cache(tmp_path):
+    path = tmp_path.joinpath('wider_face_train_bbx_gt.txt')
+    path.write_text(ANNOTATIONS)
+    expected = wider.WIDERAnnotations(path.as_posix())
+    annotations = wider.WIDERAnnotations(path.as_posix(), cache=True)
+    assert tmp_path.joinpath(
+        'wider_face_train_bbx_gt.txt.cache', 'meta.json').is_file()
+    cached = wider.WIDERAnnotations(path.as_posix(), cache=True)
+    # the cache is used and memory-mapped
+    assert cached._annotations is None
+    assert isinstance(cached.boxes_array(), numpy.memmap)
+    for a in (annotations, cached):
+        assert a.image_names() == expected.image_names()
+        assert numpy.array_equal(a.boxes_array(), expected.boxes_array())
+        for name in expected:
+            assert [str(b) for b in a.bounding_boxes(name)] == \
+                [str(b) for b in expected.bounding_boxes(name)]
+    # a changed file invalidates the cache
+    path.write_text(ANNOTATIONS.replace('449 330', '450 330'))
+    changed = wider.WIDERAnnotations(path.as_posix(), cache=True)
+    assert changed._annotations is not None
+    assert changed.boxes_array()['x'][0] == 450
+    assert wider.WIDERAnnotations(
+        path.as_posix(), cache=True).boxes_array()['x'][0] == 450
+    # the replaced cache and the temporary files are removed
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        'wider_face_train_bbx_gt.txt', 'wider_face_train_bbx_gt.txt.cache']
+
+
+def test_cache_without_boxes(tmp_path):
+    path = tmp_path.joinpath('empty.txt')
+    path.write_text('')
+    wider.WIDERAnnotations(path.as_posix(), cache=True)
+    cached = wider.WIDERAnnotations(path.as_posix(), cache=True)
+    assert cached._annotations is None
+    assert len(cached) == 0
+    assert len(cached.boxes_array()) == 0
@@ -0,0 +1,81 @@
+import cv2
+import numpy
+import pytest
+
+from pictool.datasets import wider
+from pictool.datasets import wider_benchmark
+
+
+def test_box_iou():
+    iou = wider_benchmark.box_iou(
+        (0, 0, 10, 10), [(0, 0, 10, 10), (5, 0, 10, 10), (20, 20, 5, 5)])
+    assert iou.tolist() == pytest.approx([1.0, 50 / 150, 0.0])
+
+
+def test_match_detections():
+    gt_boxes = numpy.array([(0, 0, 10, 10), (100, 100, 10, 10),
+                            (200, 200, 10, 10)])
+    ignore = numpy.array([False, False, True])
+    matches = wider_benchmark.match_detections(
+        [(1, 1, 10, 10), (0, 0, 10, 10), (200, 200, 10, 10), (50, 50, 5, 5)],
+        [1, 2, 3, 4], gt_boxes, ignore)
+    # the detection of the ignored box is dropped, the better scored
+    # detection of the first box is matched first
+    assert matches == [(4.0, False), (2.0, True), (1.0, False)]
+
+
+def test_average_precision():
+    assert wider_benchmark.average_precision(
+        [(3, True), (2, False), (1, True)], 4) == \
+        pytest.approx((2 / 3, 0.5, 0.25 + 0.25 * 2 / 3))
+    assert wider_benchmark.average_precision([], 4) == (0.0, 0.0, 0.0)
+
+
+class FakeDetector(object):
+    """detects the faces from the annotations"""
+    def __init__(self, faces):
+        self.faces = faces
+
+    def detect_faces_with_scores(self, image):
+        return self.faces, [1] * len(self.faces)
+
+
+def test_benchmark(tmp_path):
+    tmp_path.joinpath('images', '0--Parade').mkdir(parents=True)
+    cv2.imwrite(tmp_path.joinpath('images', '0--Parade', 'a.jpg').as_posix(),
+                numpy.zeros((200, 300), dtype=numpy.uint8))
+    annotation_path = tmp_path.joinpath('wider_face_val_bbx_gt.txt')
+    annotation_path.write_text('\n'.join([
+        '0--Parade/a.jpg', '2',
+        '10 10 60 60 0 0 0 0 0 0 ',
+        '100 100 20 20 2 0 0 0 0 0 ', '']))
+    annotations = wider.WIDERAnnotations(annotation_path.as_posix())
+    results = wider_benchmark.benchmark(
+        annotations, tmp_path.joinpath('images').as_posix(),
+        FakeDetector([(10, 10, 60, 60)]))
+    assert results['images'] == 1
+    assert results['detections'] == 1
+    assert set(results['timings']) == set(wider_benchmark.STAGES)
+    assert results['peak_memory'] > 0
+    # the small face only counts for the hard difficulty
+    assert results['difficulties']['easy'] == {
+        'faces': 1, 'precision': 1.0, 'recall': 1.0, 'ap': 1.0}
+    assert results['difficulties']['hard'] == {
+        'faces': 2, 'precision': 1.0, 'recall': 0.5, 'ap': 0.5}
+    assert 'images/s' in wider_benchmark.format_results(results)
+
+
+def test_benchmark_scale(tmp_path):
+    # the size of BMP images is not read from the header
+    tmp_path.joinpath('images', '0--Parade').mkdir(parents=True)
+    cv2.imwrite(tmp_path.joinpath('images', '0--Parade', 'a.bmp').as_posix(),
+                numpy.zeros((400, 600), dtype=numpy.uint8))
+    annotation_path = tmp_path.joinpath('wider_face_val_bbx_gt.txt')
+    annotation_path.write_text('\n'.join([
+        '0--Parade/a.bmp', '1', '10 10 60 60 0 0 0 0 0 0 ', '']))
+    annotations = wider.WIDERAnnotations(annotation_path.as_posix())
+    # the detection is in the coordinates of the resized image
+    results = wider_benchmark.benchmark(
+        annotations, tmp_path.joinpath('images').as_posix(),
+        FakeDetector([(5, 5, 30, 30)]), max_w_or_h=300)
+    assert results['difficulties']['easy']['recall'] == 1.0
@@ -0,0 +1,61 @@
+import cv2
+import numpy
+import pytest
+
+from pictool.datasets import wider
+from pictool.datasets import wider_loader
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    lines = []
+    tmp_path.joinpath('images', '0--Parade').mkdir(parents=True)
+    for i in range(5):
+        name = '0--Parade/{}.jpg'.format(i)
+        cv2.imwrite(tmp_path.joinpath('images', name).as_posix(),
+                    numpy.full((100, 200, 3), i, dtype=numpy.uint8))
+        lines.extend([name, '1', '{} 20 40 10 0 0 0 0 0 0 '.format(i)])
+    annotation_path = tmp_path.joinpath('wider_face_train_bbx_gt.txt')
+    annotation_path.write_text('\n'.join(lines) + '\n')
+    return (wider.WIDERAnnotations(annotation_path.as_posix()),
+            tmp_path.joinpath('images').as_posix())
+
+
+def test_iter_images(dataset):
+    items = list(wider_loader.iter_images(*dataset, max_w_or_h=100,
+                                          prefetch=2))
+    assert [name for name, _, _ in items] == [
+        '0--Parade/{}.jpg'.format(i) for i in range(5)]
+    for i, (_, image, boxes) in enumerate(items):
+        assert image.shape == (50, 100, 3)
+        assert boxes[['x', 'y', 'w', 'h']].tolist() == [
+            (round(i / 2), 10, 20, 5)]
+    # the annotations are not modified
+    assert dataset[0].boxes_array()['w'].tolist() == [40] * 5
+
+
+def test_iter_images_shards(dataset):
+    shards = [[name for name, _, _ in wider_loader.iter_images(
+        *dataset, grayscale=True, shard_index=i, shard_count=2)]
+        for i in range(2)]
+    assert shards == [['0--Parade/0.jpg', '0--Parade/2.jpg',
+                       '0--Parade/4.jpg'],
+                      ['0--Parade/1.jpg', '0--Parade/3.jpg']]
+    with pytest.raises(ValueError):
+        next(wider_loader.iter_images(*dataset, shard_index=2,
+                                      shard_count=2))
+
+
+def test_iter_batches(dataset):
+    batches = list(wider_loader.iter_batches(*dataset, batch_size=2,
+                                             size=(64, 32), grayscale=True))
+    assert [len(b.names) for b in batches] == [2, 2, 1]
+    assert batches[0].images.shape == (2, 32, 64)
+    assert batches[1].boxes[1][['w', 'h']].tolist() == [(13, 3)]
+
+
+def test_iter_images_missing_image(dataset, tmp_path):
+    annotations, images_dir = dataset
+    tmp_path.joinpath('images', '0--Parade', '3.jpg').unlink()
+    with pytest.raises(Exception):
+        list(wider_loader.iter_images(annotations, images_dir))
@@ -25,9 +25,14 @@ the data
 
 
 from enum import Enum
+import hashlib
+import json
 import os
+import shutil
 import sys
 
+import numpy
+
 
 class WIDERBBoxInfoBlur(Enum):
     CLEAR = 0
@@ -61,6 +66,22 @@ class WIDERBBoxInfoInvalid(Enum):
     TRUE = 1  # invalid image
 
 
+# the fields of a bounding box line (in file order)
+BBOX_FIELDS = ('x', 'y', 'w', 'h', 'blur', 'expression', 'illumination',
+               'invalid', 'occlusion', 'pose')
+# numpy dtype for bounding boxes (see WIDERAnnotations.boxes_array())
+BBOX_DTYPE = numpy.dtype([('image', numpy.int32),
+                          ('x', numpy.int32), ('y', numpy.int32),
+                          ('w', numpy.int32), ('h', numpy.int32),
+                          ('blur', numpy.int8), ('expression', numpy.int8),
+                          ('illumination', numpy.int8),
+                          ('invalid', numpy.int8), ('occlusion', numpy.int8),
+                          ('pose', numpy.int8)])
+
+
+_CACHE_VERSION = 1
+
+
 class WIDERBBoxInfo(object):
     """
     :py:class:`WIDERBBoxInfo` represent a bounding box expressed
@@ -73,21 +94,29 @@ class WIDERBBoxInfo(object):
     Number of bounding box
     x1, y1, w, h, blur, expression, illumination, invalid, occlusion, pose
     """
+    __slots__ = ('_x', '_y', '_width', '_height', '_blur', '_expression',
+                 '_illumination', '_invalid', '_occlusion', '_pose')
+
     def __init__(self, raw_data):
         """
         :param raw_data: a raw data string (eg. "78 238 14 17 2 0 0 0 0 0 ")
         """
-        self._raw_data = raw_data.strip().split()
-        self._x = int(self._raw_data[0])
-        self._y = int(self._raw_data[1])
-        self._width = int(self._raw_data[2])
-        self._height = int(self._raw_data[3])
-        self._blur = WIDERBBoxInfoBlur(int(self._raw_data[4]))
-        self._expression = WIDERBBoxInfoExpression(int(self._raw_data[5]))
-        self._illumination = WIDERBBoxInfoIllumination(int(self._raw_data[6]))
-        self._invalid = WIDERBBoxInfoInvalid(int(self._raw_data[7]))
-        self._occlusion = WIDERBBoxInfoOcclusion(int(self._raw_data[8]))
-        self._pose = WIDERBBoxInfoPose(int(self._raw_data[9]))
+        self._set_values(map(int, raw_data.split()[:10]))
+
+    def _set_values(self, values):
+        (self._x, self._y, self._width, self._height, self._blur,
+         self._expression, self._illumination, self._invalid,
+         self._occlusion, self._pose) = values
+
+    @classmethod
+    def from_values(cls, values):
+        """
+        create a box from the values of a bounding box line
+        :param values: sequence of ints (in the order of BBOX_FIELDS)
+        """
+        box = cls.__new__(cls)
+        box._set_values(values)
+        return box
 
     @property
     def x(self):
@@ -105,9 +134,29 @@ class WIDERBBoxInfo(object):
     def h(self):
         return self._height
 
+    @property
+    def blur(self):
+        return WIDERBBoxInfoBlur(self._blur)
+
+    @property
+    def expression(self):
+        return WIDERBBoxInfoExpression(self._expression)
+
+    @property
+    def illumination(self):
+        return WIDERBBoxInfoIllumination(self._illumination)
+
     @property
     def invalid(self):
-        return self._invalid
+        return WIDERBBoxInfoInvalid(self._invalid)
+
+    @property
+    def occlusion(self):
+        return WIDERBBoxInfoOcclusion(self._occlusion)
+
+    @property
+    def pose(self):
+        return WIDERBBoxInfoPose(self._pose)
 
     def __str__(self):
         return u'{} x: {} y: {} width: {} heigth: {} {}'.format(
@@ -115,15 +164,173 @@ class WIDERBBoxInfo(object):
             self.invalid)
 
 
+def _file_hash(path):
+    """get the sha256 hex digest of the file content"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
 class WIDERAnnotations(object):
-    def __init__(self, annotation_path):
+    """
+    The annotations of a WIDER FACE split. The file is indexed once when
+    loading, the bounding boxes are parsed when they are requested.
+
+    With cache=True, the parsed annotations are written to a binary cache
+    (a directory with .npy files) next to the annotation file. The cache is
+    used as long as the annotation file did not change and is memory-mapped,
+    so multiple processes share the same pages.
+    """
+    def __init__(self, annotation_path, cache=False, cache_path=None):
         """
         :param annotation_path: the filesystem path to the annotation file
                                 (eg wider_face_train_bbx_gt.txt)
+        :param cache: use (and write) a binary cache of the annotations
+        :param cache_path: the cache directory. Defaults to the annotation
+                           path with a ".cache" suffix
         """
         self._annotation_path = annotation_path
+        self._cache_path = cache_path or annotation_path + '.cache'
+        # the text lines (None if the cache is used)
+        self._annotations = None
+        # the image names (as given in the file) and the index of the first
+        # box of each image in boxes_array() (with the total number of
+        # boxes as last element)
+        self._names = []
+        self._offsets = [0]
+        # the index of the first box line for each image
+        self._starts = []
+        self._boxes = None
+        if not (cache and self._load_cache()):
+            self._load_text()
+            if cache:
+                self._write_cache()
+        # image basename -> image index
+        self._index = {os.path.basename(name): i
+                       for i, name in enumerate(self._names)}
+
+    def _load_text(self):
         with open(self._annotation_path, 'r') as f:
             self._annotations = f.read().splitlines()
+        i = 0
+        while i < len(self._annotations):
+            name = self._annotations[i].strip()
+            if not name:
+                i += 1
+                continue
+            try:
+                count = int(self._annotations[i + 1])
+            except (IndexError, ValueError):
+                raise Exception('Invalid box count for "{}" in "{}"'.format(
+                    name, self._annotation_path))
+            self._names.append(name)
+            self._starts.append(i + 2)
+            self._offsets.append(self._offsets[-1] + count)
+            # images without boxes still have a line with zeros
+            i += 2 + max(count, 1)
+
+    def _source_info(self):
+        st = os.stat(self._annotation_path)
+        return {'size': st.st_size, 'mtime': st.st_mtime_ns}
+
+    def _load_cache(self):
+        """
+        load the cache if it is valid for the annotation file
+        :returns: True if the cache was loaded
+        """
+        meta_path = os.path.join(self._cache_path, 'meta.json')
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if meta.get('version') != _CACHE_VERSION:
+            return False
+        source = self._source_info()
+        if (meta['size'], meta['mtime']) != (source['size'],
+                                             source['mtime']):
+            # the file might have been copied or touched
+            if meta['size'] != source['size'] or \
+               meta['sha256'] != _file_hash(self._annotation_path):
+                return False
+        try:
+            offsets = numpy.load(
+                os.path.join(self._cache_path, 'offsets.npy'), mmap_mode='r')
+            if offsets[-1]:
+                boxes = numpy.load(
+                    os.path.join(self._cache_path, 'boxes.npy'),
+                    mmap_mode='r')
+            else:
+                # an empty array can not be memory-mapped
+                boxes = numpy.zeros(0, dtype=BBOX_DTYPE)
+            with open(os.path.join(self._cache_path, 'names.txt'), 'r',
+                      encoding='utf-8') as f:
+                names = f.read().split('\n') if meta['images'] else []
+        except OSError:
+            # the cache was replaced by another process meanwhile
+            return False
+        self._boxes = boxes
+        self._names = names
+        self._offsets = offsets
+        return True
+
+    def _write_cache(self):
+        """write the cache. The files are written to a temporary directory
+        which replaces the cache directory, so readers never see a partial
+        cache"""
+        boxes = self.boxes_array()
+        meta = self._source_info()
+        meta.update({'version': _CACHE_VERSION,
+                     'sha256': _file_hash(self._annotation_path),
+                     'images': len(self._names)})
+        tmp_path = '{}.tmp{}'.format(self._cache_path, os.getpid())
+        os.makedirs(tmp_path, exist_ok=True)
+        numpy.save(os.path.join(tmp_path, 'boxes.npy'), boxes)
+        numpy.save(os.path.join(tmp_path, 'offsets.npy'),
+                   numpy.array(self._offsets, dtype=numpy.int64))
+        with open(os.path.join(tmp_path, 'names.txt'), 'w',
+                  encoding='utf-8') as f:
+            f.write('\n'.join(self._names))
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        # move the old cache aside (a rename is atomic, removing the files
+        # is not), so the cache directory is either complete or missing
+        old_path = '{}.old{}'.format(self._cache_path, os.getpid())
+        try:
+            os.rename(self._cache_path, old_path)
+        except OSError:
+            # no old cache (or another process moved it)
+            old_path = None
+        try:
+            os.rename(tmp_path, self._cache_path)
+        except OSError:
+            # another process was faster
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        if old_path:
+            shutil.rmtree(old_path, ignore_errors=True)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __contains__(self, image_name):
+        return os.path.basename(image_name) in self._index
+
+    def _image_index(self, image_name):
+        try:
+            return self._index[os.path.basename(image_name)]
+        except KeyError:
+            raise Exception('Image name "{}" not found in "{}"'.format(
+                image_name, self._annotation_path))
+
+    def image_names(self):
+        """:returns: list -- of the image names (relative paths) in the
+        order of the annotation file"""
+        return list(self._names)
 
     def bounding_boxes(self, image_name):
         """
@@ -134,15 +341,58 @@ class WIDERAnnotations(object):
         image name
         :raises: Exception
         """
-        boxes = []
-        for i, line in enumerate(self._annotations):
-            if line.endswith(os.path.basename(image_name)):
-                boxes_count = int(self._annotations[i + 1])
-                for b in range(0, boxes_count):
-                    boxes.append(WIDERBBoxInfo(self._annotations[i + 2 + b]))
-                return boxes
-        raise Exception('Image name "{}" not found in "{}"'.format(
-            image_name, self._annotation_path))
+        i = self._image_index(image_name)
+        count = self._offsets[i + 1] - self._offsets[i]
+        if self._annotations is None:
+            boxes = self._boxes[self._offsets[i]:self._offsets[i + 1]]
+            return [WIDERBBoxInfo.from_values(values)
+                    for values in boxes[list(BBOX_FIELDS)].tolist()]
+        start = self._starts[i]
+        return [WIDERBBoxInfo(line) for line in
+                self._annotations[start:start + count]]
+
+    def _parse_boxes(self, images):
+        """parse the box lines of the given image indices into an array
+        of BBOX_DTYPE"""
+        lines = []
+        image_ids = []
+        for i in images:
+            start = self._starts[i]
+            count = self._offsets[i + 1] - self._offsets[i]
+            lines.extend(self._annotations[start:start + count])
+            image_ids.extend([i] * count)
+        values = numpy.fromstring(' '.join(lines), dtype=numpy.int32,
+                                  sep=' ')
+        # every box line has exactly one value per field
+        if len(values) != len(lines) * len(BBOX_FIELDS):
+            raise Exception('Invalid bounding box line(s) in "{}"'.format(
+                self._annotation_path))
+        values = values.reshape(-1, len(BBOX_FIELDS))
+        boxes = numpy.zeros(len(lines), dtype=BBOX_DTYPE)
+        boxes['image'] = image_ids
+        for column, field in enumerate(BBOX_FIELDS):
+            boxes[field] = values[:, column]
+        return boxes
+
+    def boxes_array(self, image_name=None):
+        """
+        get the bounding boxes as numpy structured array (see BBOX_DTYPE).
+        The 'image' field is the index of the image in
+        :py:meth:`image_names`
+        :param image_name: the name of the image or a full path to the
+                           image. If not given, the boxes of all images are
+                           returned
+        :returns: numpy.ndarray
+        :raises: Exception
+        """
+        if image_name is None:
+            if self._boxes is None:
+                self._boxes = self._parse_boxes(range(len(self._names)))
+            return self._boxes
+        i = self._image_index(image_name)
+        if self._boxes is not None:
+            return self._boxes[self._offsets[i]:self._offsets[i + 1]]
+        return self._parse_boxes([i])
 
 
 # for debugging
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Evaluate the speed and the accuracy of the face detection with the
+WIDER FACE dataset.
+
+The detections are matched to the ground truth boxes by IoU. Invalid
+ground truth boxes and boxes which don't belong to a difficulty are
+ignored: detections matching them are neither true nor false positives.
+"""
+
+import os
+import resource
+import time
+
+import numpy
+
+import pictool.utils_opencv as utils_opencv
+from pictool.datasets import wider
+
+
+# the WIDER FACE evaluation uses difficulty lists which are not part of the
+# annotation files. These approximate them with the box attributes
+def _easy(boxes):
+    clear = boxes['blur'] != wider.WIDERBBoxInfoBlur.HEAVY.value
+    visible = boxes['occlusion'] == wider.WIDERBBoxInfoOcclusion.NO.value
+    return (boxes['h'] >= 50) & clear & visible
+
+
+def _medium(boxes):
+    visible = boxes['occlusion'] != wider.WIDERBBoxInfoOcclusion.HEAVY.value
+    return (boxes['h'] >= 30) & visible
+
+
+def _hard(boxes):
+    return numpy.ones(len(boxes), dtype=bool)
+
+
+# difficulty -> function which returns a boolean mask of the boxes (an
+# array of BBOX_DTYPE) which belong to the difficulty
+DIFFICULTIES = {'easy': _easy, 'medium': _medium, 'hard': _hard}
+
+STAGES = ('decode', 'resize', 'detect')
+
+
+def box_iou(box, boxes):
+    """
+    get the intersection over union of a box with other boxes
+    :param box: a (x, y, w, h) box
+    :param boxes: numpy array of shape (N, 4) with (x, y, w, h) boxes
+    :returns: numpy array with N IoU values
+    """
+    boxes = numpy.asarray(boxes, dtype=numpy.float64).reshape(-1, 4)
+    x1 = numpy.maximum(box[0], boxes[:, 0])
+    y1 = numpy.maximum(box[1], boxes[:, 1])
+    x2 = numpy.minimum(box[0] + box[2], boxes[:, 0] + boxes[:, 2])
+    y2 = numpy.minimum(box[1] + box[3], boxes[:, 1] + boxes[:, 3])
+    intersection = numpy.clip(x2 - x1, 0, None) * numpy.clip(y2 - y1, 0, None)
+    union = box[2] * box[3] + boxes[:, 2] * boxes[:, 3] - intersection
+    return numpy.divide(intersection, union,
+                        out=numpy.zeros_like(intersection), where=union > 0)
+
+
+def match_detections(detections, scores, gt_boxes, ignore,
+                     iou_threshold=0.5):
+    """
+    match the detections of an image to the ground truth boxes. Detections
+    with a higher score are matched first, each ground truth box is matched
+    at most once
+    :param detections: list of (x, y, w, h) detected boxes
+    :param scores: the scores of the detections
+    :param gt_boxes: numpy array of shape (N, 4) with the ground truth boxes
+    :param ignore: boolean numpy array. True for ground truth boxes which
+                   should be ignored
+    :param iou_threshold: the minimum IoU for a match
+    :returns: list of (score, is_true_positive) tuples. Detections which
+              match an ignored box are not included
+    """
+    matched = numpy.zeros(len(gt_boxes), dtype=bool)
+    results = []
+    for i in numpy.argsort(-numpy.asarray(scores, dtype=numpy.float64),
+                           kind='stable'):
+        iou = box_iou(detections[i], gt_boxes)
+        candidates = numpy.where(~matched & ~ignore & (iou >= iou_threshold),
+                                 iou, -1)
+        if len(candidates) and candidates.max() >= 0:
+            matched[int(numpy.argmax(candidates))] = True
+            results.append((float(scores[i]), True))
+        elif not numpy.any(ignore & (iou >= iou_threshold)):
+            results.append((float(scores[i]), False))
+    return results
+
+
+def average_precision(matches, gt_count):
+    """
+    get precision, recall and (all point interpolated) average precision
+    :param matches: list of (score, is_true_positive) tuples over all images
+    :param gt_count: the number of (not ignored) ground truth boxes
+    :returns: tuple of (precision, recall, average precision) with all
+              detections
+    """
+    if not matches or not gt_count:
+        return 0.0, 0.0, 0.0
+    scores = numpy.array([m[0] for m in matches])
+    tp = numpy.array([m[1] for m in matches], dtype=numpy.float64)
+    order = numpy.argsort(-scores, kind='stable')
+    tp_sum = numpy.cumsum(tp[order])
+    fp_sum = numpy.cumsum(1 - tp[order])
+    recall = tp_sum / gt_count
+    precision = tp_sum / (tp_sum + fp_sum)
+    # precision envelope, then the area under the recall steps
+    envelope = numpy.maximum.accumulate(precision[::-1])[::-1]
+    recall_steps = numpy.diff(numpy.concatenate([[0.0], recall]))
+    ap = float(numpy.sum(recall_steps * envelope))
+    return float(precision[-1]), float(recall[-1]), ap
+
+
+def _peak_memory():
+    """get the peak resident set size of the process in bytes"""
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def benchmark(annotations, images_dir, detector, max_w_or_h=4096,
+              iou_threshold=0.5, limit=None):
+    """
+    run the face detector over the images of a WIDER FACE split
+    :param annotations: a :py:class:`wider.WIDERAnnotations` object
+    :param images_dir: the directory with the images of the split (eg.
+                       WIDER_val/images)
+    :param detector: a :py:class:`pictool.utils_opencv.FaceDetector`
+    :param max_w_or_h: The maximum width or height (in px) of the image
+                       used for the detection
+    :param iou_threshold: the minimum IoU to match a detection to a box
+    :param limit: only use the first limit images
+    :returns: dict with the results
+    """
+    timings = dict.fromkeys(STAGES, 0.0)
+    matches = {d: [] for d in DIFFICULTIES}
+    gt_counts = dict.fromkeys(DIFFICULTIES, 0)
+    images = annotations.image_names()[:limit]
+    detection_count = 0
+    start = time.perf_counter()
+    for image_name in images:
+        image_path = os.path.join(images_dir, image_name)
+
+        # the same steps as utils_opencv.read_image_for_detection()
+        t = time.perf_counter()
+        image, original_max_dim = utils_opencv.decode_image_for_detection(
+            image_path, max_w_or_h)
+        timings['decode'] += time.perf_counter() - t
+
+        t = time.perf_counter()
+        image_resize = utils_opencv._image_resize(image, max_w_or_h)
+        timings['resize'] += time.perf_counter() - t
+
+        t = time.perf_counter()
+        faces, scores = detector.detect_faces_with_scores(image_resize)
+        timings['detect'] += time.perf_counter() - t
+
+        # map the detections to the original image coordinates
+        scale = original_max_dim / max(image_resize.shape[:2])
+        detections = [tuple(v * scale for v in face) for face in faces]
+        detection_count += len(detections)
+
+        boxes = annotations.boxes_array(image_name)
+        gt_boxes = numpy.stack([boxes['x'], boxes['y'],
+                                boxes['w'], boxes['h']], axis=-1)
+        invalid = boxes['invalid'] == wider.WIDERBBoxInfoInvalid.TRUE.value
+        for difficulty, select in DIFFICULTIES.items():
+            ignore = invalid | ~select(boxes)
+            gt_counts[difficulty] += int(numpy.count_nonzero(~ignore))
+            matches[difficulty].extend(match_detections(
+                detections, scores, gt_boxes, ignore, iou_threshold))
+    duration = time.perf_counter() - start
+
+    results = {
+        'images': len(images),
+        'detections': detection_count,
+        'duration': duration,
+        'images_per_second': len(images) / duration if duration else 0.0,
+        'timings': timings,
+        'peak_memory': _peak_memory(),
+        'difficulties': {},
+    }
+    for difficulty in DIFFICULTIES:
+        precision, recall, ap = average_precision(matches[difficulty],
+                                                  gt_counts[difficulty])
+        results['difficulties'][difficulty] = {
+            'faces': gt_counts[difficulty], 'precision': precision,
+            'recall': recall, 'ap': ap}
+    return results
+
+
+def format_results(results):
+    """format the results of :py:func:`benchmark` as text"""
+    lines = ['{} image(s), {} detection(s) in {:.2f}s '
+             '({:.2f} images/s)'.format(
+                 results['images'], results['detections'],
+                 results['duration'], results['images_per_second'])]
+    lines.append('{:<10} {:>10} {:>14}'.format('stage', 'total [s]',
+                                               'per image [ms]'))
+    for stage in STAGES:
+        total = results['timings'][stage]
+        lines.append('{:<10} {:>10.3f} {:>14.2f}'.format(
+            stage, total, total * 1000 / max(results['images'], 1)))
+    lines.append('peak memory: {:.1f} MiB'.format(
+        results['peak_memory'] / 2 ** 20))
+    lines.append('{:<10} {:>8} {:>10} {:>8} {:>8}'.format(
+        'difficulty', 'faces', 'precision', 'recall', 'AP'))
+    for difficulty, r in results['difficulties'].items():
+        lines.append('{:<10} {:>8} {:>10.3f} {:>8.3f} {:>8.3f}'.format(
+            difficulty, r['faces'], r['precision'], r['recall'], r['ap']))
+    return '\n'.join(lines)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Load the images and bounding boxes of a WIDER FACE split to feed a
+training or evaluation loop.
+
+The images are decoded by a pool of threads (openCV releases the GIL while
+decoding) which stays a bounded number of images ahead of the consumer.
+"""
+
+import collections
+import concurrent.futures
+import os
+
+import cv2
+import numpy
+
+
+WIDERBatch = collections.namedtuple('WIDERBatch', ['names', 'images',
+                                                   'boxes'])
+
+
+def _scale_boxes(boxes, scale_x, scale_y):
+    """get a copy of the boxes (BBOX_DTYPE) with scaled coordinates"""
+    boxes = numpy.array(boxes)
+    for field, scale in (('x', scale_x), ('y', scale_y),
+                         ('w', scale_x), ('h', scale_y)):
+        boxes[field] = numpy.round(boxes[field] * scale)
+    return boxes
+
+
+def _load(image_path, boxes, size, max_w_or_h, flags):
+    """read and resize a single image and scale its boxes accordingly"""
+    image = cv2.imread(image_path, flags)
+    if image is None:
+        raise Exception("Can not read image '%s'" % (image_path))
+    height, width = image.shape[:2]
+    if size:
+        new_width, new_height = size
+    elif max_w_or_h and max(width, height) > max_w_or_h:
+        scale = max_w_or_h / max(width, height)
+        new_width, new_height = int(width * scale), int(height * scale)
+    else:
+        return image, numpy.array(boxes)
+    image = cv2.resize(image, (new_width, new_height),
+                       interpolation=cv2.INTER_AREA)
+    return image, _scale_boxes(boxes, new_width / width,
+                               new_height / height)
+
+
+def iter_images(annotations, images_dir, size=None, max_w_or_h=None,
+                grayscale=False, workers=4, prefetch=16, shard_index=0,
+                shard_count=1, limit=None):
+    """
+    iterate over the images of a WIDER FACE split
+
+    :param annotations: a :py:class:`pictool.datasets.wider.WIDERAnnotations`
+    :param images_dir: the directory with the images of the split (eg.
+                       WIDER_train/images)
+    :param size: optional (width, height) tuple. The images are resized to
+                 exactly this size
+    :param max_w_or_h: optional maximum width or height [px]. Larger images
+                       are downscaled (keeping the aspect ratio). Ignored if
+                       size is given
+    :param grayscale: decode the images as grayscale images
+    :param workers: the number of decoding threads
+    :param prefetch: the maximum number of images which are decoded ahead of
+                     the consumer. This bounds the memory usage
+    :param shard_index: the index of this worker if the split is sharded
+    :param shard_count: the number of shards. Every shard_count-th image
+                        (starting at shard_index) is used
+    :param limit: only use the first limit images (before sharding)
+    :returns: generator of (image name, image, boxes) tuples. The boxes are
+              an array of BBOX_DTYPE, scaled to the image size
+    """
+    if not 0 <= shard_index < shard_count:
+        raise ValueError('shard_index must be >= 0 and < shard_count')
+    flags = cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR
+    names = annotations.image_names()[:limit][shard_index::shard_count]
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    pending = collections.deque()
+    try:
+        for name in names:
+            pending.append((name, executor.submit(
+                _load, os.path.join(images_dir, name),
+                annotations.boxes_array(name), size, max_w_or_h, flags)))
+            if len(pending) >= max(prefetch, 1):
+                name_done, future = pending.popleft()
+                yield (name_done,) + future.result()
+        while pending:
+            name_done, future = pending.popleft()
+            yield (name_done,) + future.result()
+    finally:
+        # the consumer might stop early. Only the pending futures can be
+        # queued (cancel_futures needs python 3.9)
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def iter_batches(annotations, images_dir, batch_size=16, **kwargs):
+    """
+    iterate over the images of a WIDER FACE split in batches.
+    See :py:func:`iter_images` for the keyword arguments
+    :returns: generator of :py:class:`WIDERBatch` tuples. images is a numpy
+              array of shape (batch size, height, width[, 3]) if all images
+              have the same size (eg. with size) or a list otherwise. boxes
+              is a list with one box array per image. The last batch might
+              be smaller
+    """
+    batch = []
+    for item in iter_images(annotations, images_dir, **kwargs):
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield _make_batch(batch)
+            batch = []
+    if batch:
+        yield _make_batch(batch)
+
+
+def _make_batch(items):
+    names, images, boxes = (list(x) for x in zip(*items))
+    if len(set(image.shape for image in images)) == 1:
+        images = numpy.stack(images)
+    return WIDERBatch(names, images, boxes)
@@ -1,4 +1,5 @@
 from argparse import Namespace
+import json
 import pytest
 import pictool
 from datetime import datetime
@@ -43,3 +44,423 @@ def test_image_rename_by_filename_path_exists(tmp_path):
     assert renamed_path_exists.is_file()
     # old file should not be there
     assert not orig_path.exists()
+
+
+def test_image_rename_by_filename_jobs(tmp_path):
+    names = ['2022-01-20_18:07:5{}_7700.jpg'.format(i) for i in range(5)]
+    for name in names:
+        tmp_path.joinpath(name).touch()
+    assert pictool.image_rename(
+        Namespace(output_format_date='%Y%m%d_%H%M%S',
+                  output_format_prefix='IMG_', jobs=2,
+                  path=[tmp_path.as_posix()])) == 0
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        'IMG_20220120_18075{}.jpg'.format(i) for i in range(5)]
+
+
+def _fail_on_odd(args, path):
+    if int(Path(path).stem) % 2:
+        raise ValueError('odd')
+    return Path(path).stem
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test__map_paths(tmp_path, jobs):
+    paths = []
+    for i in range(6):
+        paths.append(tmp_path.joinpath('{}.jpg'.format(i)))
+        paths[-1].touch()
+    errors = []
+    results = list(pictool._map_paths(
+        _fail_on_odd, Namespace(jobs=jobs,
+                                path=[p.as_posix() for p in paths]),
+        errors))
+    assert [r for _, r in results] == ['0', '2', '4']
+    assert [Path(p).name for p, _ in errors] == ['1.jpg', '3.jpg', '5.jpg']
+    assert pictool._report_errors(errors) == 1
+
+
+def test_image_rename_from_catalog(tmp_path):
+    images = tmp_path.joinpath('images')
+    images.mkdir()
+    orig_path = images.joinpath('2022-01-20_18:07:50_7700.jpg')
+    orig_path.touch()
+    catalog = tmp_path.joinpath('catalog.sqlite').as_posix()
+    assert pictool.catalog_update(Namespace(catalog=catalog,
+                                            path=[images.as_posix()])) == 0
+    pictool.image_rename(Namespace(output_format_date='%Y%m%d_%H%M%S',
+                                   output_format_prefix='IMG_',
+                                   catalog=catalog, from_catalog=True,
+                                   path=[images.as_posix()]))
+    renamed_path = images.joinpath('IMG_20220120_180750.jpg')
+    assert renamed_path.is_file()
+    assert not orig_path.exists()
+    with pictool.utils_catalog.Catalog(catalog) as c:
+        assert c.get(renamed_path.as_posix()) is not None
+        assert c.get(orig_path.as_posix()) is None
+
+
+def test_catalog_update_filtered(tmp_path):
+    images = tmp_path.joinpath('images')
+    images.mkdir()
+    for name in ('a.jpg', 'b.jpg'):
+        images.joinpath(name).touch()
+    catalog = tmp_path.joinpath('catalog.sqlite').as_posix()
+    assert pictool.catalog_update(Namespace(catalog=catalog,
+                                            path=[images.as_posix()])) == 0
+    # the records of the files which are not included are kept
+    assert pictool.catalog_update(Namespace(catalog=catalog,
+                                            path=[images.as_posix()],
+                                            include=['a.*'])) == 0
+    with pictool.utils_catalog.Catalog(catalog) as c:
+        assert c.get(images.joinpath('b.jpg').as_posix()) is not None
+
+
+class FakeMetadata(object):
+    """a minimal in-memory replacement for GExiv2.Metadata"""
+    def __init__(self, gps=(0, 0, 0), date_time=None):
+        self.gps = gps
+        self.date_time = date_time
+        self.tags = {}
+        self.saved = 0
+
+    def get_gps_info(self):
+        return self.gps
+
+    def set_gps_info(self, longitude, latitude, altitude):
+        self.gps = (longitude, latitude, altitude)
+
+    def get_date_time(self):
+        if self.date_time is None:
+            raise KeyError('Exif.Photo.DateTimeOriginal')
+        return self.date_time
+
+    def set_tag_string(self, tag, value):
+        self.tags[tag] = value
+
+    def get_tag_string(self, tag):
+        return self.tags[tag]
+
+    def has_tag(self, tag):
+        return tag in self.tags
+
+    def clear_tag(self, tag):
+        return self.tags.pop(tag, None) is not None
+
+    def get_exif_tags(self):
+        return [t for t in self.tags if t.startswith('Exif.')]
+
+    def get_iptc_tags(self):
+        return [t for t in self.tags if t.startswith('Iptc.')]
+
+    def get_xmp_tags(self):
+        return [t for t in self.tags if t.startswith('Xmp.')]
+
+    def get_tag_interpreted_string(self, tag):
+        return self.tags[tag]
+
+    def get_tag_type(self, tag):
+        return 'Ascii'
+
+    def save_file(self, path):
+        self.saved += 1
+        return True
+
+
+def test_pipeline(tmp_path, monkeypatch):
+    orig_path = tmp_path.joinpath('photo.jpg')
+    orig_path.touch()
+    metadata = FakeMetadata(date_time=datetime(2022, 1, 20, 18, 7, 50))
+    monkeypatch.setattr(pictool.utils_gexiv, 'get_metadata',
+                        lambda path: metadata)
+    lookups = []
+
+    def _reverse_geocode(longitude, latitude):
+        lookups.append((longitude, latitude))
+        return {'address': {'country_code': 'de', 'city': 'Bonn'}}
+
+    monkeypatch.setattr(pictool, '_get_reverse_geocoder',
+                        lambda *args: _reverse_geocode)
+    assert pictool.pipeline(Namespace(
+        operations='gps-set,location-set,image-rename',
+        longitude=7.1, latitude=50.7, altitude=60.0, force=False,
+        email=None, no_cache=True, geocoder='nominatim',
+        output_format_date='%Y%m%d_%H%M%S', output_format_prefix='IMG_',
+        path=[tmp_path.as_posix()])) == 0
+    assert lookups == [(7.1, 50.7)]
+    assert metadata.tags == {
+        'Iptc.Application2.CountryCode': 'de',
+        'Xmp.iptcExt.CountryCode': 'de',
+        'Iptc.Application2.City': 'Bonn',
+        'Xmp.iptcExt.City': 'Bonn'}
+    # all operations are saved at once
+    assert metadata.saved == 1
+    assert tmp_path.joinpath('IMG_20220120_180750.jpg').is_file()
+    assert not orig_path.exists()
+
+
+def test_pipeline_rename_planned(tmp_path, monkeypatch):
+    tmp_path.joinpath('a.jpg').write_text('a')
+    tmp_path.joinpath('IMG_20220120_180750_1.jpg').write_text('b')
+    tmp_path.joinpath('IMG_20220120_180750_2.jpg').write_text('c')
+    monkeypatch.setattr(
+        pictool.utils_gexiv, 'get_metadata',
+        lambda path: FakeMetadata(date_time=datetime(2022, 1, 20, 18, 7, 50)))
+    assert pictool.pipeline(Namespace(
+        operations='image-rename', output_format_date='%Y%m%d_%H%M%S',
+        output_format_prefix='IMG_', path=[tmp_path.as_posix()])) == 0
+    # like image-rename, a file which already has a valid name keeps it
+    assert [(p.name, p.read_text()) for p in sorted(tmp_path.iterdir())] == [
+        ('IMG_20220120_180750.jpg', 'a'), ('IMG_20220120_180750_1.jpg', 'b'),
+        ('IMG_20220120_180750_2.jpg', 'c')]
+
+
+def test_pipeline_unknown_operation():
+    with pytest.raises(Exception):
+        pictool.pipeline(Namespace(operations='gps-set,unknown',
+                                   path=['.']))
+
+
+def test_image_region_import_export(tmp_path, monkeypatch):
+    paths = [tmp_path.joinpath(name) for name in ('a.jpg', 'b.jpg')]
+    metadata = {}
+    for path in paths:
+        path.touch()
+        metadata[path.as_posix()] = FakeMetadata()
+        # an existing region
+        metadata[path.as_posix()].tags[pictool.REGION_LIST_TAG] = ''
+        for key in ('x', 'y', 'w', 'h'):
+            metadata[path.as_posix()].tags[
+                pictool.REGION_LIST_TAG + '[1]/mwg-rs:Area/stArea:' + key] = \
+                '1.5'
+    monkeypatch.setattr(pictool.utils_gexiv, 'get_metadata',
+                        lambda path: metadata[path])
+    input_path = tmp_path.joinpath('regions.csv')
+    input_path.write_text(
+        'path,x,y,w,h,name,type\n'
+        '{0},10,20,30,40,Alice,Face\n'
+        '{1},1,2,3,4,,\n'
+        '{0},50,60,70,80,Bob,Face\n'.format(*paths))
+    assert pictool.image_region_import(Namespace(
+        input=input_path.as_posix(), format='auto', replace=False)) == 0
+    # every file is saved once
+    assert [m.saved for m in metadata.values()] == [1, 1]
+
+    output_path = tmp_path.joinpath('regions.jsonl')
+    assert pictool.image_region_export(Namespace(
+        output=output_path.as_posix(), path=[paths[0].as_posix()])) == 0
+    records = [json.loads(line)
+               for line in output_path.read_text().splitlines()]
+    assert records == [
+        {'path': paths[0].as_posix(), 'region': 1,
+         'w': 1.5, 'h': 1.5, 'x': 1.5, 'y': 1.5},
+        {'path': paths[0].as_posix(), 'region': 2, 'unit': 'pixel',
+         'w': 30, 'h': 40, 'x': 10, 'y': 20, 'name': 'Alice',
+         'type': 'Face'},
+        {'path': paths[0].as_posix(), 'region': 3, 'unit': 'pixel',
+         'w': 70, 'h': 80, 'x': 50, 'y': 60, 'name': 'Bob',
+         'type': 'Face'}]
+
+    # import the export again and replace the existing regions
+    assert pictool.image_region_import(Namespace(
+        input=output_path.as_posix(), format='auto', replace=True)) == 0
+    assert sorted(pictool._region_tags(metadata[paths[0].as_posix()])) == \
+        [1, 2, 3]
+
+
+def test_image_region_import_missing_keys(tmp_path):
+    input_path = tmp_path.joinpath('regions.jsonl')
+    input_path.write_text('{"path": "a.jpg", "x": 1}\n')
+    with pytest.raises(Exception):
+        pictool.image_region_import(Namespace(
+            input=input_path.as_posix(), format='auto', replace=False))
+
+
+def test_image_rename_dry_run_and_undo(tmp_path):
+    orig_path = tmp_path.joinpath('2022-01-20_18:07:50_7700.jpg')
+    orig_path.touch()
+    journal = tmp_path.joinpath('journal.jsonl').as_posix()
+    args = Namespace(output_format_date='%Y%m%d_%H%M%S',
+                     output_format_prefix='IMG_', journal=journal,
+                     dry_run=True, undo=False, path=[orig_path.as_posix()])
+    pictool.image_rename(args)
+    assert orig_path.is_file()
+    args.dry_run = False
+    pictool.image_rename(args)
+    assert not orig_path.exists()
+    args.undo = True
+    pictool.image_rename(args)
+    assert orig_path.is_file()
+    assert not tmp_path.joinpath('IMG_20220120_180750.jpg').exists()
+
+
+def test_md_tag_list_jsonl(tmp_path, monkeypatch, capsys):
+    tmp_path.joinpath('a.jpg').touch()
+    metadata = FakeMetadata()
+    metadata.tags = {'Exif.Image.Make': 'Foo', 'Exif.GPSInfo.GPSLatitude': '1',
+                     'Iptc.Application2.City': 'Bonn', 'Xmp.dc.title': 'x'}
+    monkeypatch.setattr(pictool.utils_gexiv, 'get_metadata',
+                        lambda path: metadata)
+    args = pictool.parse_args().parse_args([
+        'md-tag-list', '--format', 'jsonl', '--tags', 'Xmp.dc.title,Xmp.no',
+        '--tag-prefix', 'Exif.GPSInfo.', tmp_path.as_posix()])
+    assert pictool.md_tag_list(args) == 0
+    records = [json.loads(line)
+               for line in capsys.readouterr().out.splitlines()]
+    assert records == [{
+        'path': tmp_path.joinpath('a.jpg').as_posix(),
+        'tags': {'Xmp.dc.title': 'x', 'Exif.GPSInfo.GPSLatitude': '1'}}]
+
+
+def test_gps_get_jsonl(tmp_path, monkeypatch, capsys):
+    for name in ('a.jpg', 'b.jpg'):
+        tmp_path.joinpath(name).touch()
+    monkeypatch.setattr(
+        pictool, '_get_read_metadata', lambda args, path: FakeMetadata(
+            gps=(7.1, 50.7, 60.0) if path.endswith('a.jpg') else (0, 0, 0)))
+    args = pictool.parse_args().parse_args([
+        'gps-get', '--format', 'jsonl', tmp_path.as_posix()])
+    assert pictool.gps_get(args) == 0
+    records = [json.loads(line)
+               for line in capsys.readouterr().out.splitlines()]
+    assert sorted(records, key=lambda r: r['path']) == [
+        {'path': tmp_path.joinpath('a.jpg').as_posix(),
+         'gps': {'longitude': 7.1, 'latitude': 50.7, 'altitude': 60.0}},
+        {'path': tmp_path.joinpath('b.jpg').as_posix(), 'gps': None}]
+
+
+def test_gps_get_jsonl_rate_limited(tmp_path, monkeypatch, capsys):
+    tmp_path.joinpath('a.jpg').touch()
+    monkeypatch.setattr(
+        pictool, '_get_read_metadata',
+        lambda args, path: FakeMetadata(gps=(7.1, 50.7, 60.0)))
+    monkeypatch.setattr(
+        pictool, '_get_location_data',
+        lambda client, longitude, latitude, cache: {
+            'address': {'city': 'Bonn'}})
+    # the message about the limited rate must not be in the JSON lines
+    args = pictool.parse_args().parse_args([
+        'gps-get', '--format', 'jsonl', '--include-address', '--no-cache',
+        '--nominatim-rate', '10', tmp_path.as_posix()])
+    assert pictool.gps_get(args) == 0
+    captured = capsys.readouterr()
+    assert [json.loads(line)['address'] for line in
+            captured.out.splitlines()] == [{'city': 'Bonn'}]
+    assert 'Limiting the rate' in captured.err
+
+
+@pytest.mark.parametrize('pipeline_depth', [0, 2])
+def test_location_set(tmp_path, monkeypatch, pipeline_depth):
+    names = ['{}.jpg'.format(i) for i in range(5)]
+    for name in names:
+        tmp_path.joinpath(name).touch()
+    # every second file has GPS data
+    metadata = {tmp_path.joinpath(name).as_posix(): FakeMetadata(
+        gps=(i, 50, 0) if i % 2 == 0 else (0, 0, 0))
+        for i, name in enumerate(names)}
+    monkeypatch.setattr(pictool.utils_gexiv, 'get_metadata',
+                        lambda path: metadata[path])
+    monkeypatch.setattr(
+        pictool, '_get_reverse_geocoder', lambda args, email, cache:
+        lambda longitude, latitude: {'address': {
+            'country_code': 'de', 'city': 'City {}'.format(longitude)}})
+    args = pictool.parse_args().parse_args([
+        'location-set', '--no-cache', '--pipeline-depth',
+        str(pipeline_depth), tmp_path.as_posix()])
+    pictool.location_set(args)
+    for i, name in enumerate(names):
+        m = metadata[tmp_path.joinpath(name).as_posix()]
+        if i % 2 == 0:
+            assert m.saved == 1
+            assert m.tags['Iptc.Application2.City'] == 'City {}'.format(i)
+        else:
+            assert m.saved == 0
+
+
+def test_location_set_checkpoint_skip_tagged(tmp_path, monkeypatch):
+    names = ['{}.jpg'.format(i) for i in range(3)]
+    for name in names:
+        tmp_path.joinpath(name).touch()
+    metadata = {tmp_path.joinpath(name).as_posix(): FakeMetadata(
+        gps=(i + 1, 50, 0)) for i, name in enumerate(names)}
+    metadata[tmp_path.joinpath('0.jpg').as_posix()].tags = {
+        'Iptc.Application2.CountryCode': 'de',
+        'Iptc.Application2.City': 'Bonn'}
+    monkeypatch.setattr(pictool.utils_gexiv, 'get_metadata',
+                        lambda path: metadata[path])
+    lookups = []
+
+    def _reverse_geocode(longitude, latitude):
+        lookups.append(longitude)
+        if longitude == 3 and len(lookups) == 2:
+            raise Exception('interrupted')
+        return {'address': {'country_code': 'de', 'city': 'Köln'}}
+
+    monkeypatch.setattr(pictool, '_get_reverse_geocoder',
+                        lambda args, email, cache: _reverse_geocode)
+    args = pictool.parse_args().parse_args([
+        'location-set', '--no-cache', '--pipeline-depth', '0',
+        '--skip-tagged', '--checkpoint',
+        tmp_path.joinpath('checkpoint.jsonl').as_posix(),
+        tmp_path.as_posix()])
+    with pytest.raises(Exception, match='interrupted'):
+        pictool.location_set(args)
+    # 0.jpg is skipped, 2.jpg failed
+    assert lookups == [2, 3]
+    pictool.location_set(args)
+    # only 2.jpg is done again
+    assert lookups == [2, 3, 3]
+    assert metadata[tmp_path.joinpath('0.jpg').as_posix()].saved == 0
+    assert metadata[tmp_path.joinpath('2.jpg').as_posix()].saved == 1
+
+
+def test_gps_set_from_track(tmp_path, monkeypatch):
+    track = tmp_path.joinpath('track.csv')
+    track.write_text('time,lat,lon,ele\n'
+                     '2022-01-20T10:00:00Z,50,7,100\n'
+                     '2022-01-20T10:01:00Z,51,8,200\n')
+    metadata = {
+        # the camera clock is in UTC+1 and 10s ahead
+        'a.jpg': FakeMetadata(date_time=datetime(2022, 1, 20, 11, 0, 40)),
+        'b.jpg': FakeMetadata(date_time=datetime(2022, 1, 20, 15, 0, 0)),
+        'c.jpg': FakeMetadata(gps=(1, 2, 3),
+                              date_time=datetime(2022, 1, 20, 11, 0, 0)),
+    }
+    for name in metadata:
+        tmp_path.joinpath(name).touch()
+    monkeypatch.setattr(
+        pictool.utils_gexiv, 'get_metadata',
+        lambda path: metadata[Path(path).name])
+    args = pictool.parse_args().parse_args([
+        'gps-set-from-track', '--track', track.as_posix(),
+        '--timezone', '+01:00', '--clock-offset', '10', tmp_path.as_posix()])
+    assert pictool.gps_set_from_track(args) == 0
+    assert metadata['a.jpg'].gps == (7.5, 50.5, 150)
+    assert metadata['a.jpg'].saved == 1
+    # no track point near the time
+    assert metadata['b.jpg'].saved == 0
+    # already has GPS data
+    assert metadata['c.jpg'].gps == (1, 2, 3)
+
+
+def test_watch_face_normalize_dest_dir(tmp_path, monkeypatch):
+    watched = tmp_path.joinpath('watched')
+    watched.mkdir()
+
+    def _pipeline_prepare(args):
+        raise Exception('prepared')
+
+    monkeypatch.setattr(pictool, '_pipeline_prepare', _pipeline_prepare)
+    # the face images must not be written into the watched directory
+    for dest_dir in ([], ['--dest-dir', watched.as_posix()],
+                     ['--dest-dir', watched.joinpath('faces').as_posix()]):
+        args = pictool.parse_args().parse_args([
+            'watch', '--operations', 'gps-set, face-normalize', *dest_dir,
+            watched.as_posix()])
+        with pytest.raises(Exception, match='--dest-dir outside'):
+            pictool.watch(args)
+    args = pictool.parse_args().parse_args(
+        ['watch', '--operations', 'face-normalize', '--dest-dir',
+         tmp_path.joinpath('faces').as_posix(), watched.as_posix()])
+    with pytest.raises(Exception, match='prepared'):
+        pictool.watch(args)
@@ -0,0 +1,90 @@
+import datetime
+import os
+
+from pictool import utils_catalog
+
+
+def _record(path, **kwargs):
+    st = os.stat(path)
+    record = dict.fromkeys(utils_catalog.COLUMNS)
+    record.update({'path': path, 'size': st.st_size,
+                   'mtime': st.st_mtime_ns, 'readable': True})
+    record.update(kwargs)
+    return record
+
+
+def test_catalog_scan(tmp_path):
+    images = tmp_path.joinpath('images')
+    images.mkdir()
+    a = images.joinpath('a.jpg')
+    b = images.joinpath('b.jpg')
+    a.touch()
+    b.touch()
+    with utils_catalog.Catalog(
+            tmp_path.joinpath('catalog.sqlite').as_posix()) as catalog:
+        catalog.begin_scan()
+        catalog.update(_record(a.as_posix(), longitude=7.1, latitude=50.7,
+                               altitude=60.0,
+                               datetime='2022-01-20T18:07:50'))
+        catalog.update(_record(b.as_posix()))
+        assert catalog.end_scan([images.as_posix()]) == 0
+
+        record = catalog.get(a.as_posix())
+        assert catalog.is_current(record)
+        assert utils_catalog.record_gps(record) == (7.1, 50.7, 60.0)
+        assert utils_catalog.record_date_time(record) == datetime.datetime(
+            2022, 1, 20, 18, 7, 50)
+        assert [r['path'] for r in catalog.select(
+            [images.as_posix()], has_gps=True)] == [a.as_posix()]
+        assert [r['path'] for r in catalog.select(
+            [images.as_posix()], has_gps=False)] == [b.as_posix()]
+
+        # a changed file is not current anymore
+        b.write_bytes(b'changed')
+        assert not catalog.is_current(catalog.get(b.as_posix()))
+
+        # files which are not seen in a scan are removed
+        catalog.begin_scan()
+        catalog.seen(a.as_posix())
+        assert catalog.end_scan([images.as_posix()]) == 1
+        assert catalog.get(b.as_posix()) is None
+
+        catalog.rename(a.as_posix(), b.as_posix())
+        assert catalog.get(b.as_posix())['longitude'] == 7.1
+        catalog.update_columns(b.as_posix(), city='Bonn')
+        assert catalog.get(b.as_posix())['city'] == 'Bonn'
+
+
+def test_catalog_filtered_scan(tmp_path):
+    images = tmp_path.joinpath('images')
+    images.mkdir()
+    paths = []
+    for name in ('a.jpg', 'b.png', 'c.png'):
+        images.joinpath(name).touch()
+        paths.append(images.joinpath(name).as_posix())
+    catalog_path = tmp_path.joinpath('catalog.sqlite').as_posix()
+    with utils_catalog.Catalog(catalog_path, commit_interval=2) as catalog:
+        catalog.begin_scan()
+        for path in paths:
+            catalog.update(_record(path))
+        # the first records are committed during the scan
+        with utils_catalog.Catalog(catalog_path) as other:
+            assert other.get(paths[0]) is not None
+        catalog.end_scan([images.as_posix()])
+
+        # a scan for jpg files only keeps the png records, except for
+        # removed files
+        os.remove(paths[2])
+        catalog.begin_scan()
+        catalog.seen(paths[0])
+        assert catalog.end_scan(
+            [images.as_posix()],
+            lambda path, root: path.endswith('.jpg')) == 1
+        assert catalog.get(paths[1]) is not None
+        assert catalog.get(paths[2]) is None
+
+
+def test_address_columns():
+    assert utils_catalog.address_columns(
+        {'country_code': 'de', 'city_district': 'Mitte', 'road': 'x'}) == {
+            'country_code': 'de', 'sublocation': 'Mitte'}
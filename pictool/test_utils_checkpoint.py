@@ -0,0 +1,50 @@
+import pictool.utils_checkpoint as utils_checkpoint
+
+
+def test_checkpoint(tmp_path, monkeypatch):
+    paths = []
+    for name in ('a.jpg', 'b.jpg', 'c.jpg'):
+        tmp_path.joinpath(name).write_text(name)
+        paths.append(tmp_path.joinpath(name).as_posix())
+    journal = tmp_path.joinpath('checkpoint.jsonl').as_posix()
+    checkpoint = utils_checkpoint.Checkpoint(journal)
+    checkpoint.mark_done(paths[0])
+    checkpoint.mark_done(paths[1])
+    checkpoint.close()
+    # a crash while writing leaves an incomplete line
+    with open(journal, 'a') as f:
+        f.write('{"path": "')
+
+    # b.jpg changed after it was finished
+    tmp_path.joinpath('b.jpg').write_text('changed')
+    checkpoint = utils_checkpoint.Checkpoint(journal)
+    assert len(checkpoint) == 2
+    assert list(checkpoint.filter(paths)) == paths[1:]
+    # relative paths are the same files
+    monkeypatch.chdir(tmp_path)
+    assert checkpoint.is_done('a.jpg')
+    assert not checkpoint.is_done('missing.jpg')
+    checkpoint.close()
+
+
+def test_checkpoint_after_incomplete_line(tmp_path):
+    paths = []
+    for name in ('a.jpg', 'b.jpg'):
+        tmp_path.joinpath(name).write_text(name)
+        paths.append(tmp_path.joinpath(name).as_posix())
+    journal = tmp_path.joinpath('checkpoint.jsonl').as_posix()
+    checkpoint = utils_checkpoint.Checkpoint(journal)
+    checkpoint.mark_done(paths[0])
+    checkpoint.close()
+    with open(journal, 'a') as f:
+        f.write('{"path": "')
+
+    # the file finished after the crash must not be appended to the
+    # incomplete line
+    checkpoint = utils_checkpoint.Checkpoint(journal)
+    checkpoint.mark_done(paths[1])
+    checkpoint.close()
+    checkpoint = utils_checkpoint.Checkpoint(journal)
+    assert checkpoint.is_done(paths[0])
+    assert checkpoint.is_done(paths[1])
+    checkpoint.close()
@@ -0,0 +1,114 @@
+import datetime
+import struct
+
+import pytest
+
+from pictool import utils_exif
+
+
+def _ifd(order, entries, offset, next_ifd=0):
+    """build an IFD at offset. entries is a list of (tag, type, count,
+    packed value). Returns the IFD bytes (including the values)"""
+    data_offset = offset + 2 + 12 * len(entries) + 4
+    ifd = struct.pack(order + 'H', len(entries))
+    data = b''
+    for tag, type_, count, value in sorted(entries):
+        if len(value) <= 4:
+            ifd += struct.pack(order + 'HHI', tag, type_, count) + \
+                value.ljust(4, b'\x00')
+        else:
+            ifd += struct.pack(order + 'HHII', tag, type_, count,
+                               data_offset + len(data))
+            data += value
+    return ifd + struct.pack(order + 'I', next_ifd) + data
+
+
+def _rationals(order, *values):
+    return b''.join(struct.pack(order + 'II', n, d) for n, d in values)
+
+
+def _tiff(order, date_time_original=None, gps=True):
+    """build a TIFF structure with an Exif and a GPS IFD"""
+    order_mark = b'II' if order == '<' else b'MM'
+    header = order_mark + struct.pack(order + 'HI', 42, 8)
+    exif_entries = []
+    if date_time_original:
+        value = date_time_original.encode() + b'\x00'
+        exif_entries.append((0x9003, 2, len(value), value))
+    gps_entries = []
+    if gps:
+        gps_entries = [
+            (1, 2, 2, b'N\x00'),
+            (2, 5, 3, _rationals(order, (50, 1), (42, 1), (3600, 100))),
+            (3, 2, 2, b'W\x00'),
+            (4, 5, 3, _rationals(order, (7, 1), (6, 1), (0, 1))),
+            (5, 1, 1, b'\x01'),
+            (6, 5, 1, _rationals(order, (1205, 10))),
+        ]
+    # IFD0 has two pointer entries
+    ifd0_size = 2 + 12 * 2 + 4
+    exif_offset = 8 + ifd0_size
+    exif_ifd = _ifd(order, exif_entries, exif_offset)
+    gps_offset = exif_offset + len(exif_ifd)
+    gps_ifd = _ifd(order, gps_entries, gps_offset)
+    ifd0 = _ifd(order, [(0x8769, 4, 1, struct.pack(order + 'I', exif_offset)),
+                        (0x8825, 4, 1, struct.pack(order + 'I', gps_offset))],
+                8)
+    return header + ifd0 + exif_ifd + gps_ifd
+
+
+def _jpeg(tiff):
+    app0 = b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00' + b'\x00' * 9
+    app1 = b'\xff\xe1' + struct.pack('>H', len(tiff) + 8) + \
+        b'Exif\x00\x00' + tiff
+    return b'\xff\xd8' + app0 + app1 + b'\xff\xda\x00\x02' + b'\x00' * 64
+
+
+@pytest.mark.parametrize("order", ['<', '>'])
+def test_get_metadata_jpeg(tmp_path, order):
+    path = tmp_path.joinpath('a.jpg')
+    path.write_bytes(_jpeg(_tiff(order, '2022:01:20 18:07:50')))
+    metadata = utils_exif.get_metadata(path.as_posix())
+    assert metadata.get_date_time() == datetime.datetime(
+        2022, 1, 20, 18, 7, 50)
+    longitude, latitude, altitude = metadata.get_gps_info()
+    assert longitude == pytest.approx(-7.1)
+    assert latitude == pytest.approx(50.71)
+    assert altitude == pytest.approx(-120.5)
+
+
+def test_get_metadata_tiff_without_tags(tmp_path):
+    path = tmp_path.joinpath('a.dng')
+    path.write_bytes(_tiff('<', gps=False))
+    metadata = utils_exif.get_metadata(path.as_posix())
+    assert metadata.get_gps_info() == (0, 0, 0)
+    with pytest.raises(KeyError):
+        metadata.get_date_time()
+
+
+def test_get_metadata_jpeg_without_exif(tmp_path):
+    path = tmp_path.joinpath('a.jpg')
+    path.write_bytes(b'\xff\xd8\xff\xda\x00\x02' + b'\x00' * 16)
+    metadata = utils_exif.get_metadata(path.as_posix())
+    assert metadata.get_gps_info() == (0, 0, 0)
+
+
+@pytest.mark.parametrize("content", [
+    b'', b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff\xe1\x00', b'II*\x00\xff\xff'])
+def test_get_metadata_unsupported(tmp_path, content):
+    path = tmp_path.joinpath('a.jpg')
+    path.write_bytes(content)
+    assert utils_exif.get_metadata(path.as_posix()) is None
+
+
+def test_get_image_size(tmp_path):
+    path = tmp_path.joinpath('a.jpg')
+    sof = b'\xff\xc0' + struct.pack('>HBHHB', 11, 8, 480, 640, 1) + \
+        b'\x01\x11\x00'
+    path.write_bytes(_jpeg(_tiff('<'))[:-68] + sof + b'\xff\xda\x00\x02')
+    assert utils_exif.get_image_size(path.as_posix()) == (640, 480)
+    path.write_bytes(b''.join([b'\x89PNG\r\n\x1a\n', struct.pack('>I', 13),
+                               b'IHDR', struct.pack('>II', 300, 200)]))
+    assert utils_exif.get_image_size(path.as_posix()) == (300, 200)
+    path.write_bytes(b'unknown')
+    assert utils_exif.get_image_size(path.as_posix()) is None
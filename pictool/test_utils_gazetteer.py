@@ -0,0 +1,58 @@
+import pytest
+
+from pictool import utils_gazetteer
+
+
+CITIES = [
+    # geonameid, name, lat, lon, country code, admin1 code
+    ('2950159', 'Berlin', '52.52437', '13.41053', 'DE', '16'),
+    ('2867714', 'Munich', '48.13743', '11.57549', 'DE', '02'),
+    ('2988507', 'Paris', '48.85341', '2.3488', 'FR', '11'),
+    ('5128581', 'New York City', '40.71427', '-74.00597', 'US', 'NY'),
+    ('2147714', 'Sydney', '-33.86785', '151.20732', 'AU', '02'),
+]
+
+
+@pytest.fixture
+def gazetteer_index(tmp_path):
+    cities_path = tmp_path.joinpath('cities.txt')
+    with cities_path.open('w') as f:
+        for geonameid, name, lat, lon, cc, admin1 in CITIES:
+            fields = [geonameid, name, name, '', lat, lon, 'P', 'PPL', cc,
+                      '', admin1] + [''] * 8
+            f.write('\t'.join(fields) + '\n')
+    admin1_path = tmp_path.joinpath('admin1.txt')
+    admin1_path.write_text('DE.16\tLand Berlin\tLand Berlin\t2950157\n'
+                           'DE.02\tBavaria\tBavaria\t2951839\n')
+    country_info_path = tmp_path.joinpath('countryInfo.txt')
+    country_info_path.write_text('#ISO\tISO3\tISO-Numeric\tfips\tCountry\n'
+                                 'DE\tDEU\t276\tGM\tGermany\n')
+    index_path = tmp_path.joinpath('index').as_posix()
+    assert utils_gazetteer.build_index(
+        cities_path.as_posix(), admin1_path.as_posix(), index_path,
+        country_info_path.as_posix()) == len(CITIES)
+    return index_path
+
+
+def test_gazetteer_reverse(gazetteer_index):
+    gazetteer = utils_gazetteer.Gazetteer(gazetteer_index)
+    assert len(gazetteer) == len(CITIES)
+    res = gazetteer.reverse(13.3, 52.5)
+    assert res['address'] == {'country_code': 'de', 'country': 'Germany',
+                              'state': 'Land Berlin', 'city': 'Berlin'}
+    assert res['distance'] < 10
+    # no country name and admin1 available
+    assert gazetteer.reverse(-73.9, 40.7)['address'] == {
+        'country_code': 'us', 'city': 'New York City'}
+    assert gazetteer.reverse(151, -34)['address']['city'] == 'Sydney'
+
+
+def test_gazetteer_reverse_max_distance(gazetteer_index):
+    gazetteer = utils_gazetteer.Gazetteer(gazetteer_index, max_distance=50)
+    assert gazetteer.reverse(2.35, 48.85)['address']['city'] == 'Paris'
+    assert gazetteer.reverse(0, 0)['address'] == {}
+
+
+def test_gazetteer_missing_index(tmp_path):
+    with pytest.raises(Exception):
+        utils_gazetteer.Gazetteer(tmp_path.as_posix())
@@ -0,0 +1,16 @@
+import pytest
+
+from pictool import utils_geo
+
+
+@pytest.mark.parametrize(
+    "latitude,longitude,precision,expected",
+    [
+        (57.64911, 10.40744, 11, 'u4pruydqqvj'),
+        (57.64911, 10.40744, 6, 'u4pruy'),
+        (-25.382708, -49.265506, 5, '6gkzw'),
+    ],
+)
+def test_geohash_encode(latitude, longitude, precision, expected):
+    assert utils_geo.geohash_encode(latitude, longitude,
+                                    precision) == expected
@@ -0,0 +1,64 @@
+import time
+
+from pictool import utils_geocache
+
+
+def test_geocache_get_put(tmp_path):
+    cache_path = tmp_path.joinpath('cache.sqlite').as_posix()
+    with utils_geocache.GeocodeCache(cache_path) as cache:
+        assert cache.get(7.1, 50.2, 10, 'en-US') is None
+        cache.put(7.1, 50.2, 10, 'en-US', {'address': {'city': 'Bonn'}})
+        # quantized coordinates hit the same entry
+        assert cache.get(7.100001, 50.200001, 10, 'en-US') == {
+            'address': {'city': 'Bonn'}}
+        # different zoom/language are different entries
+        assert cache.get(7.1, 50.2, 12, 'en-US') is None
+        assert cache.get(7.1, 50.2, 10, 'de') is None
+        assert cache.hits == 1
+        assert cache.misses == 3
+    # the cache is persistent
+    with utils_geocache.GeocodeCache(cache_path) as cache:
+        assert cache.get(7.1, 50.2, 10, 'en-US') is not None
+
+
+def test_geocache_ttl(tmp_path):
+    cache_path = tmp_path.joinpath('cache.sqlite').as_posix()
+    with utils_geocache.GeocodeCache(cache_path, ttl=-1) as cache:
+        cache.put(7.1, 50.2, 10, 'en-US', {})
+        assert cache.get(7.1, 50.2, 10, 'en-US') is None
+
+
+def test_geocache_eviction(tmp_path):
+    cache_path = tmp_path.joinpath('cache.sqlite').as_posix()
+    with utils_geocache.GeocodeCache(cache_path, max_entries=2) as cache:
+        cache.put(1, 1, 10, 'en-US', {'n': 1})
+        time.sleep(0.01)
+        cache.put(2, 2, 10, 'en-US', {'n': 2})
+        time.sleep(0.01)
+        # access the first entry so the second one is the oldest
+        assert cache.get(1, 1, 10, 'en-US') == {'n': 1}
+        time.sleep(0.01)
+        cache.put(3, 3, 10, 'en-US', {'n': 3})
+        assert cache.get(2, 2, 10, 'en-US') is None
+        assert cache.get(1, 1, 10, 'en-US') == {'n': 1}
+        assert cache.get(3, 3, 10, 'en-US') == {'n': 3}
+
+
+def test_geocache_count(tmp_path):
+    cache_path = tmp_path.joinpath('cache.sqlite').as_posix()
+    with utils_geocache.GeocodeCache(cache_path, max_entries=3) as cache:
+        for i in range(3):
+            cache.put(i, i, 10, 'en-US', {'n': i})
+        # replacing an entry doesn't add one
+        cache.put(0, 0, 10, 'en-US', {'n': 0})
+        assert cache._count == 3
+    # the count is read when the cache is opened again
+    with utils_geocache.GeocodeCache(cache_path, max_entries=3) as cache:
+        assert cache._count == 3
+        cache.put(3, 3, 10, 'en-US', {'n': 3})
+        assert cache._count == 3
+        assert cache.get(3, 3, 10, 'en-US') == {'n': 3}
+    # a smaller limit evicts when the cache is opened
+    with utils_geocache.GeocodeCache(cache_path, max_entries=1) as cache:
+        assert cache._count == 1
+        assert cache.get(3, 3, 10, 'en-US') == {'n': 3}
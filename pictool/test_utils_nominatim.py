@@ -0,0 +1,76 @@
+import http.server
+import json
+import threading
+
+import pytest
+
+from pictool import utils_nominatim
+
+
+def test_token_bucket_burst():
+    bucket = utils_nominatim.TokenBucket(rate=10, burst=2)
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    # the bucket is empty now, so the next call needs to wait
+    assert bucket.acquire() == pytest.approx(0.1, abs=0.05)
+
+
+@pytest.fixture
+def nominatim_server():
+    class Handler(http.server.BaseHTTPRequestHandler):
+        # the status codes to return, one per request. 200 afterwards
+        status_codes = [503, 429]
+        requests = []
+
+        def do_GET(self):
+            Handler.requests.append(self.path)
+            status = Handler.status_codes.pop(0) \
+                if Handler.status_codes else 200
+            body = json.dumps({'address': {'city': 'Bonn'}}).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(server.server_port), Handler
+    server.shutdown()
+
+
+def test_client_reverse_retry(nominatim_server):
+    url, handler = nominatim_server
+    client = utils_nominatim.NominatimClient(url, email='me@example.com',
+                                             rate=100, backoff=0)
+    assert client.reverse(7.1, 50.7) == {'address': {'city': 'Bonn'}}
+    assert len(handler.requests) == 3
+    assert handler.requests[-1].startswith('/reverse?')
+    assert 'email=me%40example.com' in handler.requests[-1]
+
+
+def test_client_reverse_retries_exhausted(nominatim_server):
+    url, handler = nominatim_server
+    client = utils_nominatim.NominatimClient(url, rate=100, retries=1,
+                                             backoff=0)
+    with pytest.raises(Exception):
+        client.reverse(7.1, 50.7)
+    assert len(handler.requests) == 2
+
+
+def test_client_public_rate_limited():
+    client = utils_nominatim.NominatimClient(rate=10, max_concurrency=4)
+    assert client.max_concurrency == 1
+    assert client.rate_limited
+    for url in ('http://nominatim.openstreetmap.org/',
+                'https://nominatim.openstreetmap.org/search',
+                'https://NOMINATIM.openstreetmap.org:443'):
+        client = utils_nominatim.NominatimClient(url, rate=10, burst=5)
+        assert client.max_concurrency == 1
+        assert client.rate_limited
+    client = utils_nominatim.NominatimClient(rate=0.5)
+    assert not client.rate_limited
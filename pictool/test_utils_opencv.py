@@ -0,0 +1,173 @@
+import os
+import struct
+
+import cv2
+import numpy
+import pytest
+
+from pictool import utils_opencv
+
+
+def _cascade_path(name):
+    data_dir = getattr(getattr(cv2, 'data', None), 'haarcascades', None) or \
+        '/usr/share/opencv4/haarcascades/'
+    path = os.path.join(data_dir, name)
+    if not os.path.exists(path):
+        pytest.skip('openCV cascade {} not available'.format(name))
+    return path
+
+
+@pytest.fixture
+def cascades():
+    return (_cascade_path('haarcascade_frontalface_alt.xml'),
+            _cascade_path('haarcascade_eye.xml'))
+
+
+def test_get_face_detector_cached(cascades):
+    detector = utils_opencv.get_face_detector(*cascades, min_neighbors=3)
+    assert detector is utils_opencv.get_face_detector(*cascades,
+                                                      min_neighbors=3)
+    assert detector is not utils_opencv.get_face_detector(*cascades)
+    assert detector.min_neighbors == 3
+
+
+def test_face_detector_invalid_cascade(tmp_path, cascades):
+    with pytest.raises(Exception):
+        utils_opencv.FaceDetector(tmp_path.joinpath('missing.xml').as_posix(),
+                                  cascades[1])
+
+
+def test_normalize_face_no_faces(tmp_path, cascades):
+    image_path = tmp_path.joinpath('image.png').as_posix()
+    cv2.imwrite(image_path, numpy.zeros((200, 300), dtype=numpy.uint8))
+    utils_opencv.normalize_face(image_path, tmp_path.as_posix(),
+                                utils_opencv.FaceDetector(*cascades))
+    assert sorted(os.listdir(tmp_path)) == ['image.png']
+
+
+@pytest.mark.parametrize("width,height,max_w_or_h,expected_factor", [
+    (8000, 6000, 4096, 1),
+    (8192, 6000, 4096, 2),
+    (8192, 6000, 1024, 8),
+    (3000, 5000, 1024, 4),
+    (500, 400, 1024, 1),
+])
+def test_read_image_for_detection(tmp_path, width, height, max_w_or_h,
+                                  expected_factor):
+    image_path = tmp_path.joinpath('image.jpg').as_posix()
+    cv2.imwrite(image_path, numpy.zeros((height, width), dtype=numpy.uint8))
+    assert utils_opencv._reduced_read_flag(
+        (width, height), max_w_or_h)[1] == expected_factor
+    image, scale = utils_opencv.read_image_for_detection(image_path,
+                                                         max_w_or_h)
+    assert max(image.shape) == min(max(width, height), max_w_or_h)
+    assert max(image.shape) * scale == pytest.approx(max(width, height))
+
+
+def test_normalize_face_preview_without_faces(tmp_path, cascades):
+    # the image itself is not read if there are no faces in the preview
+    preview_data = cv2.imencode(
+        '.jpg', numpy.zeros((120, 160), dtype=numpy.uint8))[1].tobytes()
+    faces = utils_opencv.normalize_face(
+        tmp_path.joinpath('missing.jpg').as_posix(), tmp_path.as_posix(),
+        utils_opencv.FaceDetector(*cascades), preview_data=preview_data)
+    assert faces == []
+
+
+def test_normalize_face_invalid_preview(tmp_path, cascades):
+    # fall back to the image itself if the preview can not be decoded
+    image_path = tmp_path.joinpath('image.png').as_posix()
+    cv2.imwrite(image_path, numpy.zeros((200, 300), dtype=numpy.uint8))
+    assert utils_opencv.normalize_face(
+        image_path, tmp_path.as_posix(), utils_opencv.FaceDetector(*cascades),
+        preview_data=b'invalid') == []
+    with pytest.raises(Exception):
+        utils_opencv.normalize_face(
+            tmp_path.joinpath('missing.jpg').as_posix(), tmp_path.as_posix(),
+            utils_opencv.FaceDetector(*cascades), preview_data=b'invalid')
+
+
+def test_detect_faces_with_scores(cascades):
+    faces, scores = utils_opencv.FaceDetector(
+        *cascades).detect_faces_with_scores(
+            numpy.zeros((200, 300), dtype=numpy.uint8))
+    assert len(faces) == len(scores) == 0
+
+
+def _jpeg_with_preview(image, preview, orientation):
+    """encode image as JPEG with an Exif orientation and an embedded
+    (unrotated) JPEG preview"""
+    preview_data = cv2.imencode('.jpg', preview)[1].tobytes()
+    # IFD0 with the orientation, IFD1 with the preview
+    ifd1_offset = 8 + 2 + 12 + 4
+    preview_offset = ifd1_offset + 2 + 12 * 2 + 4
+    tiff = b'II' + struct.pack('<HI', 42, 8) + \
+        struct.pack('<HHHIHHI', 1, 0x0112, 3, 1, orientation, 0,
+                    ifd1_offset) + \
+        struct.pack('<HHHIIHHIII', 2, 0x0201, 4, 1, preview_offset,
+                    0x0202, 4, 1, len(preview_data), 0) + preview_data
+    segment = b'Exif\x00\x00' + tiff
+    data = cv2.imencode('.jpg', image)[1].tobytes()
+    return data[:2] + b'\xff\xe1' + struct.pack('>H', len(segment) + 2) + \
+        segment + data[2:], preview_data
+
+
+def _bright_box(image):
+    """get the (x, y, w, h) box around the bright pixels"""
+    ys, xs = numpy.nonzero(image > 128)
+    return (xs.min(), ys.min(), xs.max() - xs.min() + 1,
+            ys.max() - ys.min() + 1)
+
+
+class BrightBoxDetector(object):
+    """detects the bright area of an image as face"""
+    def detect_faces(self, image):
+        return [_bright_box(image)]
+
+    def detect_eyes(self, image):
+        return []
+
+
+def test_normalize_face_rotated_preview(tmp_path):
+    # a portrait photo: stored as landscape, rotated by 90° for display
+    image = numpy.zeros((200, 400), dtype=numpy.uint8)
+    image[20:80, 40:100] = 255
+    data, preview_data = _jpeg_with_preview(
+        image, cv2.resize(image, (200, 100), interpolation=cv2.INTER_AREA),
+        6)
+    image_path = tmp_path.joinpath('image.jpg')
+    image_path.write_bytes(data)
+    expected = _bright_box(cv2.imread(image_path.as_posix(),
+                                      cv2.IMREAD_GRAYSCALE))
+    faces = utils_opencv.normalize_face(
+        image_path.as_posix(), tmp_path.as_posix(), BrightBoxDetector(),
+        preview_data=preview_data, preview_orientation=6)
+    assert len(faces) == 1
+    assert numpy.allclose(faces[0], expected, atol=4)
+    face = cv2.imread(tmp_path.joinpath('face01-image.jpg').as_posix(),
+                      cv2.IMREAD_GRAYSCALE)
+    assert face.mean() > 200
+
+
+class RecordingCascade(object):
+    def __init__(self):
+        self.calls = []
+
+    def detectMultiScale(self, *args):
+        self.calls.append(args)
+        return []
+
+
+def test_detect_eyes_parameters(cascades):
+    # the face detection parameters don't change the eye detection
+    detector = utils_opencv.FaceDetector(*cascades, scale_factor=1.3,
+                                         min_neighbors=8)
+    detector._eye_cascade = RecordingCascade()
+    image = numpy.zeros((100, 100), dtype=numpy.uint8)
+    detector.detect_eyes(image)
+    assert detector._eye_cascade.calls[0][1:3] == (1.1, 4)
+    detector = utils_opencv.FaceDetector(*cascades, eye_scale_factor=1.2,
+                                         eye_min_neighbors=6)
+    detector._eye_cascade = RecordingCascade()
+    detector.detect_eyes(image)
+    assert detector._eye_cascade.calls[0][1:3] == (1.2, 6)
@@ -0,0 +1,82 @@
+import json
+import os
+
+import pytest
+
+import pictool.utils_rename as utils_rename
+
+
+def _touch(tmp_path, *names):
+    for name in names:
+        tmp_path.joinpath(name).write_text(name)
+
+
+def _contents(tmp_path):
+    return {p.name: p.read_text() for p in tmp_path.iterdir()
+            if p.suffix != '.jsonl'}
+
+
+def test_plan_collisions(tmp_path):
+    _touch(tmp_path, 'IMG_1.jpg', 'IMG_1_2.jpg', 'b.jpg', 'a.jpg', 'c.jpg')
+    d = tmp_path.as_posix()
+    moves = utils_rename.plan([
+        (os.path.join(d, 'c.jpg'), 'IMG_1', 'jpg'),
+        (os.path.join(d, 'a.jpg'), 'IMG_1', 'jpg'),
+        (os.path.join(d, 'IMG_1_2.jpg'), 'IMG_1', 'jpg'),
+        (os.path.join(d, 'b.jpg'), 'IMG_2', 'jpg')])
+    # IMG_1.jpg exists, IMG_1_2.jpg already has a valid name
+    assert [(os.path.basename(a), os.path.basename(b))
+            for a, b in moves] == [('a.jpg', 'IMG_1_1.jpg'),
+                                   ('b.jpg', 'IMG_2.jpg'),
+                                   ('c.jpg', 'IMG_1_3.jpg')]
+
+
+def test_order_cycle(tmp_path):
+    _touch(tmp_path, 'a.jpg', 'b.jpg', 'c.jpg')
+    a, b, c = (tmp_path.joinpath(n).as_posix()
+               for n in ('a.jpg', 'b.jpg', 'c.jpg'))
+    d = tmp_path.joinpath('d.jpg').as_posix()
+    steps = utils_rename.order([(a, b), (b, a), (c, d)])
+    assert steps[0] == (c, d)
+    assert len(steps) == 4
+    utils_rename.apply(steps)
+    assert _contents(tmp_path) == {'a.jpg': 'b.jpg', 'b.jpg': 'a.jpg',
+                                   'd.jpg': 'c.jpg'}
+
+
+def test_apply_undo(tmp_path):
+    _touch(tmp_path, 'a.jpg', 'b.jpg', 'c.jpg')
+    a, b, c = (tmp_path.joinpath(n).as_posix()
+               for n in ('a.jpg', 'b.jpg', 'c.jpg'))
+    journal = tmp_path.joinpath('journal.jsonl').as_posix()
+    renamed = []
+    utils_rename.apply(utils_rename.order([(a, b), (b, c), (c, a)]),
+                       journal, lambda *step: renamed.append(step))
+    assert len(renamed) == 4
+    assert _contents(tmp_path) == {'a.jpg': 'c.jpg', 'b.jpg': 'a.jpg',
+                                   'c.jpg': 'b.jpg'}
+    assert utils_rename.undo(journal) == 4
+    assert _contents(tmp_path) == {'a.jpg': 'a.jpg', 'b.jpg': 'b.jpg',
+                                   'c.jpg': 'c.jpg'}
+    assert not os.path.exists(journal)
+
+
+def test_undo_interrupted(tmp_path):
+    _touch(tmp_path, 'a.jpg', 'b.jpg')
+    a, b = (tmp_path.joinpath(n).as_posix() for n in ('a.jpg', 'b.jpg'))
+    steps = utils_rename.order([(a, b), (b, a)])
+    journal = tmp_path.joinpath('journal.jsonl')
+    entries = [{'version': 1, 'steps': len(steps)}]
+    entries.extend({'src': src, 'dst': dst} for src, dst in steps)
+    journal.write_text(''.join(json.dumps(e) + '\n' for e in entries))
+    # the first step was done but not recorded in the journal
+    os.rename(*steps[0])
+    assert utils_rename.undo(journal.as_posix()) == 1
+    assert _contents(tmp_path) == {'a.jpg': 'a.jpg', 'b.jpg': 'b.jpg'}
+
+
+def test_apply_existing_target(tmp_path):
+    _touch(tmp_path, 'a.jpg', 'b.jpg')
+    with pytest.raises(Exception):
+        utils_rename.apply([(tmp_path.joinpath('a.jpg').as_posix(),
+                             tmp_path.joinpath('b.jpg').as_posix())])
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+import pictool
+import pictool.utils_stats as utils_stats
+
+
+def test_timer():
+    timer = utils_stats.Timer()
+    for seconds in (0.001, 0.002, 0.002, 0.5):
+        timer.add(seconds)
+    data = timer.as_dict()
+    assert data['count'] == 4
+    assert data['total'] == pytest.approx(0.505)
+    assert data['min'] == 0.001 and data['max'] == 0.5
+    # upper bound of the bucket (2048us)
+    assert data['p50'] == pytest.approx(0.002048)
+    assert data['p99'] == 0.5
+    assert sum(data['histogram'].values()) == 4
+
+
+def test_stats_wrap():
+    stats = utils_stats.Stats()
+    func = stats.wrap(lambda x: x * 2, 'double')
+    assert func(2) == 4
+    items = stats.wrap_iter(lambda: iter([1, 2]), 'items')
+    assert list(items()) == [1, 2]
+    with stats.timer('block'):
+        pass
+    phases = stats.as_dict()['phases']
+    assert phases['double']['count'] == 1
+    # 2 items and the end of the iteration
+    assert phases['items']['count'] == 3
+    assert phases['block']['count'] == 1
+    assert 'double' in stats.format()
+
+
+def test_instrument(tmp_path):
+    tmp_path.joinpath('a.jpg').touch()
+    stats = utils_stats.Stats()
+    loop_path = pictool._loop_path
+    restore = utils_stats.instrument(stats, pictool)
+    assert pictool._loop_path is not loop_path
+    assert len(list(pictool._loop_path([tmp_path.as_posix()]))) == 1
+    restore()
+    assert pictool._loop_path is loop_path
+    assert stats.as_dict()['phases']['walk']['count'] == 2
+
+
+def test_run_stats_json(tmp_path):
+    tmp_path.joinpath('2022-01-20_18:07:50_7700.jpg').touch()
+    stats_path = tmp_path.joinpath('stats.json')
+    args = pictool.parse_args().parse_args([
+        '--stats-json', stats_path.as_posix(),
+        '--profile', tmp_path.joinpath('profile.out').as_posix(),
+        'image-rename', '--journal',
+        tmp_path.joinpath('journal.jsonl').as_posix(), tmp_path.as_posix()])
+    assert pictool._run(args) == 0
+    stats = json.loads(stats_path.read_text())
+    assert stats['phases']['walk']['count'] == 2
+    assert tmp_path.joinpath('profile.out').stat().st_size > 0
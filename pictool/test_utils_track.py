@@ -0,0 +1,62 @@
+import pytest
+
+import pictool.utils_track as utils_track
+
+
+GPX = '''<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">
+  <trk><trkseg>
+    <trkpt lat="50.0" lon="7.0"><ele>100</ele>
+      <time>2022-01-20T10:00:10Z</time></trkpt>
+    <trkpt lat="51.0" lon="8.0"><time>2022-01-20T10:00:00Z</time></trkpt>
+    <trkpt lat="52.0" lon="9.0"></trkpt>
+  </trkseg></trk>
+</gpx>
+'''
+
+
+def test_parse_time():
+    assert utils_track.parse_time('1642672800') == 1642672800
+    assert utils_track.parse_time('2022-01-20T10:00:00Z') == 1642672800
+    assert utils_track.parse_time('2022-01-20T10:00:00') == 1642672800
+    assert utils_track.parse_time('2022-01-20T11:00:00+01:00') == 1642672800
+    assert utils_track.parse_time('2022-01-20T10:00:00.500Z') == 1642672800.5
+
+
+def test_iter_gpx(tmp_path):
+    path = tmp_path.joinpath('track.gpx')
+    path.write_text(GPX)
+    points = list(utils_track.iter_gpx(path.as_posix()))
+    # the point without time is skipped
+    assert points[0] == (1642672810, 50.0, 7.0, 100.0)
+    assert points[1][:3] == (1642672800, 51.0, 8.0)
+
+
+def test_iter_csv(tmp_path):
+    path = tmp_path.joinpath('track.csv')
+    path.write_text('Time,Lat,Lon,Alt\n'
+                    '2022-01-20T10:00:00Z,50.5,7.5,10\n'
+                    '1642672810,50.6,7.6,\n')
+    points = list(utils_track.iter_csv(path.as_posix()))
+    assert points[0] == (1642672800, 50.5, 7.5, 10.0)
+    assert points[1][:3] == (1642672810, 50.6, 7.6)
+    path.write_text('time,lat\n')
+    with pytest.raises(Exception, match='no longitude column'):
+        list(utils_track.iter_csv(path.as_posix()))
+
+
+def test_track_position():
+    nan = float('nan')
+    track = utils_track.Track([1000, 0, 10, 20], [60, 50, 51, 52],
+                              [20, 7, 8, 9], [nan, 0, 100, nan])
+    assert len(track) == 4
+    assert track.position(0) == (7, 50, 0)
+    assert track.position(5) == (7.5, 50.5, 50)
+    # unknown altitude
+    assert track.position(15) == (8.5, 51.5, 0)
+    # the gap between 20 and 1000 is too large to interpolate
+    assert track.position(100, max_gap=300) == (9, 52, 0)
+    assert track.position(500, max_gap=300) is None
+    assert track.position(-10, max_gap=300) == (7, 50, 0)
+    assert track.position(2000, max_gap=300) is None
+    assert utils_track.Track([], [], [], []).position(0) is None
@@ -0,0 +1,73 @@
+import pytest
+
+from pictool import utils_walk
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for name, content in [
+            ('a.jpg', b'\xff\xd8\xff\xe0'),
+            ('b.JPEG', b'\xff\xd8\xff\xe1'),
+            ('notes.txt', b'text'),
+            ('fake.jpg', b'text'),
+            ('sub/c.png', b'\x89PNG\r\n\x1a\n'),
+            ('sub/movie.mov', b''),
+            ('sub/deeper/d.cr2', b'II*\x00'),
+            ('.thumbnails/e.jpg', b'\xff\xd8\xff\xe0')]:
+        path = tmp_path.joinpath(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+    return tmp_path
+
+
+def _names(paths):
+    return sorted(p.rsplit('/', 1)[-1] for p in paths)
+
+
+def test_walk_extensions(tree):
+    assert _names(utils_walk.walk([tree.as_posix()])) == [
+        'a.jpg', 'b.JPEG', 'c.png', 'd.cr2', 'e.jpg', 'fake.jpg']
+    assert _names(utils_walk.walk([tree.as_posix()], extensions=None)) == [
+        'a.jpg', 'b.JPEG', 'c.png', 'd.cr2', 'e.jpg', 'fake.jpg',
+        'movie.mov', 'notes.txt']
+
+
+def test_walk_include_exclude(tree):
+    assert _names(utils_walk.walk([tree.as_posix()],
+                                  exclude=['.thumbnails', 'fake*'])) == [
+        'a.jpg', 'b.JPEG', 'c.png', 'd.cr2']
+    assert _names(utils_walk.walk([tree.as_posix()],
+                                  include=['*/sub/*'])) == ['c.png', 'd.cr2']
+
+
+def test_walk_max_depth(tree):
+    assert _names(utils_walk.walk([tree.as_posix()], max_depth=0)) == [
+        'a.jpg', 'b.JPEG', 'fake.jpg']
+    assert _names(utils_walk.walk([tree.as_posix()], max_depth=1)) == [
+        'a.jpg', 'b.JPEG', 'c.png', 'e.jpg', 'fake.jpg']
+
+
+def test_walk_check_magic_and_inode_order(tree):
+    assert _names(utils_walk.walk([tree.as_posix()], check_magic=True,
+                                  inode_order=True)) == [
+        'a.jpg', 'b.JPEG', 'c.png', 'd.cr2', 'e.jpg']
+
+
+def test_walk_files_always_used(tree):
+    path = tree.joinpath('notes.txt').as_posix()
+    assert list(utils_walk.walk([path])) == [path]
+    with pytest.raises(Exception):
+        list(utils_walk.walk([tree.joinpath('missing').as_posix()]))
+
+
+@pytest.mark.parametrize('kwargs', [
+    {}, {'extensions': None}, {'exclude': ['.thumbnails', 'fake*']},
+    {'include': ['*/sub/*']}, {'max_depth': 0}, {'max_depth': 1},
+    {'check_magic': True}])
+def test_walk_matches(tree, kwargs):
+    root = tree.as_posix()
+    found = set(utils_walk.walk([root], **kwargs))
+    for path in utils_walk.walk([root], extensions=None):
+        assert utils_walk.walk_matches(path, root, **kwargs) == \
+            (path in found)
+    assert not utils_walk.walk_matches('/elsewhere/a.jpg', root, **kwargs)
@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+import pictool.utils_watch as utils_watch
+
+
+class ScriptedWatcher(object):
+    """a watcher which reports the given batches of events. A batch is
+    reported once handled has at least the given number of entries"""
+    def __init__(self, batches, handled, stop):
+        self.batches = list(batches)
+        self.handled = handled
+        self.stop = stop
+        self.closed = False
+
+    def poll(self, timeout):
+        if not self.batches:
+            self.stop.set()
+            return []
+        count, paths = self.batches[0]
+        for _ in range(100):
+            if len(self.handled) >= count:
+                break
+            time.sleep(0.01)
+        return self.batches.pop(0)[1]
+
+    def close(self):
+        self.closed = True
+
+
+def test_inotify_watcher(tmp_path):
+    try:
+        watcher = utils_watch.InotifyWatcher([tmp_path.as_posix()])
+    except (OSError, AttributeError):
+        pytest.skip('inotify is not available')
+    tmp_path.joinpath('a.jpg').write_text('a')
+    assert watcher.poll(1.0) == [tmp_path.joinpath('a.jpg').as_posix()]
+    # files in new directories are found even if they are written before
+    # the directory is watched
+    tmp_path.joinpath('sub').mkdir()
+    tmp_path.joinpath('sub', 'b.jpg').write_text('b')
+    paths = watcher.poll(1.0)
+    paths += watcher.poll(0.1)
+    assert tmp_path.joinpath('sub', 'b.jpg').as_posix() in paths
+    tmp_path.joinpath('sub', 'c.jpg').write_text('c')
+    assert watcher.poll(1.0) == [tmp_path.joinpath('sub', 'c.jpg').as_posix()]
+    assert watcher.poll(0) == []
+    watcher.close()
+
+
+def test_polling_watcher(tmp_path):
+    tmp_path.joinpath('old.jpg').write_text('old')
+    watcher = utils_watch.PollingWatcher([tmp_path.as_posix()], interval=0)
+    assert watcher.poll(0) == []
+    tmp_path.joinpath('sub').mkdir()
+    tmp_path.joinpath('sub', 'new.jpg').write_text('new')
+    assert watcher.poll(0) == [tmp_path.joinpath('sub', 'new.jpg').as_posix()]
+
+
+def test_run(tmp_path):
+    for name in ('a.jpg', 'b.jpg', '.tmp.jpg', 'c.txt', 'old.jpg'):
+        tmp_path.joinpath(name).write_text(name)
+    a, b, hidden, txt, old = (tmp_path.joinpath(n).as_posix() for n in (
+        'a.jpg', 'b.jpg', '.tmp.jpg', 'c.txt', 'old.jpg'))
+    renamed = tmp_path.joinpath('B.jpg').as_posix()
+    handled = []
+
+    def _handle(path):
+        handled.append(path)
+        if path == b:
+            tmp_path.joinpath('b.jpg').rename(renamed)
+            return renamed
+        if path == old:
+            raise Exception('broken')
+        return path
+
+    stop = threading.Event()
+    # the handled files are reported again (eg. after writing the metadata
+    # or renaming)
+    watcher = ScriptedWatcher([(0, [a, a, hidden, txt]), (2, [b]),
+                               (3, [a, renamed])], handled, stop)
+    utils_watch.run(watcher, _handle, lambda p: p.endswith('.jpg'),
+                    debounce=0, initial=[old], stop=stop)
+    assert handled == [old, a, b]
+    assert watcher.closed
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+A persistent (sqlite based) catalog of image metadata.
+
+The catalog stores the metadata which is often needed (dimensions, GPS,
+date/time and location tags) so commands can select files without opening
+them. A file entry is current as long as the size and mtime of the file
+did not change.
+"""
+
+import datetime
+import os
+import sqlite3
+
+import pictool.utils_geocache as utils_geocache
+import pictool.utils_gexiv as utils_gexiv
+
+
+# the location tags which are stored in the catalog
+LOCATION_TAGS = {
+    'country_code': 'Iptc.Application2.CountryCode',
+    'country': 'Iptc.Application2.CountryName',
+    'state': 'Iptc.Application2.ProvinceState',
+    'city': 'Iptc.Application2.City',
+    'sublocation': 'Iptc.Application2.SubLocation',
+}
+
+# the columns for the keys in a nominatim like address
+ADDRESS_COLUMNS = {
+    'country_code': 'country_code',
+    'country': 'country',
+    'state': 'state',
+    'city': 'city',
+    'city_district': 'sublocation',
+}
+
+COLUMNS = ('path', 'size', 'mtime', 'readable', 'width', 'height',
+           'longitude', 'latitude', 'altitude',
+           'datetime') + tuple(LOCATION_TAGS)
+
+
+def default_catalog_path():
+    """get the default path for the catalog database"""
+    return os.path.join(utils_geocache.cache_dir(), 'catalog.sqlite')
+
+
+def extract(path):
+    """
+    extract the catalog record for the given file
+    :param path: the path to an image
+    :returns: dict with the catalog columns as keys
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    record = dict.fromkeys(COLUMNS)
+    record.update({'path': path, 'size': st.st_size,
+                   'mtime': st.st_mtime_ns, 'readable': False})
+    metadata = utils_gexiv.get_metadata(path)
+    if not metadata:
+        return record
+    record['readable'] = True
+    record['width'] = metadata.get_pixel_width()
+    record['height'] = metadata.get_pixel_height()
+    lon, lat, alt = metadata.get_gps_info()
+    # see pictool._do_gps_get()
+    if not (lon == 0 and lat == 0 and alt == 0):
+        record.update({'longitude': lon, 'latitude': lat, 'altitude': alt})
+    try:
+        dt = metadata.get_date_time()
+    except KeyError:
+        dt = None
+    if dt:
+        record['datetime'] = dt.isoformat()
+    for column, tag in LOCATION_TAGS.items():
+        if metadata.has_tag(tag):
+            record[column] = metadata.get_tag_string(tag)
+    return record
+
+
+class Catalog(object):
+    """
+    The metadata catalog
+    """
+    def __init__(self, path, commit_interval=1000):
+        """
+        :param path: the path to the sqlite database
+        :param commit_interval: commit after this many updated records, so
+                                an interrupted scan keeps its progress
+        """
+        self._path = path
+        self._commit_interval = commit_interval
+        self._uncommitted = 0
+        db_dir = os.path.dirname(self._path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self._conn = sqlite3.connect(self._path)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, '
+            'readable INTEGER, width INTEGER, height INTEGER, '
+            'longitude REAL, latitude REAL, altitude REAL, datetime TEXT, '
+            'country_code TEXT, country TEXT, '
+            'state TEXT, city TEXT, sublocation TEXT, '
+            'generation INTEGER DEFAULT 0)')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS scans (generation INTEGER)')
+        self._conn.commit()
+        self._generation = None
+
+    def _changed(self):
+        """count a change and commit every commit_interval changes"""
+        self._uncommitted += 1
+        if self._uncommitted >= self._commit_interval:
+            self._conn.commit()
+            self._uncommitted = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    def get(self, path):
+        """get the record for path or None"""
+        row = self._conn.execute('SELECT * FROM files WHERE path=?',
+                                 (path,)).fetchone()
+        return dict(row) if row else None
+
+    def is_current(self, record, st=None):
+        """
+        check if the given record is up to date with the file
+        :param record: a catalog record
+        :param st: optional os.stat_result for the file
+        """
+        if record is None:
+            return False
+        if st is None:
+            try:
+                st = os.stat(record['path'])
+            except OSError:
+                return False
+        return record['size'] == st.st_size and \
+            record['mtime'] == st.st_mtime_ns
+
+    def begin_scan(self):
+        """start a new scan. Records which are not updated or marked as seen
+        during the scan are removed by :py:meth:`end_scan`"""
+        row = self._conn.execute(
+            'SELECT max(generation) FROM scans').fetchone()
+        self._generation = (row[0] or 0) + 1
+        self._conn.execute('INSERT INTO scans VALUES (?)',
+                           (self._generation,))
+        return self._generation
+
+    def seen(self, path):
+        """mark the record for path as seen in the current scan"""
+        self._conn.execute('UPDATE files SET generation=? WHERE path=?',
+                           (self._generation, path))
+        self._changed()
+
+    def update(self, record):
+        """insert or replace the given record"""
+        self._conn.execute(
+            'INSERT OR REPLACE INTO files ({}, generation) '
+            'VALUES ({}, ?)'.format(', '.join(COLUMNS),
+                                    ', '.join('?' * len(COLUMNS))),
+            [record[c] for c in COLUMNS] + [self._generation or 0])
+        self._changed()
+
+    def update_columns(self, path, **columns):
+        """update the given columns for path and refresh size and mtime.
+        This is useful after a command modified a file"""
+        st = os.stat(path)
+        columns.update({'size': st.st_size, 'mtime': st.st_mtime_ns})
+        self._conn.execute(
+            'UPDATE files SET {} WHERE path=?'.format(
+                ', '.join('{}=?'.format(c) for c in columns)),
+            list(columns.values()) + [path])
+        self._conn.commit()
+
+    def rename(self, path, path_new):
+        """update the path of a record after a file was renamed"""
+        self._conn.execute('DELETE FROM files WHERE path=?', (path_new,))
+        self._conn.execute('UPDATE files SET path=? WHERE path=?',
+                           (path_new, path))
+        self._conn.commit()
+
+    def end_scan(self, roots, matches=None):
+        """
+        finish the current scan
+        :param roots: the scanned files and directories. Records for files
+                      below these which were not seen are removed
+        :param matches: optional function which is called with the path of
+                        a record which was not seen and the root. It returns
+                        False if the scan did not look for the file (eg.
+                        because of a filter). Such records are kept as long
+                        as the file exists
+        :returns: the number of removed records
+        """
+        removed = []
+        for root in roots:
+            root = os.path.abspath(root)
+            prefix = root.rstrip(os.sep) + os.sep
+            rows = self._conn.execute(
+                'SELECT path FROM files WHERE generation != ? AND '
+                '(path = ? OR substr(path, 1, ?) = ?)',
+                (self._generation, root, len(prefix), prefix)).fetchall()
+            for row in rows:
+                path = row['path']
+                if matches and os.path.exists(path) and \
+                   not matches(path, root):
+                    continue
+                removed.append((path,))
+        self._conn.executemany('DELETE FROM files WHERE path=?', removed)
+        self._conn.commit()
+        self._uncommitted = 0
+        self._generation = None
+        return len(removed)
+
+    def select(self, roots, has_gps=None):
+        """
+        get the records for files below the given roots
+        :param roots: list of files and/or directories
+        :param has_gps: if True (False), only return records with (without)
+                        GPS data
+        :returns: generator of records (dicts)
+        """
+        condition = ''
+        if has_gps is True:
+            condition = ' AND longitude IS NOT NULL'
+        elif has_gps is False:
+            condition = ' AND longitude IS NULL'
+        for root in roots:
+            root = os.path.abspath(root)
+            prefix = root.rstrip(os.sep) + os.sep
+            rows = self._conn.execute(
+                'SELECT * FROM files WHERE (path = ? OR '
+                'substr(path, 1, ?) = ?){} ORDER BY path'.format(condition),
+                (root, len(prefix), prefix))
+            # fetch all rows so the catalog can be modified while the
+            # records are used
+            for row in rows.fetchall():
+                yield dict(row)
+
+
+def address_columns(address):
+    """get the catalog columns for the given (nominatim like) address"""
+    return {column: address[key] for key, column in ADDRESS_COLUMNS.items()
+            if key in address}
+
+
+def record_date_time(record):
+    """get the date/time from a catalog record as datetime object"""
+    if record['datetime']:
+        return datetime.datetime.fromisoformat(record['datetime'])
+    return None
+
+
+def record_gps(record):
+    """get the GPS data from a catalog record as tuple of
+    (longitude, latitude, altitude) or None"""
+    if record['longitude'] is None:
+        return None
+    return record['longitude'], record['latitude'], record['altitude']
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Remember which files a long running command already handled, so it can be
+restarted after a crash and only does the remaining work.
+
+The checkpoint is an append-only journal with one JSON line per finished
+file. A file is only skipped if its size and modification time are still
+the recorded ones.
+"""
+
+import json
+import os
+
+
+def _truncate_partial_line(path):
+    """remove an incomplete last line (eg. after a crash while writing), so
+    appended lines start on a new line"""
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+
+
+class Checkpoint(object):
+    """
+    An append-only journal of the finished files with their size and
+    modification time.
+    """
+    def __init__(self, path):
+        """
+        :param path: the journal file. It is created if it doesn't exist and
+                     continued otherwise
+        """
+        self.path = path
+        self._done = {}
+        if os.path.exists(path):
+            _truncate_partial_line(path)
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self._done[entry['path']] = (entry['size'],
+                                                 entry['mtime'])
+        journal_dir = os.path.dirname(path)
+        if journal_dir:
+            os.makedirs(journal_dir, exist_ok=True)
+        self._journal = open(path, 'a', encoding='utf-8')
+
+    def __len__(self):
+        return len(self._done)
+
+    def __str__(self):
+        return 'Checkpoint "{}" with {} finished file(s)'.format(
+            self.path, len(self._done))
+
+    @staticmethod
+    def _key(path):
+        st = os.stat(path)
+        return os.path.abspath(path), (st.st_size, st.st_mtime_ns)
+
+    def is_done(self, path):
+        """check if path was handled and did not change since"""
+        try:
+            key, state = self._key(path)
+        except OSError:
+            return False
+        return self._done.get(key) == state
+
+    def mark_done(self, path):
+        """record that path was handled (with its current size and
+        modification time)"""
+        key, (size, mtime) = self._key(path)
+        self._done[key] = (size, mtime)
+        self._journal.write(json.dumps(
+            {'path': key, 'size': size, 'mtime': mtime}) + '\n')
+        self._journal.flush()
+
+    def filter(self, paths):
+        """
+        skip the finished paths
+        :returns: generator of the paths which still need to be handled
+        """
+        for path in paths:
+            if not self.is_done(path):
+                yield path
+
+    def close(self):
+        self._journal.close()
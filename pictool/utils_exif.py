@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+A small, read-only EXIF reader for JPEG and TIFF based (eg. most RAW)
+files.
+
+Only the segments and IFDs which are needed for the date/time and the GPS
+data are read, so this is much cheaper than a full metadata parse with
+GExiv2. Use :py:func:`get_metadata` which returns None for unsupported
+files so the caller can fall back to :py:mod:`pictool.utils_gexiv`.
+"""
+
+import datetime
+import io
+import struct
+
+
+# TIFF field types and their sizes
+_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8,
+               11: 4, 12: 8}
+_TYPE_FORMATS = {1: 'B', 3: 'H', 4: 'I', 6: 'b', 8: 'h', 9: 'i'}
+
+_TAG_EXIF_IFD = 0x8769
+_TAG_GPS_IFD = 0x8825
+_TAG_DATE_TIME_ORIGINAL = 0x9003
+_TAG_GPS_LATITUDE_REF = 1
+_TAG_GPS_LATITUDE = 2
+_TAG_GPS_LONGITUDE_REF = 3
+_TAG_GPS_LONGITUDE = 4
+_TAG_GPS_ALTITUDE_REF = 5
+_TAG_GPS_ALTITUDE = 6
+
+# IFDs with more entries are considered to be corrupt
+_MAX_IFD_ENTRIES = 1000
+
+
+class _TiffReader(object):
+    """read values from a TIFF structure in a (seekable) file object"""
+    def __init__(self, f, base):
+        """
+        :param f: a file object
+        :param base: the offset of the TIFF header in f
+        """
+        self._f = f
+        self._base = base
+        f.seek(base)
+        header = f.read(8)
+        if len(header) != 8:
+            raise ValueError('TIFF header too short')
+        if header[:2] == b'II':
+            self._order = '<'
+        elif header[:2] == b'MM':
+            self._order = '>'
+        else:
+            raise ValueError('Invalid TIFF byte order')
+        magic, self.ifd0_offset = struct.unpack(self._order + 'HI',
+                                                header[2:])
+        if magic != 42:
+            raise ValueError('Invalid TIFF magic')
+
+    def read_ifd(self, offset):
+        """
+        read the entries of the IFD at the given offset
+        :returns: dict of tag -> (type, count, raw value/offset bytes)
+        """
+        self._f.seek(self._base + offset)
+        data = self._f.read(2)
+        if len(data) != 2:
+            raise ValueError('IFD out of range')
+        count = struct.unpack(self._order + 'H', data)[0]
+        if count > _MAX_IFD_ENTRIES:
+            raise ValueError('Too many IFD entries')
+        data = self._f.read(12 * count)
+        if len(data) != 12 * count:
+            raise ValueError('IFD truncated')
+        entries = {}
+        for i in range(count):
+            tag, type_, value_count = struct.unpack(
+                self._order + 'HHI', data[i * 12:i * 12 + 8])
+            entries[tag] = (type_, value_count, data[i * 12 + 8:i * 12 + 12])
+        return entries
+
+    def value(self, entry):
+        """decode the value of an IFD entry
+        :returns: str for ASCII, a list of numbers for everything else"""
+        type_, count, raw = entry
+        if type_ not in _TYPE_SIZES:
+            raise ValueError('Unknown TIFF type {}'.format(type_))
+        size = _TYPE_SIZES[type_] * count
+        if size > 4:
+            offset = struct.unpack(self._order + 'I', raw)[0]
+            self._f.seek(self._base + offset)
+            raw = self._f.read(size)
+            if len(raw) != size:
+                raise ValueError('IFD value out of range')
+        else:
+            raw = raw[:size]
+        if type_ == 2:
+            return raw.split(b'\x00', 1)[0].decode('ascii', 'replace')
+        if type_ in (5, 10):
+            fmt = 'I' if type_ == 5 else 'i'
+            values = struct.unpack(
+                '{}{}{}'.format(self._order, 2 * count, fmt), raw)
+            return [n / d if d else 0.0
+                    for n, d in zip(values[0::2], values[1::2])]
+        if type_ in _TYPE_FORMATS:
+            return list(struct.unpack('{}{}{}'.format(
+                self._order, count, _TYPE_FORMATS[type_]), raw))
+        return list(raw)
+
+
+class ExifMetadata(object):
+    """
+    The metadata read by :py:func:`get_metadata`. The methods behave like
+    the ones from :py:class:`GExiv2.Metadata` with the same name
+    """
+    def __init__(self, date_time_original=None, gps_info=None):
+        self._date_time_original = date_time_original
+        self._gps_info = gps_info
+
+    def get_date_time(self):
+        """
+        :returns: the Exif.Photo.DateTimeOriginal as datetime or None if it
+                  is invalid
+        :raises: KeyError if the tag is not available
+        """
+        if self._date_time_original is None:
+            raise KeyError('Exif.Photo.DateTimeOriginal')
+        try:
+            return datetime.datetime.strptime(
+                self._date_time_original.strip(), '%Y:%m:%d %H:%M:%S')
+        except ValueError:
+            return None
+
+    def get_gps_info(self):
+        """:returns: tuple of (longitude, latitude, altitude). All values
+        are 0 if there is no GPS data"""
+        return self._gps_info or (0.0, 0.0, 0.0)
+
+
+def _degrees(values):
+    """convert a (degrees, minutes, seconds) list to degrees"""
+    values = list(values) + [0.0] * (3 - len(values))
+    return values[0] + values[1] / 60 + values[2] / 3600
+
+
+def _read_tiff(f, base):
+    """read the metadata from the TIFF structure at base in f"""
+    reader = _TiffReader(f, base)
+    ifd0 = reader.read_ifd(reader.ifd0_offset)
+    date_time_original = None
+    gps_info = None
+    if _TAG_EXIF_IFD in ifd0:
+        exif_ifd = reader.read_ifd(reader.value(ifd0[_TAG_EXIF_IFD])[0])
+        if _TAG_DATE_TIME_ORIGINAL in exif_ifd:
+            date_time_original = reader.value(
+                exif_ifd[_TAG_DATE_TIME_ORIGINAL])
+    if _TAG_GPS_IFD in ifd0:
+        gps_ifd = reader.read_ifd(reader.value(ifd0[_TAG_GPS_IFD])[0])
+        if _TAG_GPS_LATITUDE in gps_ifd and _TAG_GPS_LONGITUDE in gps_ifd:
+            latitude = _degrees(reader.value(gps_ifd[_TAG_GPS_LATITUDE]))
+            longitude = _degrees(reader.value(gps_ifd[_TAG_GPS_LONGITUDE]))
+            if _TAG_GPS_LATITUDE_REF in gps_ifd and reader.value(
+                    gps_ifd[_TAG_GPS_LATITUDE_REF]).upper() == 'S':
+                latitude = -latitude
+            if _TAG_GPS_LONGITUDE_REF in gps_ifd and reader.value(
+                    gps_ifd[_TAG_GPS_LONGITUDE_REF]).upper() == 'W':
+                longitude = -longitude
+            altitude = 0.0
+            if _TAG_GPS_ALTITUDE in gps_ifd:
+                altitude = reader.value(gps_ifd[_TAG_GPS_ALTITUDE])[0]
+                if _TAG_GPS_ALTITUDE_REF in gps_ifd and reader.value(
+                        gps_ifd[_TAG_GPS_ALTITUDE_REF])[0] == 1:
+                    altitude = -altitude
+            gps_info = (longitude, latitude, altitude)
+    return ExifMetadata(date_time_original, gps_info)
+
+
+def _jpeg_segments(f):
+    """
+    iterate over the segments of a JPEG file (up to the start of scan).
+    When a segment is yielded, the file position is at the start of the
+    segment data. The data doesn't need to be consumed
+    :returns: generator of (marker, data length) tuples
+    """
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) != 2 or marker[0] != 0xff:
+            raise ValueError('Invalid JPEG marker')
+        # skip fill bytes
+        while marker[1] == 0xff:
+            marker = marker[1:] + f.read(1)
+            if len(marker) != 2:
+                raise ValueError('Invalid JPEG marker')
+        if marker[1] in (0xd9, 0xda):
+            # end of image or start of scan
+            return
+        if 0xd0 <= marker[1] <= 0xd7 or marker[1] == 0x01:
+            # markers without length
+            continue
+        length = f.read(2)
+        if len(length) != 2:
+            raise ValueError('JPEG segment truncated')
+        length = struct.unpack('>H', length)[0]
+        if length < 2:
+            raise ValueError('Invalid JPEG segment length')
+        start = f.tell()
+        yield marker[1], length - 2
+        f.seek(start + length - 2)
+
+
+def _read_jpeg(f):
+    """read the metadata from the Exif APP1 segment of a JPEG file"""
+    for marker, length in _jpeg_segments(f):
+        if marker == 0xe1:
+            segment = f.read(length)
+            if segment.startswith(b'Exif\x00\x00'):
+                return _read_tiff(io.BytesIO(segment), 6)
+    # there is no Exif data
+    return ExifMetadata()
+
+
+def get_metadata(path):
+    """
+    get the metadata for path with the builtin EXIF reader
+    :param path: path to an image
+    :returns: :py:class:`ExifMetadata` or None if the file format is not
+              supported or the file can not be parsed
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(4)
+            if header[:3] == b'\xff\xd8\xff':
+                return _read_jpeg(f)
+            if header in (b'II*\x00', b'MM\x00*'):
+                return _read_tiff(f, 0)
+    except (OSError, ValueError, struct.error, IndexError):
+        pass
+    return None
+
+
+def get_image_size(path):
+    """
+    get the pixel dimensions from the header of a JPEG or PNG file
+    :param path: path to an image
+    :returns: tuple of (width, height) or None if the size is not known
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(24)
+            if header[:3] == b'\xff\xd8\xff':
+                for marker, length in _jpeg_segments(f):
+                    # start of frame markers (except DHT, JPG and DAC)
+                    if 0xc0 <= marker <= 0xcf and \
+                       marker not in (0xc4, 0xc8, 0xcc):
+                        height, width = struct.unpack('>xHH', f.read(5))
+                        return width, height
+            elif header[:8] == b'\x89PNG\r\n\x1a\n' and \
+                    header[12:16] == b'IHDR':
+                return struct.unpack('>II', header[16:24])
+    except (OSError, ValueError, struct.error):
+        pass
+    return None
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Offline reverse geocoding based on a local gazetteer (eg. the GeoNames
+cities and admin1 dumps from https://download.geonames.org/export/dump/).
+
+The places are stored as unit vectors in a k-d tree so the nearest place
+(by great-circle distance) can be found without any network access.
+The index is written as a set of .npy files which are memory-mapped when
+loading.
+"""
+
+import json
+import math
+import os
+
+import numpy
+
+import pictool.utils_geocache as utils_geocache
+
+
+# ranges with less places are not split further but searched linearly
+_LEAF_SIZE = 16
+_INDEX_VERSION = 1
+_EARTH_RADIUS_KM = 6371.0
+
+
+def default_index_path():
+    """get the default directory for the gazetteer index"""
+    return os.path.join(utils_geocache.cache_dir(), 'gazetteer')
+
+
+def _to_xyz(latitude, longitude):
+    """convert latitude/longitude (in degrees) to a unit vector"""
+    lat = numpy.radians(latitude)
+    lon = numpy.radians(longitude)
+    return numpy.stack([numpy.cos(lat) * numpy.cos(lon),
+                        numpy.cos(lat) * numpy.sin(lon),
+                        numpy.sin(lat)], axis=-1)
+
+
+def _read_admin1(admin1_path):
+    """read a GeoNames admin1CodesASCII.txt file"""
+    admin1 = {}
+    with open(admin1_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) >= 2:
+                admin1[fields[0]] = fields[1]
+    return admin1
+
+
+def _read_country_info(country_info_path):
+    """read a GeoNames countryInfo.txt file"""
+    countries = {}
+    with open(country_info_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) >= 5:
+                countries[fields[0]] = fields[4]
+    return countries
+
+
+def _build_tree(points):
+    """
+    sort the points (in place) into an implicit k-d tree
+
+    A range [lo, hi) with more than _LEAF_SIZE points has its median at
+    (lo + hi) // 2. All points left of the median are smaller or equal in the
+    split axis, all points right of it are greater or equal.
+    :returns: tuple of (permutation, axes) where axes[mid] is the split axis
+              of the range with the median mid
+    """
+    perm = numpy.arange(len(points))
+    axes = numpy.zeros(len(points), dtype=numpy.int8)
+    stack = [(0, len(points))]
+    while stack:
+        lo, hi = stack.pop()
+        if hi - lo <= _LEAF_SIZE:
+            continue
+        sub = points[perm[lo:hi]]
+        axis = int(numpy.argmax(sub.max(axis=0) - sub.min(axis=0)))
+        mid = (lo + hi) // 2
+        order = numpy.argpartition(sub[:, axis], mid - lo)
+        perm[lo:hi] = perm[lo:hi][order]
+        axes[mid] = axis
+        stack.append((lo, mid))
+        stack.append((mid + 1, hi))
+    return perm, axes
+
+
+def build_index(cities_path, admin1_path, index_path,
+                country_info_path=None):
+    """
+    build a gazetteer index
+
+    :param cities_path: path to a GeoNames cities file (eg. cities1000.txt)
+    :param admin1_path: path to a GeoNames admin1CodesASCII.txt file
+    :param index_path: the directory where the index is written to
+    :param country_info_path: optional path to a GeoNames countryInfo.txt
+                              file. Used for the country names
+    :returns: the number of places in the index
+    """
+    admin1 = _read_admin1(admin1_path)
+    countries = _read_country_info(country_info_path) \
+        if country_info_path else {}
+
+    strings = {'': 0}
+    coords = []
+    labels = []
+
+    def _string_id(string):
+        return strings.setdefault(string, len(strings))
+
+    with open(cities_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 11:
+                continue
+            country_code = fields[8]
+            coords.append((float(fields[4]), float(fields[5])))
+            labels.append((
+                _string_id(fields[1]),
+                _string_id(admin1.get(
+                    '{}.{}'.format(country_code, fields[10]), '')),
+                _string_id(country_code.lower()),
+                _string_id(countries.get(country_code, ''))))
+
+    if not coords:
+        raise Exception('No places found in "{}"'.format(cities_path))
+
+    coords = numpy.array(coords, dtype=numpy.float64)
+    points = _to_xyz(coords[:, 0], coords[:, 1])
+    perm, axes = _build_tree(points)
+
+    string_data = [s.encode('utf-8') for s in strings]
+    string_offsets = numpy.zeros(len(string_data) + 1, dtype=numpy.int64)
+    string_offsets[1:] = numpy.cumsum([len(s) for s in string_data])
+
+    if not os.path.exists(index_path):
+        os.makedirs(index_path)
+    numpy.save(os.path.join(index_path, 'points.npy'), points[perm])
+    numpy.save(os.path.join(index_path, 'axes.npy'), axes)
+    numpy.save(os.path.join(index_path, 'labels.npy'),
+               numpy.array(labels, dtype=numpy.int32)[perm])
+    numpy.save(os.path.join(index_path, 'string_offsets.npy'),
+               string_offsets)
+    with open(os.path.join(index_path, 'strings.bin'), 'wb') as f:
+        f.write(b''.join(string_data))
+    with open(os.path.join(index_path, 'meta.json'), 'w') as f:
+        json.dump({'version': _INDEX_VERSION, 'places': len(points)}, f)
+    return len(points)
+
+
+class Gazetteer(object):
+    """
+    A reverse geocoder using a gazetteer index (see :py:func:`build_index`)
+    """
+    def __init__(self, index_path=None, max_distance=None):
+        """
+        :param index_path: the directory of the index. If not given,
+                           :py:func:`default_index_path` is used
+        :param max_distance: if given, places further away (in km) are
+                             ignored
+        """
+        self._index_path = index_path or default_index_path()
+        meta_path = os.path.join(self._index_path, 'meta.json')
+        if not os.path.exists(meta_path):
+            raise Exception(
+                'Gazetteer index "{}" does not exist'.format(
+                    self._index_path))
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if meta.get('version') != _INDEX_VERSION:
+            raise Exception(
+                'Gazetteer index "{}" has an unsupported version. '
+                'Please rebuild it'.format(self._index_path))
+        self._max_distance = max_distance
+        self._points = self._load('points.npy')
+        self._axes = self._load('axes.npy')
+        self._labels = self._load('labels.npy')
+        self._string_offsets = self._load('string_offsets.npy')
+        strings_path = os.path.join(self._index_path, 'strings.bin')
+        if os.path.getsize(strings_path):
+            self._strings = numpy.memmap(strings_path, dtype=numpy.uint8,
+                                         mode='r')
+        else:
+            self._strings = numpy.zeros(0, dtype=numpy.uint8)
+
+    def _load(self, name):
+        return numpy.load(os.path.join(self._index_path, name),
+                          mmap_mode='r')
+
+    def __len__(self):
+        return len(self._points)
+
+    def _string(self, string_id):
+        start, end = self._string_offsets[string_id:string_id + 2]
+        return bytes(self._strings[start:end]).decode('utf-8')
+
+    def _nearest(self, q):
+        """
+        find the nearest point for the given unit vector
+        :returns: tuple of (index, squared chord distance)
+        """
+        best = [-1, math.inf]
+        points = self._points
+        axes = self._axes
+
+        def _search(lo, hi):
+            if hi - lo <= _LEAF_SIZE:
+                if hi > lo:
+                    d = ((points[lo:hi] - q) ** 2).sum(axis=1)
+                    i = int(numpy.argmin(d))
+                    if d[i] < best[1]:
+                        best[0], best[1] = lo + i, float(d[i])
+                return
+            mid = (lo + hi) // 2
+            p = points[mid].tolist()
+            d = (p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2 + (p[2] - q[2]) ** 2
+            if d < best[1]:
+                best[0], best[1] = mid, d
+            axis = axes[mid]
+            diff = q[axis] - p[axis]
+            if diff < 0:
+                near, far = (lo, mid), (mid + 1, hi)
+            else:
+                near, far = (mid + 1, hi), (lo, mid)
+            _search(*near)
+            if diff * diff < best[1]:
+                _search(*far)
+
+        _search(0, len(points))
+        return best[0], best[1]
+
+    def reverse(self, longitude, latitude):
+        """
+        get the nearest place for the given long/lat.
+        The result has the same structure as a nominatim reverse lookup
+        :returns: dict with 'address' and 'distance' (in km) keys
+        """
+        q = _to_xyz(latitude, longitude).tolist()
+        i, d = self._nearest(q)
+        distance = 2 * math.asin(min(1.0, math.sqrt(d) / 2)) * \
+            _EARTH_RADIUS_KM
+        if self._max_distance is not None and distance > self._max_distance:
+            return {'address': {}, 'distance': distance}
+        city, state, country_code, country = (
+            self._string(int(s)) for s in self._labels[i])
+        address = {}
+        for key, value in (('country_code', country_code),
+                           ('country', country),
+                           ('state', state),
+                           ('city', city)):
+            if value:
+                address[key] = value
+        return {'address': address, 'distance': distance}
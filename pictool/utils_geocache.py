@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+A persistent (sqlite based) cache for reverse geocoding results
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def cache_dir():
+    """get the directory where pictool stores cached data"""
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'pictool')
+
+
+def default_cache_path():
+    """get the default path for the geocoding cache database"""
+    return os.path.join(cache_dir(), 'geocode.sqlite')
+
+
+class GeocodeCache(object):
+    """
+    Cache reverse geocoding results on disk.
+
+    Entries are keyed by the quantized latitude/longitude plus the zoom level
+    and the language that was used for the request. Entries older than `ttl`
+    seconds are ignored and the least recently used entries are evicted when
+    more than `max_entries` entries are stored.
+    """
+    def __init__(self, path=None, ttl=90 * 24 * 3600, max_entries=100000,
+                 precision=4):
+        """
+        :param path: the path to the sqlite database. If not given,
+                     :py:func:`default_cache_path` is used
+        :param ttl: time to live for an entry (in seconds)
+        :param max_entries: the maximum number of entries to keep
+        :param precision: number of decimal places used to quantize the
+                          coordinates (4 is roughly 11m)
+        """
+        self._path = path or default_cache_path()
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._precision = precision
+        self.hits = 0
+        self.misses = 0
+        db_dir = os.path.dirname(self._path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self._path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS reverse ('
+            'lat TEXT, lon TEXT, zoom INTEGER, language TEXT, data TEXT, '
+            'created REAL, accessed REAL, '
+            'PRIMARY KEY (lat, lon, zoom, language))')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS reverse_accessed '
+            'ON reverse (accessed)')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS reverse_created '
+            'ON reverse (created)')
+        # the number of entries is counted once and then kept up to date,
+        # so a put doesn't need to count all entries
+        self._count = self._conn.execute(
+            'SELECT count(*) FROM reverse').fetchone()[0]
+        self._evict()
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _key(self, longitude, latitude, zoom, language):
+        return ('{:.{p}f}'.format(latitude, p=self._precision),
+                '{:.{p}f}'.format(longitude, p=self._precision),
+                zoom, language)
+
+    def get(self, longitude, latitude, zoom, language):
+        """
+        get a cached result
+        :returns: the cached (json decoded) data or None
+        """
+        key = self._key(longitude, latitude, zoom, language)
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data, created FROM reverse WHERE '
+                'lat=? AND lon=? AND zoom=? AND language=?', key).fetchone()
+            now = time.time()
+            if row is None or row[1] + self._ttl < now:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                'UPDATE reverse SET accessed=? WHERE '
+                'lat=? AND lon=? AND zoom=? AND language=?', (now,) + key)
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, longitude, latitude, zoom, language, data):
+        """store a result in the cache"""
+        key = self._key(longitude, latitude, zoom, language)
+        now = time.time()
+        with self._lock:
+            updated = self._conn.execute(
+                'UPDATE reverse SET data=?, created=?, accessed=? WHERE '
+                'lat=? AND lon=? AND zoom=? AND language=?',
+                (json.dumps(data), now, now) + key).rowcount
+            if not updated:
+                self._conn.execute(
+                    'INSERT INTO reverse '
+                    '(lat, lon, zoom, language, data, created, accessed) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    key + (json.dumps(data), now, now))
+                self._count += 1
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """remove expired and least recently used entries. Both use an
+        index, so only the removed entries are read"""
+        self._count -= self._conn.execute(
+            'DELETE FROM reverse WHERE created < ?',
+            (time.time() - self._ttl,)).rowcount
+        if self._count > self._max_entries:
+            self._count -= self._conn.execute(
+                'DELETE FROM reverse WHERE rowid IN (SELECT rowid FROM '
+                'reverse ORDER BY accessed LIMIT ?)',
+                (self._count - self._max_entries,)).rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+    def __str__(self):
+        return 'Geocoding cache: {} hit(s), {} miss(es)'.format(
+            self.hits, self.misses)
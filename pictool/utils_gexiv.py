@@ -15,12 +15,27 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-# GNOME gobject introspection
-import gi
+# GNOME gobject introspection is imported on first use (see _load()), so
+# commands which don't need GExiv2 don't pay for loading it
 
-gi.require_version('GExiv2', '0.10')
-from gi.repository import GLib # noqa
-from gi.repository import GExiv2 # noqa
+
+def _load():
+    """import GExiv2 and GLib via gobject introspection"""
+    global GExiv2, GLib
+    import gi
+    gi.require_version('GExiv2', '0.10')
+    from gi.repository import GLib # noqa
+    from gi.repository import GExiv2 # noqa
+    GExiv2.initialize()
+
+
+def __getattr__(name):
+    # module level access to GExiv2 and GLib loads them
+    if name in ('GExiv2', 'GLib'):
+        _load()
+        return globals()[name]
+    raise AttributeError(
+        'module {!r} has no attribute {!r}'.format(__name__, name))
 
 
 def get_metadata(path):
@@ -29,7 +44,8 @@ def get_metadata(path):
     :param path: path to an image that is supported by gexiv2
     :returns :py:class:`GExiv2.Metadata` or None
     """
-    GExiv2.initialize()
+    if 'GExiv2' not in globals():
+        _load()
     metadata = GExiv2.Metadata.new()
     try:
         metadata.open_path(path)
@@ -38,3 +54,34 @@ def get_metadata(path):
         return None
     else:
         return metadata
+
+
+def get_preview_data(metadata, min_size=0):
+    """
+    get the largest embedded preview image (eg. the JPEG preview of a RAW
+    file or the camera generated preview of a JPEG)
+    :param metadata: a :py:class:`GExiv2.Metadata` object
+    :param min_size: the minimum width or height [px] the preview must have
+    :returns: the encoded preview image (bytes) or None
+    """
+    previews = metadata.get_preview_properties() or []
+    if not previews:
+        return None
+    largest = max(previews,
+                  key=lambda p: p.get_width() * p.get_height())
+    if max(largest.get_width(), largest.get_height()) < min_size:
+        return None
+    return metadata.get_preview_image(largest).get_data()
+
+
+def get_orientation(metadata):
+    """
+    get the EXIF orientation of an image
+    :param metadata: a :py:class:`GExiv2.Metadata` object
+    :returns: the orientation (1-8). 1 (normal) if it is not set or invalid
+    """
+    try:
+        orientation = int(metadata.get_orientation())
+    except (TypeError, ValueError):
+        return 1
+    return orientation if 1 <= orientation <= 8 else 1
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+A client for the nominatim geocoding service.
+See https://nominatim.org/release-docs/latest/api/Overview/
+"""
+
+import threading
+import time
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+PUBLIC_URL = 'https://nominatim.openstreetmap.org'
+# requests to the public service should be max. 1 per second
+# see https://operations.osmfoundation.org/policies/nominatim/
+PUBLIC_MAX_RATE = 1.0
+# status codes which are worth a retry
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# the rate limiters, shared between all clients for the same url
+_RATE_LIMITERS = {}
+_RATE_LIMITERS_LOCK = threading.Lock()
+
+
+class TokenBucket(object):
+    """
+    A thread-safe token bucket rate limiter.
+
+    Tokens are added with `rate` tokens per second, up to `burst` tokens.
+    Each :py:meth:`acquire` call takes one token and sleeps until the token is
+    available.
+    """
+    def __init__(self, rate, burst=1):
+        """
+        :param rate: the number of tokens per second
+        :param burst: the maximum number of tokens which can be available
+        """
+        if rate <= 0:
+            raise ValueError('rate must be > 0')
+        self._rate = float(rate)
+        self._burst = max(1, burst)
+        self._tokens = float(self._burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """take a token and wait until it is available"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._burst,
+                               self._tokens + (now - self._last) * self._rate)
+            self._last = now
+            self._tokens -= 1
+            wait_for = -self._tokens / self._rate if self._tokens < 0 else 0
+        if wait_for > 0:
+            time.sleep(wait_for)
+        return wait_for
+
+
+def is_public_url(url):
+    """check if url belongs to the public nominatim service"""
+    return urllib.parse.urlsplit(url).hostname == \
+        urllib.parse.urlsplit(PUBLIC_URL).hostname
+
+
+def get_rate_limiter(base_url, rate, burst=1):
+    """get the (shared) rate limiter for the given url"""
+    with _RATE_LIMITERS_LOCK:
+        key = (base_url, rate, burst)
+        if key not in _RATE_LIMITERS:
+            _RATE_LIMITERS[key] = TokenBucket(rate, burst)
+        return _RATE_LIMITERS[key]
+
+
+class NominatimClient(object):
+    """
+    A nominatim client which keeps the HTTP connections alive, limits the
+    request rate and the number of concurrent requests and retries requests
+    which failed with a temporary error.
+    """
+    def __init__(self, base_url=PUBLIC_URL, email=None, rate=1.0, burst=1,
+                 max_concurrency=1, retries=3, backoff=1.0, timeout=30,
+                 language='en-US', zoom=10):
+        """
+        :param base_url: the base url of the nominatim service
+        :param email: an email address which is sent with each request
+        :param rate: the maximum number of requests per second
+        :param burst: the maximum number of requests which can be done
+                      at once after the client was idle
+        :param max_concurrency: the maximum number of concurrent requests
+        :param retries: how often a failed request is retried
+        :param backoff: the initial delay between retries (in seconds). The
+                        delay doubles with each retry
+        :param timeout: the request timeout (in seconds)
+        :param language: the preferred language for the results
+        :param zoom: the level of detail for reverse lookups
+        """
+        self.base_url = base_url.rstrip('/')
+        # True if the given limits were reduced for the public service
+        self.rate_limited = False
+        limiter_key = self.base_url
+        if is_public_url(self.base_url):
+            # all urls of the public service share the limit
+            limiter_key = PUBLIC_URL
+            if rate > PUBLIC_MAX_RATE or burst > 1 or max_concurrency > 1:
+                rate, burst, max_concurrency = PUBLIC_MAX_RATE, 1, 1
+                self.rate_limited = True
+        self.email = email
+        self.language = language
+        self.zoom = zoom
+        self.max_concurrency = max_concurrency
+        self._limiter = get_rate_limiter(limiter_key, rate, burst)
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._retries = retries
+        self._backoff = backoff
+        self._timeout = timeout
+        self._session = requests.Session()
+        self._session.headers['User-Agent'] = 'pictool'
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=max_concurrency)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    def _retry_delay(self, attempt, response):
+        """get the delay before the next retry"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return int(retry_after)
+        return self._backoff * 2 ** attempt
+
+    def _get(self, endpoint, params):
+        """do a GET request for the given endpoint and return the json"""
+        if self.email:
+            params['email'] = self.email
+        url = '{}/{}'.format(self.base_url, endpoint)
+        with self._semaphore:
+            for attempt in range(self._retries + 1):
+                self._limiter.acquire()
+                r = None
+                try:
+                    r = self._session.get(url, params=params,
+                                          timeout=self._timeout)
+                except (requests.ConnectionError, requests.Timeout):
+                    if attempt == self._retries:
+                        raise
+                else:
+                    if r.status_code not in RETRY_STATUS_CODES or \
+                       attempt == self._retries:
+                        break
+                time.sleep(self._retry_delay(attempt, r))
+        if r.status_code != 200:
+            r.raise_for_status()
+        return r.json()
+
+    def search(self, query, countrycodes=None):
+        """get GPS coords from a given query (usually a address)"""
+        params = {
+            'format': 'json',
+            'polygon_geojson': 1,
+            'q': query
+        }
+        if countrycodes:
+            params['countrycodes'] = ','.join(countrycodes)
+        return self._get('search', params)
+
+    def reverse(self, longitude, latitude):
+        """get location data as json for the given long/lat"""
+        params = {
+            'format': 'jsonv2',
+            'accept-language': self.language,
+            'zoom': self.zoom,
+            'lat': latitude,
+            'lon': longitude}
+        return self._get('reverse', params)
+
+    def close(self):
+        self._session.close()
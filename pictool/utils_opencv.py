@@ -16,11 +16,24 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import functools
 import os
 import math
 
 # openCV
 import cv2
+import numpy
+
+import pictool.utils_exif as utils_exif
+
+
+# the reduction factors openCV can apply while decoding (in the DCT domain
+# for JPEG images) and the corresponding imread flags
+_REDUCED_GRAYSCALE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
 
 
 def _image_resize(image, max_w_or_h=4096):
@@ -41,64 +54,244 @@ def _image_resize(image, max_w_or_h=4096):
     return image
 
 
-def _detect_faces(cascade_path, image):
+def _reduced_read_flag(image_size, max_w_or_h):
     """
-    detect faces in an image
+    get the imread flag which decodes the image with the largest reduction
+    that still keeps the image larger than max_w_or_h
+    :param image_size: tuple of (width, height) or None if unknown
+    :returns: tuple of (imread flag, reduction factor)
     """
-    cascade_classifier = cv2.CascadeClassifier(cascade_path)
-    side = math.sqrt(image.size)
-    minlen = int(side / 20)
-    maxlen = int(side / 2)
-    flags = cv2.CASCADE_DO_CANNY_PRUNING
-    faces = cascade_classifier.detectMultiScale(
-        image, 1.1, 4, flags, (minlen, minlen), (maxlen, maxlen))
-    print('Found %s face(s)' % (len(faces)))
-    return faces
-    # for i, (x, y, w, h) in enumerate(faces, 1):
-    #     cv2.rectangle(image_resize, (x, y), (x + w , y + h), (255, 0, 0), 2)
-    #     cv2.imshow('img',image_resize)
-    #     cv2.waitKey(0)
-    #     cv2.destroyAllWindows()
-
-
-def _detect_eyes(cascade_path, image):
-    """get the eye coords for the given image file"""
-    cascade_classifier = cv2.CascadeClassifier(cascade_path)
-    minlen = 50
-    flags = cv2.CASCADE_DO_CANNY_PRUNING
-    eyes = cascade_classifier.detectMultiScale(
-        image, 1.1, 4, flags, (minlen, minlen))
-    print('Found %s eye(s)' % (len(eyes)))
-    return eyes
-
-
-def normalize_face(image_input_path, image_output_dir,
-                   face_cascade_path, eye_cascade_path):
+    if image_size:
+        max_dim = max(image_size)
+        for factor, flag in _REDUCED_GRAYSCALE_FLAGS:
+            if max_dim / factor >= max_w_or_h:
+                return flag, factor
+    return cv2.IMREAD_GRAYSCALE, 1
+
+
+def decode_image_for_detection(image_path, max_w_or_h=4096):
+    """
+    read an image as grayscale image. If the image dimensions can be read
+    from the file header, the decoder already downscales the image (which
+    is much faster and needs less memory than decoding the full image and
+    resizing it afterwards), but it stays larger than max_w_or_h.
+    :param image_path: the full path to the image
+    :param max_w_or_h: The maximum width or height (in px) of the image
+    :returns: tuple of (image, the maximum width or height of the original
+              image)
+    """
+    image_size = utils_exif.get_image_size(image_path)
+    flag, factor = _reduced_read_flag(image_size, max_w_or_h)
+    image = cv2.imread(image_path, flag)
+    if image is None:
+        raise Exception("Can not read image '%s'" % (image_path))
+    if image_size:
+        original_max_dim = max(image_size)
+    else:
+        original_max_dim = max(image.shape[0], image.shape[1]) * factor
+    return image, original_max_dim
+
+
+def read_image_for_detection(image_path, max_w_or_h=4096):
+    """
+    read an image as grayscale image with a maximum width/height.
+    See :py:func:`decode_image_for_detection`
+    :param image_path: the full path to the image
+    :param max_w_or_h: The maximum width or height (in px) of the image
+    :returns: tuple of (image, scale). Coordinates in the returned image
+              multiplied by scale are coordinates in the original image
+    """
+    image, original_max_dim = decode_image_for_detection(image_path,
+                                                         max_w_or_h)
+    image_resize = _image_resize(image, max_w_or_h)
+    scale = original_max_dim / max(image_resize.shape[0],
+                                   image_resize.shape[1])
+    return image_resize, scale
+
+
+class FaceDetector(object):
+    """
+    Detect faces (and eyes in faces) with openCV cascade classifiers.
+    The cascades are loaded once when the detector is created, so a detector
+    should be reused for multiple images (see :py:func:`get_face_detector`)
+    """
+    def __init__(self, face_cascade_path, eye_cascade_path,
+                 scale_factor=1.1, min_neighbors=4, min_size=None,
+                 max_size=None, eye_min_size=50, eye_scale_factor=1.1,
+                 eye_min_neighbors=4):
+        """
+        :param face_cascade_path: A openCV face cascade classifier definition
+                                  file path
+        :param eye_cascade_path: A openCV eye cascade classifier definition
+                                 file path
+        :param scale_factor: how much the image size is reduced at each
+                             image scale
+        :param min_neighbors: how many neighbors each candidate rectangle
+                              should have to retain it
+        :param min_size: minimum face size [px]. If not given, 1/20 of the
+                         image side is used
+        :param max_size: maximum face size [px]. If not given, 1/2 of the
+                         image side is used
+        :param eye_min_size: minimum eye size [px]
+        :param eye_scale_factor: like scale_factor for the eye detection
+        :param eye_min_neighbors: like min_neighbors for the eye detection
+        """
+        self._face_cascade = self._load(face_cascade_path)
+        self._eye_cascade = self._load(eye_cascade_path)
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+        self.max_size = max_size
+        self.eye_min_size = eye_min_size
+        self.eye_scale_factor = eye_scale_factor
+        self.eye_min_neighbors = eye_min_neighbors
+
+    @staticmethod
+    def _load(cascade_path):
+        cascade_classifier = cv2.CascadeClassifier(cascade_path)
+        if cascade_classifier.empty():
+            raise Exception(
+                "Can not load openCV cascade '%s'" % (cascade_path))
+        return cascade_classifier
+
+    def _face_sizes(self, image):
+        """get the (min, max) face sizes for the given image"""
+        side = math.sqrt(image.size)
+        minlen = self.min_size or int(side / 20)
+        maxlen = self.max_size or int(side / 2)
+        return (minlen, minlen), (maxlen, maxlen)
+
+    def detect_faces(self, image):
+        """
+        detect faces in an image
+        :returns: list of (x, y, w, h) face rectangles
+        """
+        min_size, max_size = self._face_sizes(image)
+        flags = cv2.CASCADE_DO_CANNY_PRUNING
+        faces = self._face_cascade.detectMultiScale(
+            image, self.scale_factor, self.min_neighbors, flags,
+            min_size, max_size)
+        print('Found %s face(s)' % (len(faces)))
+        return faces
+
+    def detect_faces_with_scores(self, image):
+        """
+        detect faces in an image and score them. The score is the number of
+        neighbor rectangles which were merged into a face
+        :returns: tuple of (list of (x, y, w, h) face rectangles, list of
+                  scores)
+        """
+        min_size, max_size = self._face_sizes(image)
+        flags = cv2.CASCADE_DO_CANNY_PRUNING
+        faces, scores = self._face_cascade.detectMultiScale2(
+            image, self.scale_factor, self.min_neighbors, flags,
+            min_size, max_size)
+        return faces, scores
+
+    def detect_eyes(self, image):
+        """get the eye coords for the given image"""
+        minlen = self.eye_min_size
+        flags = cv2.CASCADE_DO_CANNY_PRUNING
+        eyes = self._eye_cascade.detectMultiScale(
+            image, self.eye_scale_factor, self.eye_min_neighbors, flags,
+            (minlen, minlen))
+        print('Found %s eye(s)' % (len(eyes)))
+        return eyes
+
+
+@functools.lru_cache(maxsize=None)
+def get_face_detector(face_cascade_path, eye_cascade_path, **kwargs):
+    """
+    get a :py:class:`FaceDetector`. The detector is created once per process
+    for the given arguments
+    """
+    return FaceDetector(face_cascade_path, eye_cascade_path, **kwargs)
+
+
+# EXIF orientation -> cv2.flip code which is applied after transposing
+# (orientations 5-8) the image
+_ORIENTATION_FLIPS = {2: 1, 3: -1, 4: 0, 5: None, 6: 1, 7: -1, 8: 0}
+
+
+def _apply_orientation(image, orientation):
+    """rotate/flip an image like cv2.imread does for the given EXIF
+    orientation"""
+    if orientation in (5, 6, 7, 8):
+        image = cv2.transpose(image)
+    flip = _ORIENTATION_FLIPS.get(orientation)
+    if flip is not None:
+        image = cv2.flip(image, flip)
+    return image
+
+
+def _decode_preview(preview_data, max_w_or_h=4096, orientation=1):
+    """decode an (encoded) preview image as grayscale image. The preview is
+    oriented like the image (as read by cv2.imread)"""
+    # embedded previews are usually stored unrotated and don't have their
+    # own orientation
+    image = cv2.imdecode(numpy.frombuffer(preview_data, dtype=numpy.uint8),
+                         cv2.IMREAD_GRAYSCALE | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image is None:
+        return None
+    return _image_resize(_apply_orientation(image, orientation), max_w_or_h)
+
+
+def normalize_face(image_input_path, image_output_dir, detector,
+                   max_w_or_h=4096, preview_data=None,
+                   preview_orientation=1):
     """
     Normalize the given image and write it out
     :param image_input_path: The full path to the image file
     :param image_output_dir: The directory where to write the normalized
     images to
-    :param face_cascade_path: A openCV face cascade classifier definition
-    file path
-    :param eye_cascade_path: A openCV eye cascade classifier definition
-    file path
+    :param detector: The :py:class:`FaceDetector` to use
+    :param max_w_or_h: The maximum width or height (in px) of the image
+    used for the detection
+    :param preview_data: an optional encoded preview of the image (see
+    :py:func:`pictool.utils_gexiv.get_preview_data`). If given, the faces are
+    detected in the preview and the image itself is only read if there are
+    faces
+    :param preview_orientation: the EXIF orientation of the image (see
+    :py:func:`pictool.utils_gexiv.get_orientation`). The preview is rotated
+    accordingly before the faces are mapped to the image
+    :returns: list of (x, y, w, h) face rectangles in the coordinates of the
+    original image
     """
-    image_org = cv2.imread(image_input_path, cv2.IMREAD_GRAYSCALE)
-    image_resize = _image_resize(image_org)
+    image_preview = None
+    if preview_data:
+        image_preview = _decode_preview(preview_data, max_w_or_h,
+                                        preview_orientation)
+    if image_preview is not None:
+        preview_faces = detector.detect_faces(image_preview)
+        if not len(preview_faces):
+            return []
+        image_resize, scale = read_image_for_detection(image_input_path,
+                                                       max_w_or_h)
+        # map the faces from the preview to the image
+        scale_y = image_resize.shape[0] / image_preview.shape[0]
+        scale_x = image_resize.shape[1] / image_preview.shape[1]
+        image_faces = [(int(x * scale_x), int(y * scale_y),
+                        int(w * scale_x), int(h * scale_y))
+                       for x, y, w, h in preview_faces]
+    else:
+        image_resize, scale = read_image_for_detection(image_input_path,
+                                                       max_w_or_h)
+        image_faces = detector.detect_faces(image_resize)
     image_name = os.path.basename(image_input_path)
+    faces = []
 
     # iterate over all found faces
-    for i, face in enumerate(
-            _detect_faces(face_cascade_path, image_resize), 1):
+    for i, face in enumerate(image_faces, 1):
         face_x, face_y, face_w, face_h = face
+        faces.append(tuple(int(round(v * scale)) for v in face))
         image_face = image_resize[face_y:(face_y + face_h),
                                   face_x:(face_x + face_w)]
         # iterate over all found eyes in the the current face
-        for eye in _detect_eyes(eye_cascade_path, image_face):
+        for eye in detector.detect_eyes(image_face):
             eye_x, eye_y, eye_w, eye_h = eye
             cv2.rectangle(image_face, (eye_x, eye_y),
                           (eye_x + eye_w, eye_y + eye_h), (255, 0, 0), 2)
         image_face_name = 'face%02i-%s' % (i, image_name)
         image_face_path = os.path.join(image_output_dir, image_face_name)
         cv2.imwrite(image_face_path, image_face)
+    return faces
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Rename many files at once.
+
+The new names are planned in memory (with a single listing per directory),
+ordered so no file is overwritten (cycles like A->B, B->A go over a
+temporary name) and applied with a journal which is written before the
+first rename. The journal can be used to undo the renames, also after a
+crash.
+"""
+
+import json
+import os
+import re
+
+import pictool.utils_geocache as utils_geocache
+
+
+_JOURNAL_VERSION = 1
+_TMP_PREFIX = '.pictool-rename-'
+
+
+def default_journal_path():
+    """get the default path for the rename journal"""
+    return os.path.join(utils_geocache.cache_dir(), 'rename-journal.jsonl')
+
+
+def _candidate(stem, extension, i):
+    if i == 0:
+        return '{}.{}'.format(stem, extension)
+    return '{}_{}.{}'.format(stem, i, extension)
+
+
+def plan(targets):
+    """
+    plan the renames for the given targets
+
+    A file is renamed to stem.extension in its directory or, if that name
+    is taken, to the first free stem_N.extension (N = 1, 2, ...). Files
+    which already have one of these names keep it. The files are planned in
+    path order, so the result does not depend on the order of targets.
+
+    :param targets: iterable of (path, stem, extension) tuples
+    :returns: list of (path, new path) tuples for the files which need to be
+              renamed
+    """
+    by_dir = {}
+    for path, stem, extension in targets:
+        by_dir.setdefault(os.path.dirname(path), []).append(
+            (os.path.basename(path), stem, extension))
+
+    moves = []
+    for dirname, files in sorted(by_dir.items()):
+        moving = []
+        # the names of the files which are not renamed
+        taken = set(os.listdir(dirname or '.'))
+        for name, stem, extension in sorted(files):
+            own = re.match(r'{}(_[1-9]\d*)?\.{}$'.format(
+                re.escape(stem), re.escape(extension)), name)
+            if not own:
+                moving.append((name, stem, extension))
+                taken.discard(name)
+        for name, stem, extension in moving:
+            i = 0
+            while _candidate(stem, extension, i) in taken:
+                i += 1
+            name_new = _candidate(stem, extension, i)
+            taken.add(name_new)
+            moves.append((os.path.join(dirname, name),
+                          os.path.join(dirname, name_new)))
+    return moves
+
+
+def order(moves):
+    """
+    order the moves so no file is overwritten
+    :param moves: list of (path, new path) tuples
+    :returns: list of (path, new path) steps. Files in a cycle are moved to
+              a temporary name first
+    """
+    pending = dict(moves)
+    steps = []
+    tmp_count = 0
+    while pending:
+        # the moves whose target is not the source of another move
+        ready = [src for src, dst in pending.items() if dst not in pending]
+        if not ready:
+            # all remaining moves are cycles. Break one
+            src = min(pending)
+            dst = pending.pop(src)
+            tmp = os.path.join(os.path.dirname(src), '{}{}-{}'.format(
+                _TMP_PREFIX, tmp_count, os.path.basename(src)))
+            tmp_count += 1
+            steps.append((src, tmp))
+            pending[tmp] = dst
+            continue
+        for src in sorted(ready):
+            steps.append((src, pending.pop(src)))
+    return steps
+
+
+def _write_json(f, data):
+    f.write(json.dumps(data) + '\n')
+
+
+def apply(steps, journal_path=None, on_step=None):
+    """
+    apply the rename steps (see :py:func:`order`)
+    :param steps: list of (path, new path) tuples
+    :param journal_path: if given, the steps are written to this journal
+                         before the first rename and every finished step is
+                         recorded
+    :param on_step: optional function which is called with (path, new path)
+                    after each rename
+    """
+    journal = None
+    if journal_path:
+        journal_dir = os.path.dirname(journal_path)
+        if journal_dir:
+            os.makedirs(journal_dir, exist_ok=True)
+        journal = open(journal_path, 'w', encoding='utf-8')
+        _write_json(journal, {'version': _JOURNAL_VERSION,
+                              'steps': len(steps)})
+        for src, dst in steps:
+            _write_json(journal, {'src': src, 'dst': dst})
+        journal.flush()
+        os.fsync(journal.fileno())
+    try:
+        for i, (src, dst) in enumerate(steps):
+            if os.path.lexists(dst):
+                raise Exception('Can not rename "{}": "{}" exists'.format(
+                    src, dst))
+            os.rename(src, dst)
+            if journal:
+                _write_json(journal, {'done': i})
+                journal.flush()
+            if on_step:
+                on_step(src, dst)
+    finally:
+        if journal:
+            journal.close()
+
+
+def undo(journal_path, on_step=None):
+    """
+    undo the renames recorded in a journal (see :py:func:`apply`). This also
+    works for interrupted renames: the step after the last recorded one is
+    undone if its new path exists and the old one doesn't. The journal is
+    removed afterwards
+    :param on_step: optional function which is called with (path, new path)
+                    after each rename
+    :returns: the number of undone steps
+    """
+    if not os.path.exists(journal_path):
+        raise Exception('Rename journal "{}" does not exist'.format(
+            journal_path))
+    steps = []
+    done = -1
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        header = json.loads(f.readline() or '{}')
+        if header.get('version') != _JOURNAL_VERSION:
+            raise Exception('Rename journal "{}" has an unsupported '
+                            'version'.format(journal_path))
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # the last line might be incomplete after a crash
+                break
+            if 'src' in entry:
+                steps.append((entry['src'], entry['dst']))
+            elif 'done' in entry:
+                done = max(done, entry['done'])
+    undone = 0
+    # the steps are applied in order, so only the step after the last
+    # recorded one might be done without being recorded
+    for src, dst in reversed(steps[:done + 2]):
+        if os.path.lexists(dst) and not os.path.lexists(src):
+            os.rename(dst, src)
+            undone += 1
+            if on_step:
+                on_step(dst, src)
+    os.remove(journal_path)
+    return undone
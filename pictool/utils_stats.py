@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Count and time the phases of a command (walking the directories, reading
+and writing metadata, geocoding, decoding images, face detection).
+
+The phases are measured by wrapping the functions which implement them
+(see :py:func:`instrument`), so the code itself is not changed and there is
+no overhead if the statistics are not enabled.
+"""
+
+import contextlib
+import functools
+import threading
+import time
+
+import cv2
+
+import pictool.utils_gazetteer as utils_gazetteer
+import pictool.utils_gexiv as utils_gexiv
+import pictool.utils_nominatim as utils_nominatim
+import pictool.utils_opencv as utils_opencv
+
+
+class Timer(object):
+    """
+    the counter and the timing histogram of a single phase. The histogram
+    buckets are powers of 2 microseconds
+    """
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.buckets = {}
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        bucket = int(seconds * 1000000).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, percent):
+        """
+        get the (approximated) percentile
+        :returns: the upper bound of the histogram bucket [s]
+        """
+        if not self.count:
+            return None
+        rank = self.count * percent / 100.0
+        seen = 0
+        for bucket, count in sorted(self.buckets.items()):
+            seen += count
+            if seen >= rank:
+                return min(2 ** bucket / 1000000.0, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            # upper bound [us] -> count
+            'histogram': {str(2 ** b): c
+                          for b, c in sorted(self.buckets.items())},
+        }
+
+
+class Stats(object):
+    """thread-safe collection of :py:class:`Timer` objects by phase name"""
+    def __init__(self):
+        self._timers = {}
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def add(self, name, seconds):
+        """record a single call of the phase name which took seconds"""
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                timer = self._timers[name] = Timer()
+            timer.add(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """context manager which records the time of its block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def wrap(self, func, name):
+        """get a wrapper for func which records each call as phase name"""
+        @functools.wraps(func)
+        def _wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter() - start)
+        return _wrapper
+
+    def wrap_iter(self, func, name):
+        """
+        get a wrapper for func (which returns an iterable) that records
+        each step of the iteration as phase name
+        """
+        @functools.wraps(func)
+        def _wrapper(*args, **kwargs):
+            iterator = iter(func(*args, **kwargs))
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self.add(name, time.perf_counter() - start)
+                yield item
+        return _wrapper
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'duration': time.perf_counter() - self._start,
+                'phases': {name: timer.as_dict()
+                           for name, timer in sorted(self._timers.items())},
+            }
+
+    def format(self):
+        """format the statistics as a table"""
+        data = self.as_dict()
+        lines = ['{:<24} {:>8} {:>10} {:>6} {:>10} {:>10} {:>10}'.format(
+            'phase', 'count', 'total [s]', '%', 'mean [ms]', '~p99 [ms]',
+            'max [ms]')]
+        for name, t in data['phases'].items():
+            lines.append(
+                '{:<24} {:>8} {:>10.3f} {:>6.1f} {:>10.3f} {:>10.3f} '
+                '{:>10.3f}'.format(
+                    name, t['count'], t['total'],
+                    100.0 * t['total'] / data['duration'],
+                    1000.0 * t['total'] / t['count'], 1000.0 * t['p99'],
+                    1000.0 * t['max']))
+        lines.append('{:<24} {:>8} {:>10.3f}'.format(
+            'total', '', data['duration']))
+        return '\n'.join(lines)
+
+
+def _patch(patched, obj, attr, wrapper):
+    """replace obj.attr with wrapper(obj.attr) and remember the original"""
+    original = getattr(obj, attr)
+    patched.append((obj, attr, original))
+    setattr(obj, attr, wrapper(original))
+
+
+def _instrument_gexiv2(stats, patched):
+    """wrap the GExiv2 functions which are only available once GExiv2 is
+    loaded"""
+    metadata_cls = utils_gexiv.GExiv2.Metadata
+    _patch(patched, metadata_cls, 'save_file',
+           lambda f: stats.wrap(f, 'gexiv2.save_file'))
+
+
+def instrument(stats, pictool_module):
+    """
+    wrap the functions which implement the phases of the commands
+    :param stats: the :py:class:`Stats` which collects the timings
+    :param pictool_module: the pictool module (for the file discovery)
+    :returns: a function which restores the original functions
+    """
+    patched = []
+    _patch(patched, pictool_module, '_loop_path',
+           lambda f: stats.wrap_iter(f, 'walk'))
+    _patch(patched, utils_gexiv, 'get_metadata',
+           lambda f: stats.wrap(f, 'gexiv2.get_metadata'))
+    if 'GExiv2' in vars(utils_gexiv):
+        _instrument_gexiv2(stats, patched)
+    else:
+        # GExiv2 is loaded on first use
+        def _load_wrapper(load):
+            def _load():
+                load()
+                _instrument_gexiv2(stats, patched)
+            return _load
+        _patch(patched, utils_gexiv, '_load', _load_wrapper)
+    _patch(patched, utils_nominatim.TokenBucket, 'acquire',
+           lambda f: stats.wrap(f, 'nominatim.rate_limit'))
+    _patch(patched, utils_nominatim.NominatimClient, '_get',
+           lambda f: stats.wrap(f, 'nominatim.request'))
+    _patch(patched, utils_gazetteer.Gazetteer, 'reverse',
+           lambda f: stats.wrap(f, 'gazetteer.reverse'))
+    _patch(patched, cv2, 'imread', lambda f: stats.wrap(f, 'cv2.imread'))
+    _patch(patched, cv2, 'imdecode', lambda f: stats.wrap(f, 'cv2.imdecode'))
+    for method in ('detect_faces', 'detect_faces_with_scores',
+                   'detect_eyes'):
+        _patch(patched, utils_opencv.FaceDetector, method,
+               lambda f, m=method: stats.wrap(f, 'opencv.' + m))
+
+    def _restore():
+        for obj, attr, original in reversed(patched):
+            setattr(obj, attr, original)
+        del patched[:]
+    return _restore
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Read GPS tracks (GPX or CSV) and get the position for a point in time.
+
+The track points are parsed as a stream and stored in sorted numpy arrays,
+so a position is found with a binary search (O(log n)) and interpolated
+between the two surrounding points.
+"""
+
+import array
+import csv
+import datetime
+import os
+import xml.etree.ElementTree as ET
+
+from dateutil import parser as du_parser
+import numpy
+
+
+# CSV column names (lower case) for the track point fields
+_CSV_COLUMNS = {
+    'time': ('time', 'timestamp', 'date_time', 'datetime'),
+    'latitude': ('lat', 'latitude'),
+    'longitude': ('lon', 'lng', 'long', 'longitude'),
+    'altitude': ('ele', 'alt', 'altitude', 'elevation'),
+}
+
+
+def parse_time(value):
+    """
+    parse a track point time
+    :param value: ISO 8601 string (without a timezone it is UTC) or the
+                  seconds since the epoch
+    :returns: the seconds since the epoch (float)
+    """
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    dt = du_parser.isoparse(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.timestamp()
+
+
+def _local_name(tag):
+    """get the tag name without the XML namespace"""
+    return tag.rpartition('}')[2]
+
+
+def iter_gpx(path):
+    """
+    iterate over the track points of a GPX file. The file is parsed as a
+    stream, so large files don't need much memory
+    :returns: generator of (time, latitude, longitude, altitude) tuples.
+              Points without a time are skipped. The altitude is NaN if
+              unknown
+    """
+    point = segment = None
+    for event, elem in ET.iterparse(path, events=('start', 'end')):
+        name = _local_name(elem.tag)
+        if event == 'start':
+            if name == 'trkpt':
+                point = {'lat': elem.get('lat'), 'lon': elem.get('lon')}
+            elif name == 'trkseg':
+                segment = elem
+            continue
+        if point is None:
+            continue
+        if name in ('time', 'ele'):
+            point[name] = elem.text
+        elif name == 'trkpt':
+            if point.get('time') and point['lat'] and point['lon']:
+                yield (parse_time(point['time']), float(point['lat']),
+                       float(point['lon']),
+                       float(point['ele']) if point.get('ele') else numpy.nan)
+            point = None
+            # don't keep the parsed points in the tree
+            if segment is not None:
+                segment.remove(elem)
+
+
+def iter_csv(path):
+    """
+    iterate over the track points of a CSV file with a header line. The
+    columns are found by name (eg. time, lat, lon, ele)
+    :returns: see :py:func:`iter_gpx`
+    """
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = [h.strip().lower() for h in next(reader, [])]
+        columns = {}
+        for field, names in _CSV_COLUMNS.items():
+            for name in names:
+                if name in header:
+                    columns[field] = header.index(name)
+                    break
+        missing = [f for f in ('time', 'latitude', 'longitude')
+                   if f not in columns]
+        if missing:
+            raise Exception('Track "{}" has no {} column'.format(
+                path, ', '.join(missing)))
+        alt = columns.get('altitude')
+        for row in reader:
+            if not row:
+                continue
+            yield (parse_time(row[columns['time']]),
+                   float(row[columns['latitude']]),
+                   float(row[columns['longitude']]),
+                   float(row[alt]) if alt is not None and row[alt] else
+                   numpy.nan)
+
+
+def iter_track(path):
+    """iterate over the track points of a GPX or CSV file (by extension)"""
+    if os.path.splitext(path)[1].lower() == '.csv':
+        return iter_csv(path)
+    return iter_gpx(path)
+
+
+class Track(object):
+    """the points of one or more tracks, sorted by time"""
+    def __init__(self, times, latitudes, longitudes, altitudes):
+        """
+        :param times: the times of the points [s since the epoch]
+        :param latitudes: the latitudes [°]
+        :param longitudes: the longitudes [°]
+        :param altitudes: the altitudes [m] (NaN if unknown)
+        """
+        times = numpy.asarray(times, dtype=numpy.float64)
+        order = numpy.argsort(times, kind='stable')
+        self.times = times[order]
+        self.latitudes = numpy.asarray(latitudes, numpy.float64)[order]
+        self.longitudes = numpy.asarray(longitudes, numpy.float64)[order]
+        self.altitudes = numpy.asarray(altitudes, numpy.float64)[order]
+
+    @classmethod
+    def from_files(cls, paths):
+        """read the tracks from GPX and/or CSV files"""
+        columns = [array.array('d') for _ in range(4)]
+        for path in paths:
+            for point in iter_track(path):
+                for column, value in zip(columns, point):
+                    column.append(value)
+        return cls(*columns)
+
+    def __len__(self):
+        return len(self.times)
+
+    def __str__(self):
+        if not len(self):
+            return 'Track with 0 points'
+        return 'Track with {} points from {} to {}'.format(
+            len(self),
+            datetime.datetime.fromtimestamp(self.times[0],
+                                            datetime.timezone.utc),
+            datetime.datetime.fromtimestamp(self.times[-1],
+                                            datetime.timezone.utc))
+
+    def _point(self, i):
+        altitude = self.altitudes[i]
+        return (float(self.longitudes[i]), float(self.latitudes[i]),
+                0.0 if numpy.isnan(altitude) else float(altitude))
+
+    def position(self, timestamp, max_gap=300):
+        """
+        get the position at the given time
+
+        Between two points which are at most max_gap seconds apart the
+        position is interpolated. Otherwise the nearest point is used if it
+        is at most max_gap seconds away.
+
+        :param timestamp: the time [s since the epoch]
+        :param max_gap: the maximum time [s] between two points to
+                        interpolate and between the time and the nearest
+                        point
+        :returns: tuple of (longitude, latitude, altitude) or None if there
+                  is no point near the time
+        """
+        n = len(self.times)
+        if not n:
+            return None
+        i = int(numpy.searchsorted(self.times, timestamp))
+        if i < n and self.times[i] == timestamp:
+            return self._point(i)
+        if 0 < i < n:
+            t0, t1 = self.times[i - 1], self.times[i]
+            if t1 - t0 <= max_gap:
+                f = (timestamp - t0) / (t1 - t0)
+                longitude, latitude, altitude = (
+                    v[i - 1] + f * (v[i] - v[i - 1]) for v in (
+                        self.longitudes, self.latitudes, self.altitudes))
+                return (float(longitude), float(latitude),
+                        0.0 if numpy.isnan(altitude) else float(altitude))
+        # the nearest point
+        nearest = [j for j in (i - 1, i) if 0 <= j < n]
+        j = min(nearest, key=lambda j: abs(self.times[j] - timestamp))
+        if abs(self.times[j] - timestamp) <= max_gap:
+            return self._point(j)
+        return None
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Find image files in directory trees
+"""
+
+import fnmatch
+import os
+
+
+# file extensions (lower case, without the dot) of supported image formats
+IMAGE_EXTENSIONS = frozenset([
+    'jpg', 'jpeg', 'jpe', 'png', 'tif', 'tiff', 'webp', 'heic', 'heif',
+    'avif', 'jxl', 'gif', 'bmp', 'dng', 'cr2', 'cr3', 'crw', 'nef', 'nrw',
+    'arw', 'srf', 'sr2', 'orf', 'rw2', 'raf', 'pef', 'srw', 'x3f', 'mrw',
+    'erf', 'kdc', 'dcr', '3fr', 'iiq'])
+
+# ISO base media file format brands used by image formats
+_FTYP_BRANDS = (b'heic', b'heix', b'heim', b'heis', b'hevc', b'mif1',
+                b'msf1', b'avif', b'crx ')
+
+
+def has_image_magic(path):
+    """
+    check if the file starts with the magic bytes of a known image format
+    :param path: the path to a file
+    :returns: True if the file looks like an image
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(16)
+    except OSError:
+        return False
+    if header.startswith((b'\xff\xd8\xff',  # JPEG
+                          b'\x89PNG\r\n\x1a\n',  # PNG
+                          b'II*\x00', b'MM\x00*',  # TIFF based (most RAWs)
+                          b'IIRO', b'IIRS', b'IIU\x00',  # ORF, RW2
+                          b'FUJIFILMCCD-RAW',  # RAF
+                          b'GIF87a', b'GIF89a', b'BM',
+                          b'\xff\x0a',  # JPEG XL codestream
+                          b'\x00\x00\x00\x0cJXL ')):
+        return True
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return True
+    if header[4:8] == b'ftyp' and header[8:12] in _FTYP_BRANDS:
+        return True
+    return False
+
+
+def _match(name, path, patterns):
+    return any(fnmatch.fnmatch(name, p) or fnmatch.fnmatch(path, p)
+               for p in patterns)
+
+
+def file_matches(path, extensions=IMAGE_EXTENSIONS, include=None,
+                 exclude=None, check_magic=False):
+    """
+    check if a single file passes the filters of :py:func:`walk` (eg. for
+    files reported by a file system watcher)
+    :returns: True if the file matches
+    """
+    name = os.path.basename(path)
+    if exclude and _match(name, path, exclude):
+        return False
+    if extensions is not None:
+        if os.path.splitext(name)[1][1:].lower() not in extensions:
+            return False
+    if include and not _match(name, path, include):
+        return False
+    if check_magic and not has_image_magic(path):
+        return False
+    return True
+
+
+def walk_matches(path, root, extensions=IMAGE_EXTENSIONS, include=None,
+                 exclude=None, max_depth=None, check_magic=False):
+    """
+    check if :py:func:`walk` for root would return the file path, without
+    reading the directories
+    :returns: True if the file matches
+    """
+    path = os.path.abspath(path)
+    root = os.path.abspath(root)
+    if path == root:
+        return True
+    parts = os.path.relpath(path, root).split(os.sep)
+    if parts[0] == os.pardir:
+        return False
+    if max_depth is not None and len(parts) - 1 > max_depth:
+        return False
+    if exclude:
+        directory = root
+        for part in parts[:-1]:
+            directory = os.path.join(directory, part)
+            if _match(part, directory, exclude):
+                return False
+    return file_matches(path, extensions, include, exclude, check_magic)
+
+
+def walk(paths, extensions=IMAGE_EXTENSIONS, include=None, exclude=None,
+         max_depth=None, inode_order=False, check_magic=False):
+    """
+    find files in the given paths
+
+    Files which are given directly in paths are always returned. Files in
+    directories are filtered. The directories are read with os.scandir and
+    the files are returned while walking, so processing can start before
+    the whole tree was read.
+
+    :param paths: list of files and/or directories
+    :param extensions: the file extensions (lower case, without the dot) of
+                       the files to return. None to not filter by extension
+    :param include: list of glob patterns. If given, only files which match
+                    one of the patterns (by name or full path) are returned
+    :param exclude: list of glob patterns. Files and directories which match
+                    one of the patterns (by name or full path) are skipped
+    :param max_depth: maximum directory depth to descend into. 0 only returns
+                      the files of the given directories. None is unlimited
+    :param inode_order: sort the directory entries by inode number. This
+                        reduces the seeks on spinning disks
+    :param check_magic: only return files with the magic bytes of a known
+                        image format (see :py:func:`has_image_magic`)
+    :returns: generator of file paths
+    """
+    include = include or []
+    exclude = exclude or []
+    for p in paths:
+        if os.path.isfile(p):
+            yield os.path.abspath(p)
+        elif os.path.isdir(p):
+            # stack of (directory, depth)
+            stack = [(p, 0)]
+            while stack:
+                directory, depth = stack.pop()
+                try:
+                    with os.scandir(directory) as it:
+                        entries = list(it)
+                except OSError as e:
+                    print('{}: can not read directory: {}'.format(
+                        directory, e))
+                    continue
+                if inode_order:
+                    entries.sort(key=lambda e: e.inode())
+                subdirs = []
+                for entry in entries:
+                    if exclude and _match(entry.name, entry.path, exclude):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+                    if extensions is not None:
+                        ext = os.path.splitext(entry.name)[1][1:].lower()
+                        if ext not in extensions:
+                            continue
+                    if include and not _match(entry.name, entry.path,
+                                              include):
+                        continue
+                    if check_magic and not has_image_magic(entry.path):
+                        continue
+                    yield entry.path
+                if max_depth is None or depth < max_depth:
+                    # reversed so the directories are walked in listing order
+                    stack.extend((d, depth + 1) for d in reversed(subdirs))
+        else:
+            raise Exception('"%s" is not a file or a dir' % (p))
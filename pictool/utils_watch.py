@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Watch directory trees for new files and handle them as they arrive.
+
+On Linux, inotify is used (via ctypes, no extra dependency) and a file is
+reported when it is closed after writing or moved into a watched
+directory. Elsewhere (or if inotify is not usable) the trees are polled.
+"""
+
+import collections
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import threading
+import time
+
+
+# inotify event masks (see inotify(7))
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_WATCH_MASK = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+
+# struct inotify_event without the name
+_INOTIFY_EVENT = struct.Struct('iIII')
+
+# the number of handled files which are remembered to ignore the events
+# caused by handling them (eg. writing the metadata or renaming)
+_HANDLED_MAX = 10000
+
+
+def _scan(directory):
+    """get the files below directory"""
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            yield os.path.join(dirpath, filename)
+
+
+class InotifyWatcher(object):
+    """watch directory trees (recursively) with inotify"""
+    def __init__(self, roots):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._fd = fd
+        self._roots = roots
+        # watch descriptor -> directory
+        self._dirs = {}
+        for root in roots:
+            self._add_tree(root)
+
+    def _add_tree(self, directory):
+        """
+        watch directory and its subdirectories
+        :returns: list of the files in the directories
+        """
+        files = []
+        stack = [directory]
+        while stack:
+            d = stack.pop()
+            wd = self._add_watch(self._fd, os.fsencode(d), _IN_WATCH_MASK)
+            if wd < 0:
+                # eg. ENOSPC if fs.inotify.max_user_watches is too small
+                print('{}: can not watch directory: {}'.format(
+                    d, os.strerror(ctypes.get_errno())))
+            else:
+                self._dirs[wd] = d
+            try:
+                with os.scandir(d) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    files.append(entry.path)
+        return files
+
+    def poll(self, timeout):
+        """
+        wait up to timeout seconds for changes
+        :returns: list of the paths of new (or rewritten) files
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        data = os.read(self._fd, 65536)
+        paths = []
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, length = _INOTIFY_EVENT.unpack_from(data, pos)
+            name = data[pos + _INOTIFY_EVENT.size:
+                        pos + _INOTIFY_EVENT.size + length].rstrip(b'\x00')
+            pos += _INOTIFY_EVENT.size + length
+            if mask & _IN_Q_OVERFLOW:
+                print('Too many file system events. Rescanning')
+                for root in self._roots:
+                    paths.extend(_scan(root))
+                continue
+            if mask & _IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            directory = self._dirs.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & _IN_ISDIR:
+                if mask & (_IN_CREATE | _IN_MOVED_TO):
+                    # files might be written before the directory is watched
+                    paths.extend(self._add_tree(path))
+            elif mask & (_IN_CLOSE_WRITE | _IN_MOVED_TO):
+                paths.append(path)
+        return paths
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher(object):
+    """watch directory trees by comparing the size and the modification
+    time of the files every interval seconds"""
+    def __init__(self, roots, interval=2.0):
+        self._roots = roots
+        self._interval = interval
+        self._state = self._scan()
+        self._next = time.monotonic() + interval
+
+    def _scan(self):
+        state = {}
+        for root in self._roots:
+            for path in _scan(root):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                state[path] = (st.st_size, st.st_mtime_ns)
+        return state
+
+    def poll(self, timeout):
+        """see :py:meth:`InotifyWatcher.poll`"""
+        wait = self._next - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(wait, 0))
+        self._next = time.monotonic() + self._interval
+        state = self._scan()
+        changed = [path for path, s in state.items()
+                   if self._state.get(path) != s]
+        self._state = state
+        return changed
+
+    def close(self):
+        pass
+
+
+def get_watcher(roots, polling=False, interval=2.0):
+    """
+    get a watcher for the given directories
+    :param polling: always use the :py:class:`PollingWatcher`
+    :param interval: the polling interval [s]
+    """
+    if not polling:
+        try:
+            return InotifyWatcher(roots)
+        except (OSError, AttributeError) as e:
+            # AttributeError: libc without inotify (eg. not on Linux)
+            print('Can not use inotify ({}). Polling every {}s'.format(
+                e, interval))
+    return PollingWatcher(roots, interval)
+
+
+def _file_state(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def run(watcher, handle, accept=None, debounce=2.0, queue_size=64,
+        initial=(), stop=None):
+    """
+    handle the files reported by the watcher
+
+    A file is handled once no new event was reported for it for debounce
+    seconds (eg. while it is copied in chunks). The files are handled in a
+    worker thread. If queue_size files are waiting, no new files are queued
+    until the worker caught up. Events which are caused by handling a file
+    (eg. writing its metadata) are ignored. Hidden files (eg. temporary
+    files of the handler or of a copy tool) are never handled.
+
+    :param watcher: a :py:class:`InotifyWatcher` or :py:class:`PollingWatcher`
+    :param handle: function which is called with a path. It returns the path
+                   of the file after it was handled (eg. if it was renamed)
+                   or None
+    :param accept: optional function which is called with a path and returns
+                   False for files which should not be handled
+    :param debounce: the time [s] without events before a file is handled
+    :param queue_size: the maximum number of files waiting for the worker
+    :param initial: iterable of paths which are handled first (eg. the
+                    existing files)
+    :param stop: optional :py:class:`threading.Event` to stop watching
+                 (after the queued files are handled). Otherwise this runs
+                 until it is interrupted
+    """
+    stop = stop or threading.Event()
+    work = queue.Queue(maxsize=queue_size)
+    # path -> state after handling
+    handled = collections.OrderedDict()
+
+    def _worker():
+        while True:
+            path = work.get()
+            if path is None:
+                return
+            try:
+                path_new = handle(path)
+            except Exception as e:
+                print('{}: {}: {}'.format(path, type(e).__name__, e))
+                continue
+            for p in set((path, path_new or path)):
+                handled[p] = _file_state(p)
+                handled.move_to_end(p)
+            while len(handled) > _HANDLED_MAX:
+                handled.popitem(last=False)
+
+    worker = threading.Thread(target=_worker, daemon=True)
+    worker.start()
+    # path -> time of the last event
+    pending = collections.OrderedDict((path, 0) for path in initial)
+    try:
+        while not stop.is_set():
+            now = time.monotonic()
+            timeout = debounce
+            if pending:
+                timeout = max(0.05, min(pending.values()) + debounce - now)
+            for path in watcher.poll(min(timeout, 1.0)):
+                if os.path.basename(path).startswith('.'):
+                    continue
+                if accept and not accept(path):
+                    continue
+                pending[path] = time.monotonic()
+                pending.move_to_end(path)
+            now = time.monotonic()
+            ready = [path for path, t in pending.items()
+                     if now - t >= debounce]
+            for path in ready:
+                del pending[path]
+                state = _file_state(path)
+                if state is None or handled.get(path) == state:
+                    continue
+                while not stop.is_set():
+                    try:
+                        work.put(path, timeout=1.0)
+                        break
+                    except queue.Full:
+                        continue
+    except BaseException:
+        # interrupted. Files which are not handled yet are found again by
+        # the next run (with an initial scan)
+        while True:
+            try:
+                work.get_nowait()
+            except queue.Empty:
+                break
+        raise
+    finally:
+        work.put(None)
+        worker.join()
+        watcher.close()